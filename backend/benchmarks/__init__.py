@@ -0,0 +1 @@
+"""Reproducible benchmarks for the simulation, classification and broadcast hot paths"""
@@ -0,0 +1,303 @@
+import asyncio
+import logging
+import random
+import statistics
+import time
+from datetime import datetime
+from typing import Dict, List, Any, Callable
+
+# Register every model the Patient relationships refer to before building patients
+import models.treatment  # noqa: F401
+import models.dispatch  # noqa: F401
+from database import Base, engine as db_engine, async_engine
+from models.patient import Patient
+from models.vitals import Vitals
+from services.classification_engine import ClassificationEngine, VITAL_SIGNS
+from services.ekg_detector import StreamingEkgDetector
+from services.simulation_engine import SimulationEngine
+from services.vitals_generator import VitalsGenerator, EKG_SAMPLES
+from services.vitals_maintenance import VitalsMaintenance
+from services.websocket_manager import WebSocketManager
+
+logger = logging.getLogger(__name__)
+
+# Medical conditions the simulation assigns, with the same 0-3 weighting
+CONDITIONS = (
+    "Hypertension", "Diabetes Type 2", "COPD", "Heart Disease", "Asthma", "Obesity",
+    "Kidney Disease", "Liver Disease", "Cancer", "Stroke History", "Dementia", "Arthritis",
+    "Depression", "Anxiety", "Sleep Apnea", "GERD"
+)
+# Per-patient code paths sample at most this many patients per run and
+# report a per-reading rate, so the 10k bed case stays quick
+MAX_PER_PATIENT_SAMPLES = 2000
+
+def summarize(samples: List[float], items: int) -> Dict[str, Any]:
+    """Latency percentiles in milliseconds and the throughput of `items` per run"""
+    ordered = sorted(samples)
+    median = statistics.median(ordered)
+    return {
+        "runs": len(ordered),
+        "items_per_run": items,
+        "median_ms": round(median * 1000, 4),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] * 1000, 4),
+        "min_ms": round(ordered[0] * 1000, 4),
+        "max_ms": round(ordered[-1] * 1000, 4),
+        "items_per_sec": round(items / median, 1) if median > 0 else None
+    }
+
+def measure(function: Callable[[], Any], repeat: int, warmup: int = 1) -> List[float]:
+    """Wall time of each of `repeat` calls, after `warmup` untimed calls"""
+    for _ in range(warmup):
+        function()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def make_patients(beds: int, seed: int) -> List[Patient]:
+    """In-memory patients shaped like the simulation's: four scenario beds, then random profiles"""
+    rng = random.Random(seed)
+    scenario_conditions = (
+        "Acute Myocardial Infarction; Hypertension; Diabetes Type 2",
+        "Hypertensive Crisis; Chronic Kidney Disease",
+        "COPD Exacerbation; Pneumonia",
+        "Sepsis; Urinary Tract Infection; Diabetes Type 2"
+    )
+    patients = []
+    for i in range(beds):
+        if i < len(scenario_conditions):
+            conditions = scenario_conditions[i]
+        else:
+            count = rng.choices([0, 1, 2, 3], weights=[0.3, 0.4, 0.2, 0.1])[0]
+            conditions = "; ".join(rng.sample(CONDITIONS, count)) or None
+        patients.append(Patient(
+            id=i + 1, name=f"Patient {i + 1}", age=rng.randint(45, 85), sex=rng.choice(["M", "F"]),
+            room_id=f"Room-{i + 1:02d}", medical_conditions=conditions
+        ))
+    return patients
+
+def bench_classification(patients: List[Patient], seed: int, repeat: int) -> Dict[str, Any]:
+    """Per-reading classify_vitals against the vectorized classify_batch on the same tick"""
+    engine = ClassificationEngine()
+    generator = VitalsGenerator(patients, seed=seed)
+    values, ekg = generator.generate_tick()
+    sample = values[:MAX_PER_PATIENT_SAMPLES]
+    readings = [dict(zip(VITAL_SIGNS, row)) for row in sample.tolist()]
+    for reading, waveform in zip(readings, ekg):
+        reading["ekg_data"] = waveform.tolist()
+    conditions = [patient.medical_conditions for patient in patients]
+    patient_ids = generator.patient_ids
+
+    def classify_each():
+        for reading in readings:
+            engine.classify_vitals(reading)
+
+    return {
+        "classify_vitals": summarize(measure(classify_each, repeat), len(readings)),
+        "classify_batch": summarize(measure(
+            lambda: engine.classify_batch(values, patient_ids=patient_ids, conditions=conditions), repeat
+        ), len(patients))
+    }
+
+def bench_generation(patients: List[Patient], seed: int, repeat: int, ekg_sample_rate: float,
+                     tick_interval: float) -> Dict[str, Any]:
+    """Legacy per-patient _generate_vitals, the ward-at-once generator, and the EKG paths"""
+    # An engine that is never started; _generate_vitals only needs its seeded stream
+    engine = SimulationEngine(ClassificationEngine(), WebSocketManager(), seed=seed)
+    sample = patients[:MAX_PER_PATIENT_SAMPLES]
+
+    def generate_each():
+        for patient in sample:
+            engine._generate_vitals(patient)
+
+    demo = VitalsGenerator(patients, seed=seed, tick_interval=tick_interval)
+    beats = VitalsGenerator(patients, seed=seed, ekg_sample_rate=ekg_sample_rate, tick_interval=tick_interval)
+    heart_rate = demo.generate_tick()[0][:, VITAL_SIGNS.index("heart_rate")]
+
+    # Detectors consume a fresh chunk each run, as they do tick after tick
+    demo_detector = StreamingEkgDetector(len(patients), EKG_SAMPLES / tick_interval)
+    beats_detector = StreamingEkgDetector(len(patients), ekg_sample_rate)
+    demo_chunks = [demo._generate_ekg() for _ in range(repeat + 1)]
+    beat_chunks = [beats._generate_beats(heart_rate) for _ in range(repeat + 1)]
+
+    return {
+        "generate_vitals": summarize(measure(generate_each, repeat), len(sample)),
+        "generate_tick": summarize(measure(demo.generate_tick, repeat), len(patients)),
+        "ekg_template": summarize(measure(demo._generate_ekg, repeat), len(patients)),
+        "ekg_beats": summarize(measure(lambda: beats._generate_beats(heart_rate), repeat), len(patients)),
+        "ekg_detect_template": summarize(
+            measure(lambda: demo_detector.process(demo_chunks.pop()), repeat), len(patients)
+        ),
+        "ekg_detect_beats": summarize(
+            measure(lambda: beats_detector.process(beat_chunks.pop()), repeat), len(patients)
+        )
+    }
+
+class FakeWebSocket:
+    """In-process stand-in for a client socket; slow ones wait on every send"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.received = 0
+        self.bytes_received = 0
+
+    async def send_text(self, payload: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.received += 1
+        self.bytes_received += len(payload)
+
+    async def close(self, code: int = 1000):
+        pass
+
+def ward_update(patients: List[Patient], seed: int) -> Dict[int, Dict[str, Any]]:
+    """One tick of vitals_data in the shape the simulation broadcasts"""
+    values, ekg = VitalsGenerator(patients, seed=seed).generate_tick()
+    engine = ClassificationEngine()
+    results = engine.classify_batch(values)
+    data = {}
+    for i, (patient, readings) in enumerate(zip(patients, values.tolist())):
+        vitals = dict(zip(VITAL_SIGNS, readings))
+        vitals["ekg_data"] = ekg[i]
+        status, reason, recommended_action = results.result(i)
+        data[patient.id] = {
+            "patient_id": patient.id,
+            "patient_name": patient.name,
+            "room_id": patient.room_id,
+            "vitals": vitals,
+            "status": status,
+            "reason": reason,
+            "recommended_action": recommended_action,
+            "ews_score": 0
+        }
+    return data
+
+async def bench_broadcast(patients: List[Patient], seed: int, repeat: int, clients: int,
+                          slow_fraction: float, slow_delay: float) -> Dict[str, Any]:
+    """broadcast_vitals to in-process clients, some slow.
+
+    Measures the time broadcast_vitals holds the event loop, and the time
+    until every fast client has been sent the tick, which is what a slow
+    client must not delay.
+    """
+    manager = WebSocketManager()
+    slow_count = int(round(clients * slow_fraction))
+    sockets = [FakeWebSocket(slow_delay if i < slow_count else 0.0) for i in range(clients)]
+    for socket in sockets:
+        await manager.add_connection(socket, protocol="full")
+    fast = sockets[slow_count:]
+    data = ward_update(patients, seed)
+
+    async def tick(expected: int):
+        start = time.perf_counter()
+        await manager.broadcast_vitals(data)
+        enqueued = time.perf_counter() - start
+        while any(socket.received < expected for socket in fast):
+            await asyncio.sleep(0)
+        return enqueued, time.perf_counter() - start
+
+    await tick(1)
+    broadcast_samples, delivered_samples = [], []
+    for run in range(repeat):
+        enqueued, delivered = await tick(run + 2)
+        broadcast_samples.append(enqueued)
+        delivered_samples.append(delivered)
+
+    dropped = sum(client.dropped_messages for client in manager.active_connections.values())
+    connected = manager.get_connection_count()
+    for socket in sockets:
+        await manager.remove_connection(socket)
+    await asyncio.sleep(0)
+
+    return {
+        "broadcast_vitals": summarize(broadcast_samples, len(patients)),
+        "fast_clients_delivered": {
+            **summarize(delivered_samples, len(fast)),
+            "clients": clients,
+            "slow_clients": slow_count,
+            "slow_delay_ms": slow_delay * 1000,
+            "bytes_per_message": fast[0].bytes_received // fast[0].received if fast else None,
+            "dropped_messages": dropped,
+            "disconnected_clients": clients - connected
+        }
+    }
+
+class BenchmarkSimulationEngine(SimulationEngine):
+    """SimulationEngine that keeps the exact duration of every stage and persisted row"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stage_samples: Dict[str, List[float]] = {}
+        self.tick_samples: List[float] = []
+        self.persist_samples: List[float] = []
+        self._tick_total = 0.0
+
+    def _observe_stage(self, stage: str, since: float) -> float:
+        now = super()._observe_stage(stage, since)
+        self.stage_samples.setdefault(stage, []).append(now - since)
+        # Stages are contiguous, so a tick is the sum of its stages
+        self._tick_total += now - since
+        if stage == "broadcast":
+            self.tick_samples.append(self._tick_total)
+            self._tick_total = 0.0
+        return now
+
+    def update_latest_vitals(self, vitals_rows: List[Dict[str, Any]]):
+        super().update_latest_vitals(vitals_rows)
+        if vitals_rows:
+            # Rows of one tick share its timestamp
+            self.persist_samples.append((datetime.now() - vitals_rows[0]["timestamp"]).total_seconds())
+
+async def bench_tick(beds: int, seed: int, ticks: int, clients: int) -> Dict[str, Any]:
+    """Run the real simulation loop against the configured database for `ticks` ticks"""
+    Base.metadata.create_all(bind=db_engine)
+    for index in Vitals.__table__.indexes:
+        index.create(bind=db_engine, checkfirst=True)
+    maintenance = VitalsMaintenance()
+    if maintenance.enabled:
+        await asyncio.to_thread(maintenance.ensure_partitions)
+
+    manager = WebSocketManager()
+    sockets = [FakeWebSocket() for _ in range(clients)]
+    for socket in sockets:
+        await manager.add_connection(socket, protocol="full")
+
+    simulation = BenchmarkSimulationEngine(ClassificationEngine(), manager, seed=seed)
+    simulation.patient_count = beds
+    # Patients the engine creates draw their profiles from the global random module
+    random.seed(seed)
+    await simulation.start_simulation()
+    if len(simulation.patients) < beds:
+        await simulation.stop_simulation()
+        raise RuntimeError(f"Only {len(simulation.patients)} of {beds} patients could be loaded")
+
+    warmup = 2
+    deadline = time.monotonic() + (ticks + warmup) * simulation.tick_interval * 3 + 30
+    while len(simulation.tick_samples) < ticks + warmup and time.monotonic() < deadline:
+        await asyncio.sleep(simulation.tick_interval / 4)
+    await simulation.stop_simulation()
+    for socket in sockets:
+        await manager.remove_connection(socket)
+    await async_engine.dispose()
+
+    tick_samples = simulation.tick_samples[warmup:]
+    if not tick_samples:
+        raise RuntimeError("No simulation ticks completed before the deadline")
+    result = {
+        "tick": {
+            **summarize(tick_samples, beds),
+            "tick_interval_ms": simulation.tick_interval * 1000,
+            "database": db_engine.dialect.name,
+            "clients": clients,
+            "overruns": simulation.scheduler.get_stats()["overruns"]
+        },
+        "stages": {
+            stage: summarize(samples[warmup:], beds)
+            for stage, samples in simulation.stage_samples.items() if samples[warmup:]
+        }
+    }
+    if simulation.persist_samples:
+        result["tick_to_persisted"] = summarize(simulation.persist_samples, beds)
+    return result
@@ -0,0 +1,431 @@
+"""Load-test a local backend with WebSocket dashboards and REST traffic.
+
+From the backend directory:
+
+    python -m benchmarks.load --start-server --beds 30 --clients 100 500 1000 2000 4000 --rest-rate 20
+    python -m benchmarks.load --url http://127.0.0.1:8000 --clients 200 400 --rest-mix latest=3,history=1
+
+Load rises step by step. Every step keeps its WebSocket clients connected
+for --step-seconds while REST requests are fired open-loop at --rest-rate.
+Staleness is receipt time minus the generated_at stamp that broadcast_vitals
+puts on every vitals message (or binary frame header), so it covers generation, classification,
+serialization, queueing and delivery. The knee is the last step whose
+delivery, latency and REST throughput stay close to the first step's.
+Only loopback addresses are accepted.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+from urllib.parse import urlparse
+
+import httpx
+import websockets
+
+from benchmarks.run import git_commit
+from services.vitals_frames import BINARY_SUBPROTOCOL, FRAME_HEADER
+
+logger = logging.getLogger(__name__)
+
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+REST_ENDPOINTS = {
+    "patients": "/api/patients",
+    "latest": "/api/vitals/latest",
+    "history": "/api/patients/{patient_id}/vitals/history?limit={limit}"
+}
+# generated_at follows the message type, so only the start of a frame is searched
+GENERATED_AT = re.compile(r'"generated_at":\s*([0-9.eE+-]+)')
+GENERATED_AT_SEARCH_CHARS = 128
+# A step whose load generator used more CPU than this measured the generator, not the server
+GENERATOR_CPU_LIMIT = 0.9
+
+def percentiles(samples: List[float]) -> Dict[str, Optional[float]]:
+    """p50/p95/p99/max of samples in seconds, as milliseconds"""
+    if not samples:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+    ordered = sorted(samples)
+
+    def at(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 2)
+
+    return {"p50_ms": at(0.5), "p95_ms": at(0.95), "p99_ms": at(0.99), "max_ms": round(ordered[-1] * 1000, 2)}
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """'latest=3,history=1' -> weights per REST endpoint"""
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in REST_ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"unknown endpoint {name!r}; choose from {', '.join(REST_ENDPOINTS)}")
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"weight of {name} must be a number")
+    if not any(weight > 0 for weight in mix.values()):
+        raise argparse.ArgumentTypeError("at least one endpoint needs a positive weight")
+    return mix
+
+class StepStats:
+    """Everything observed during one load step"""
+
+    def __init__(self, clients: int, rest_rate: float):
+        self.clients = clients
+        self.rest_rate = rest_rate
+        self.messages = 0
+        self.stamped_messages = 0
+        self.bytes = 0
+        self.staleness: List[float] = []
+        self.ticks = set()
+        self.disconnects = 0
+        self.rest_latency: Dict[str, List[float]] = {}
+        self.rest_errors = 0
+        self.rest_shed = 0
+        # Ticks generated inside [window_start, window_end) are tracked until
+        # they arrive, even after the step ends, so no tick is cut in half
+        self.window_start = time.time()
+        self.window_end: Optional[float] = None
+
+    def record_message(self, message, received_at: float):
+        if self.window_end is None:
+            self.messages += 1
+            self.bytes += len(message)
+        if isinstance(message, str):
+            match = GENERATED_AT.search(message, 0, GENERATED_AT_SEARCH_CHARS)
+            if not match:
+                return
+            generated_at = float(match.group(1))
+        else:
+            generated_at = FRAME_HEADER.unpack_from(message)[-1]
+        if generated_at < self.window_start or (self.window_end and generated_at >= self.window_end):
+            return
+        self.stamped_messages += 1
+        self.ticks.add(generated_at)
+        self.staleness.append(received_at - generated_at)
+
+    def summary(self, connected: int, seconds: float, cpu: float) -> Dict[str, Any]:
+        completed = sum(len(samples) for samples in self.rest_latency.values())
+        all_latency = [sample for samples in self.rest_latency.values() for sample in samples]
+        expected = connected * len(self.ticks)
+        return {
+            "clients": self.clients,
+            "connected": connected,
+            "ws": {
+                "messages_per_sec": round(self.messages / seconds, 1),
+                "mbytes_per_sec": round(self.bytes / seconds / 1e6, 3),
+                "ticks": len(self.ticks),
+                "delivery_ratio": round(self.stamped_messages / expected, 4) if expected else None,
+                "disconnects": self.disconnects,
+                "staleness": percentiles(self.staleness)
+            },
+            "rest": {
+                "target_rate": self.rest_rate,
+                "achieved_rate": round(completed / seconds, 1),
+                "errors": self.rest_errors,
+                "shed": self.rest_shed,
+                "latency": percentiles(all_latency),
+                "endpoints": {name: {"requests": len(samples), **percentiles(samples)}
+                              for name, samples in self.rest_latency.items()}
+            },
+            "generator_cpu": round(cpu, 3)
+        }
+
+class LoadHarness:
+    """Ramps WebSocket clients and REST traffic against one local backend"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.base_url = args.url.rstrip("/")
+        ws_url = "ws" + self.base_url[len("http"):] + "/ws"
+        self.ws_url = f"{ws_url}?protocol={args.protocol}" if args.protocol == "delta" else ws_url
+        self.subprotocols = [BINARY_SUBPROTOCOL] if args.protocol == "binary" else None
+        self.rng = random.Random(args.seed)
+        self.patient_ids: List[int] = []
+        self.client_tasks: List[asyncio.Task] = []
+        self.connected = 0
+        self.connect_failures = 0
+        self.stats: Optional[StepStats] = None
+
+    async def _client(self, ready: asyncio.Event):
+        try:
+            async with websockets.connect(self.ws_url, subprotocols=self.subprotocols, max_size=None,
+                                          ping_interval=None, open_timeout=self.args.connect_timeout) as ws:
+                self.connected += 1
+                ready.set()
+                try:
+                    async for message in ws:
+                        stats = self.stats
+                        if stats is not None:
+                            stats.record_message(message, time.time())
+                finally:
+                    self.connected -= 1
+                    if self.stats is not None:
+                        self.stats.disconnects += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if not ready.is_set():
+                self.connect_failures += 1
+                logger.debug(f"WebSocket connect failed: {e}")
+        finally:
+            ready.set()
+
+    async def scale_clients(self, target: int):
+        """Open clients until `target` have been started, a batch at a time"""
+        while len(self.client_tasks) < target:
+            batch = min(self.args.connect_batch, target - len(self.client_tasks))
+            events = [asyncio.Event() for _ in range(batch)]
+            self.client_tasks.extend(asyncio.create_task(self._client(event)) for event in events)
+            await asyncio.gather(*(event.wait() for event in events))
+
+    async def _request(self, client: httpx.AsyncClient, name: str, stats: StepStats):
+        path = REST_ENDPOINTS[name].format(
+            patient_id=self.rng.choice(self.patient_ids) if self.patient_ids else 1,
+            limit=self.args.history_limit
+        )
+        start = time.perf_counter()
+        try:
+            response = await client.get(path)
+            elapsed = time.perf_counter() - start
+            if response.status_code >= 400:
+                stats.rest_errors += 1
+                return
+            stats.rest_latency.setdefault(name, []).append(elapsed)
+        except httpx.HTTPError as e:
+            stats.rest_errors += 1
+            logger.debug(f"{name} request failed: {e}")
+
+    async def rest_load(self, client: httpx.AsyncClient, rate: float, seconds: float, stats: StepStats):
+        """Fire requests open-loop at `rate` per second; shed them past the concurrency cap"""
+        if rate <= 0:
+            return
+        names, weights = zip(*self.args.rest_mix.items())
+        in_flight = set()
+        start = time.perf_counter()
+        sent = 0
+        while sent / rate < seconds:
+            delay = start + sent / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            sent += 1
+            if len(in_flight) >= self.args.rest_concurrency:
+                stats.rest_shed += 1
+                continue
+            task = asyncio.create_task(self._request(client, self.rng.choices(names, weights)[0], stats))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        if in_flight:
+            await asyncio.wait(in_flight)
+
+    async def run_step(self, client: httpx.AsyncClient, clients: int, rest_rate: float) -> Dict[str, Any]:
+        await self.scale_clients(clients)
+        # Let snapshots and connection bursts drain before measuring
+        await asyncio.sleep(self.args.settle_seconds)
+        stats = self.stats = StepStats(clients, rest_rate)
+        wall, cpu = time.perf_counter(), time.process_time()
+        await asyncio.gather(asyncio.sleep(self.args.step_seconds),
+                             self.rest_load(client, rest_rate, self.args.step_seconds, stats))
+        seconds = time.perf_counter() - wall
+        cpu = (time.process_time() - cpu) / seconds
+        connected = self.connected
+        stats.window_end = time.time()
+        # Ticks from the end of the step are still on their way
+        await asyncio.sleep(self.args.settle_seconds)
+        self.stats = None
+        summary = stats.summary(connected, seconds, cpu)
+        summary["connect_failures"] = self.connect_failures
+        return summary
+
+    async def run(self) -> List[Dict[str, Any]]:
+        steps = []
+        limits = httpx.Limits(max_connections=self.args.rest_concurrency)
+        async with httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=self.args.request_timeout) as client:
+            patients = (await client.get(REST_ENDPOINTS["patients"])).json()
+            self.patient_ids = [patient["id"] for patient in patients]
+            try:
+                for clients, rest_rate in zip(self.args.clients, self.args.rest_rate):
+                    summary = await self.run_step(client, clients, rest_rate)
+                    steps.append(summary)
+                    print_step(summary)
+                    healthy, _ = judge_step(summary, steps[0], self.args)
+                    if not healthy and not self.args.full_ramp:
+                        break
+            finally:
+                for task in self.client_tasks:
+                    task.cancel()
+                await asyncio.gather(*self.client_tasks, return_exceptions=True)
+        return steps
+
+def judge_step(step: Dict[str, Any], baseline: Dict[str, Any], args: argparse.Namespace):
+    """(healthy, reasons): whether a step kept up compared with the first step"""
+    reasons = []
+
+    def degraded(value, reference):
+        if value is None or reference is None:
+            return False
+        return value > max(reference * args.knee_factor, reference + args.knee_slack_ms)
+
+    ws, rest = step["ws"], step["rest"]
+    if step["connect_failures"] or step["connected"] < step["clients"]:
+        reasons.append(f"{step['clients'] - step['connected']} clients not connected")
+    if ws["delivery_ratio"] is not None and ws["delivery_ratio"] < args.min_delivery:
+        reasons.append(f"delivery ratio {ws['delivery_ratio']:.2f}")
+    if step["clients"] and not ws["ticks"]:
+        reasons.append("no vitals received")
+    if degraded(ws["staleness"]["p95_ms"], baseline["ws"]["staleness"]["p95_ms"]):
+        reasons.append(f"staleness p95 {ws['staleness']['p95_ms']} ms")
+    if rest["target_rate"] and rest["achieved_rate"] < 0.95 * rest["target_rate"]:
+        reasons.append(f"REST {rest['achieved_rate']}/{rest['target_rate']} req/s")
+    if rest["errors"] > 0.01 * max(rest["achieved_rate"] * args.step_seconds, 1):
+        reasons.append(f"{rest['errors']} REST errors")
+    if degraded(rest["latency"]["p95_ms"], baseline["rest"]["latency"]["p95_ms"]):
+        reasons.append(f"REST p95 {rest['latency']['p95_ms']} ms")
+    if step["generator_cpu"] > GENERATOR_CPU_LIMIT:
+        reasons.append("load generator CPU-bound; the server may have more headroom")
+    return not reasons, reasons
+
+def find_knee(steps: List[Dict[str, Any]], args: argparse.Namespace) -> Dict[str, Any]:
+    """Last step before the first one that degraded relative to the first step"""
+    knee = None
+    for step in steps:
+        healthy, reasons = judge_step(step, steps[0], args)
+        if not healthy:
+            return {"sustained": knee, "degraded_at": {"clients": step["clients"], "rest_rate": step["rest"]["target_rate"],
+                                                       "reasons": reasons}}
+        knee = {"clients": step["clients"], "rest_rate": step["rest"]["target_rate"]}
+    return {"sustained": knee, "degraded_at": None}
+
+def print_step(step: Dict[str, Any]):
+    ws, rest = step["ws"], step["rest"]
+    print(f"{step['connected']:>6}/{step['clients']:<6} clients  "
+          f"staleness p50/p95/p99 {ws['staleness']['p50_ms']}/{ws['staleness']['p95_ms']}/{ws['staleness']['p99_ms']} ms  "
+          f"delivery {ws['delivery_ratio']}  {ws['messages_per_sec']} msg/s  | "
+          f"REST {rest['achieved_rate']}/{rest['target_rate']} req/s "
+          f"p50/p95/p99 {rest['latency']['p50_ms']}/{rest['latency']['p95_ms']}/{rest['latency']['p99_ms']} ms "
+          f"errors {rest['errors']}  | generator CPU {step['generator_cpu']:.0%}", flush=True)
+
+def raise_file_limit():
+    """Thousands of sockets need more descriptors than the usual soft limit"""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if hard == resource.RLIM_INFINITY or soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard if hard != resource.RLIM_INFINITY else 65536, hard))
+    except (ImportError, ValueError, OSError) as e:
+        logger.warning(f"Could not raise the open file limit: {e}")
+
+def start_server(args: argparse.Namespace) -> subprocess.Popen:
+    """Run the FastAPI app under uvicorn on loopback, with its own process and event loop"""
+    env = dict(os.environ)
+    if args.database_url:
+        env["DATABASE_URL"] = args.database_url
+    elif not env.get("DATABASE_URL"):
+        env["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='kpum-load-'), 'load.db')}"
+    env["SIMULATION_PATIENTS"] = str(args.beds)
+    env["SIMULATION_INTERVAL"] = str(args.tick_interval)
+    port = urlparse(args.url).port or 8000
+    # The app logs every connection; keep that out of the report
+    log_file = tempfile.NamedTemporaryFile(prefix="kpum-load-server-", suffix=".log", delete=False)
+    print(f"Server log: {log_file.name}")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", urlparse(args.url).hostname,
+         "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT
+    )
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with status {server.returncode}")
+        try:
+            if httpx.get(f"{args.url}/health", timeout=1).status_code == 200:
+                return server
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError("Server did not become healthy within 120 seconds")
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Ramp WebSocket and REST load against a local backend")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Backend base URL; loopback only")
+    parser.add_argument("--start-server", action="store_true", help="Start the app under uvicorn for the run")
+    parser.add_argument("--beds", type=int, default=30, help="SIMULATION_PATIENTS for --start-server")
+    parser.add_argument("--tick-interval", type=float, default=1.0, help="SIMULATION_INTERVAL for --start-server")
+    parser.add_argument("--database-url", help="DATABASE_URL for --start-server (default: a new SQLite file)")
+    parser.add_argument("--clients", type=int, nargs="+", default=[100, 250, 500, 1000, 2000, 4000],
+                        help="WebSocket clients at each step")
+    parser.add_argument("--rest-rate", type=float, nargs="+", default=[10.0],
+                        help="REST requests per second, one value for all steps or one per step")
+    parser.add_argument("--rest-mix", type=parse_mix, default=parse_mix("patients=1,latest=4,history=2"),
+                        help="Weighted endpoint mix, e.g. patients=1,latest=4,history=2")
+    parser.add_argument("--rest-concurrency", type=int, default=64, help="Requests in flight before new ones are shed")
+    parser.add_argument("--history-limit", type=int, default=100, help="limit for history requests")
+    parser.add_argument("--protocol", choices=("full", "delta", "binary"), default="full",
+                        help="WebSocket vitals protocol; binary is negotiated as a sub-protocol")
+    parser.add_argument("--step-seconds", type=float, default=15.0, help="Measured seconds per step")
+    parser.add_argument("--settle-seconds", type=float, default=3.0,
+                        help="Unmeasured seconds after connecting, and for late ticks after each step")
+    parser.add_argument("--connect-batch", type=int, default=100, help="Clients connected concurrently")
+    parser.add_argument("--connect-timeout", type=float, default=30.0)
+    parser.add_argument("--request-timeout", type=float, default=30.0)
+    parser.add_argument("--knee-factor", type=float, default=2.0,
+                        help="A p95 this many times the first step's counts as degraded")
+    parser.add_argument("--knee-slack-ms", type=float, default=50.0,
+                        help="...and at least this many milliseconds above it")
+    parser.add_argument("--min-delivery", type=float, default=0.95, help="Lowest healthy delivery ratio")
+    parser.add_argument("--full-ramp", action="store_true", help="Keep ramping after the first degraded step")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write steps and the knee to this JSON file")
+    args = parser.parse_args(argv)
+
+    if urlparse(args.url).hostname not in LOCAL_HOSTS:
+        parser.error("--url must point at localhost; this tool only loads a local instance")
+    if len(args.rest_rate) == 1:
+        args.rest_rate = args.rest_rate * len(args.clients)
+    elif len(args.rest_rate) != len(args.clients):
+        parser.error("--rest-rate needs one value, or one per --clients step")
+    return args
+
+def main(argv: List[str] = None) -> int:
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    logging.basicConfig(level=logging.WARNING)
+    raise_file_limit()
+
+    server = start_server(args) if args.start_server else None
+    started_at = datetime.now().isoformat()
+    try:
+        steps = asyncio.run(LoadHarness(args).run())
+    finally:
+        if server:
+            server.terminate()
+            server.wait(30)
+
+    knee = find_knee(steps, args)
+    if knee["sustained"]:
+        print(f"\nSustained {knee['sustained']['clients']} clients at {knee['sustained']['rest_rate']} req/s")
+    if knee["degraded_at"]:
+        print(f"Degraded at {knee['degraded_at']['clients']} clients: {'; '.join(knee['degraded_at']['reasons'])}")
+    elif steps:
+        print("No degradation within the ramp; extend --clients or --rest-rate to find the knee")
+
+    if args.output:
+        arguments = {key: value for key, value in vars(args).items() if key not in ("output", "database_url")}
+        with open(args.output, "w") as f:
+            json.dump({"meta": {"started_at": started_at, "commit": git_commit(), "arguments": arguments},
+                       "steps": steps, "knee": knee}, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
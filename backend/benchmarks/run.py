@@ -0,0 +1,149 @@
+"""Run the hot-path benchmarks and store the results as JSON.
+
+From the backend directory:
+
+    python -m benchmarks.run --beds 30 1000 10000 --output results.json
+    python -m benchmarks.run --output after.json --compare results.json
+
+Without --database-url (or DATABASE_URL) the tick benchmark uses a fresh
+SQLite file, so runs start from the same empty database.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from typing import Dict, Any, List
+
+GROUPS = ("classification", "generation", "broadcast", "tick")
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the backend hot paths")
+    parser.add_argument("--beds", type=int, nargs="+", default=[30, 1000, 10000], help="Bed counts to run at")
+    parser.add_argument("--only", nargs="+", choices=GROUPS, default=list(GROUPS), help="Benchmark groups to run")
+    parser.add_argument("--repeat", type=int, default=10, help="Timed runs per micro-benchmark")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for patients and generated vitals")
+    parser.add_argument("--ekg-sample-rate", type=float, default=250.0, help="Sample rate of the beat-train EKG")
+    parser.add_argument("--clients", type=int, default=100, help="Fake WebSocket clients for the broadcast benchmark")
+    parser.add_argument("--slow-fraction", type=float, default=0.1, help="Fraction of clients that are slow")
+    parser.add_argument("--slow-delay", type=float, default=0.05, help="Seconds a slow client takes per send")
+    parser.add_argument("--ticks", type=int, default=10, help="Simulation ticks for the tick benchmark")
+    parser.add_argument("--tick-interval", type=float, default=1.0, help="Seconds between simulation ticks")
+    parser.add_argument("--tick-clients", type=int, default=10, help="Fake WebSocket clients during the tick benchmark")
+    parser.add_argument("--database-url", help="Database for the tick benchmark (default: DATABASE_URL or a new SQLite file)")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--max-regression", type=float,
+                        help="With --compare, exit 1 if any median is more than this percent slower")
+    return parser.parse_args(argv)
+
+def configure_environment(args: argparse.Namespace):
+    """Settings the services read at import time must be in place before importing them"""
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    elif not os.getenv("DATABASE_URL"):
+        path = os.path.join(tempfile.mkdtemp(prefix="kpum-bench-"), "bench.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ["SIMULATION_INTERVAL"] = str(args.tick_interval)
+    os.environ["EKG_SAMPLE_RATE"] = "0"
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+def environment_info(args: argparse.Namespace) -> Dict[str, Any]:
+    import numpy as np
+    from database import engine
+
+    return {
+        "started_at": datetime.now().isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "database": engine.dialect.name,
+        "arguments": {key: value for key, value in vars(args).items()
+                      if key not in ("output", "compare", "database_url")}
+    }
+
+async def run_benchmarks(args: argparse.Namespace) -> Dict[str, Any]:
+    from benchmarks import hot_paths
+
+    results: Dict[str, Any] = {}
+    for beds in args.beds:
+        print(f"== {beds} beds", flush=True)
+        patients = hot_paths.make_patients(beds, args.seed)
+        scale: Dict[str, Any] = {}
+        if "classification" in args.only:
+            scale["classification"] = hot_paths.bench_classification(patients, args.seed, args.repeat)
+        if "generation" in args.only:
+            scale["generation"] = hot_paths.bench_generation(
+                patients, args.seed, args.repeat, args.ekg_sample_rate, args.tick_interval
+            )
+        if "broadcast" in args.only:
+            scale["broadcast"] = await hot_paths.bench_broadcast(
+                patients, args.seed, args.repeat, args.clients, args.slow_fraction, args.slow_delay
+            )
+        if "tick" in args.only:
+            scale["tick"] = await hot_paths.bench_tick(beds, args.seed, args.ticks, args.tick_clients)
+        for group, benchmarks in scale.items():
+            for name, summary in flatten(benchmarks):
+                print(f"  {group}/{name}: median {summary['median_ms']:.3f} ms, "
+                      f"p95 {summary['p95_ms']:.3f} ms, {summary['items_per_sec']} items/s", flush=True)
+        results[str(beds)] = scale
+    return results
+
+def flatten(benchmarks: Dict[str, Any], prefix: str = ""):
+    """(name, summary) pairs, descending into nested groups such as tick stages"""
+    for name, value in benchmarks.items():
+        if isinstance(value, dict) and "median_ms" in value:
+            yield prefix + name, value
+        elif isinstance(value, dict):
+            yield from flatten(value, f"{prefix}{name}/")
+
+def compare(previous: Dict[str, Any], current: Dict[str, Any]) -> float:
+    """Print the change in median time of every benchmark both runs have; return the worst"""
+    print(f"\nCompared with {previous['meta'].get('commit')} ({previous['meta'].get('started_at')}):")
+    worst = 0.0
+    for beds, scale in current["results"].items():
+        for group, benchmarks in scale.items():
+            before = dict(flatten(previous["results"].get(beds, {}).get(group, {})))
+            for name, summary in flatten(benchmarks):
+                if name not in before or not before[name]["median_ms"]:
+                    continue
+                change = 100.0 * (summary["median_ms"] / before[name]["median_ms"] - 1)
+                worst = max(worst, change)
+                print(f"  {beds:>6} beds {group}/{name}: {before[name]['median_ms']:.3f} -> "
+                      f"{summary['median_ms']:.3f} ms ({change:+.1f}%)")
+    return worst
+
+def main(argv: List[str] = None) -> int:
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    configure_environment(args)
+    logging.basicConfig(level=logging.WARNING)
+
+    report = {"meta": environment_info(args), "results": asyncio.run(run_benchmarks(args))}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            worst = compare(json.load(f), report)
+        if args.max_regression is not None and worst > args.max_regression:
+            print(f"Slowest regression {worst:.1f}% exceeds {args.max_regression:.1f}%")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,15 @@
 from sqlalchemy import create_engine, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
 from dotenv import load_dotenv
 import logging
 
+from services.pool_metrics import PoolMetrics, InstrumentedQueuePool, InstrumentedAsyncAdaptedQueuePool
+from services.metrics import REGISTRY
+
 load_dotenv()
 
 # Configure logging
@@ -21,16 +26,66 @@ for key, value in os.environ.items():
 
 logger.info(f"Using DATABASE_URL: {DATABASE_URL}")
 
+# Connection pool settings, shared by the sync and async engines (each has its own pool)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "300"))
+# Pre-ping costs a round-trip per checkout; with it off, recycling plus
+# SQLAlchemy's invalidate-on-disconnect handle stale connections instead
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+def _pool_options(url: str, pool_class) -> dict:
+    """Engine keyword arguments for the configured connection pool"""
+    if url.startswith("sqlite") and ":memory:" in url:
+        # In-memory SQLite keeps SQLAlchemy's single-connection pool
+        return {}
+    return {
+        "poolclass": pool_class,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING
+    }
+
 # Create engine with connection retry logic
 engine = create_engine(
     DATABASE_URL,
-    pool_pre_ping=True,  # Verify connections before use
-    pool_recycle=300,    # Recycle connections every 5 minutes
-    echo=False           # Set to True for SQL debugging
+    echo=False,          # Set to True for SQL debugging
+    **_pool_options(DATABASE_URL, InstrumentedQueuePool)
 )
+pool_metrics = PoolMetrics("sync")
+pool_metrics.attach(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def _to_async_url(url: str) -> str:
+    """Swap the sync driver in a database URL for its asyncio counterpart"""
+    for prefix, async_prefix in (
+        ("postgresql+psycopg2://", "postgresql+asyncpg://"),
+        ("postgresql://", "postgresql+asyncpg://"),
+        ("postgres://", "postgresql+asyncpg://"),
+        ("sqlite://", "sqlite+aiosqlite://"),
+    ):
+        if url.startswith(prefix):
+            return async_prefix + url[len(prefix):]
+    return url
+
+# Async engine used by the API endpoints and the vitals writer; the sync
+# engine above stays available for startup tasks and scripts
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", _to_async_url(DATABASE_URL))
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    echo=False,
+    **_pool_options(ASYNC_DATABASE_URL, InstrumentedAsyncAdaptedQueuePool)
+)
+async_pool_metrics = PoolMetrics("async")
+async_pool_metrics.attach(async_engine.sync_engine)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 def get_db():
@@ -40,6 +95,45 @@ def get_db():
     finally:
         db.close()
 
+DB_ERRORS = REGISTRY.counter("kpum_db_errors", "Database operations that failed", ["component"])
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except SQLAlchemyError:
+            DB_ERRORS.labels("api").inc()
+            raise
+
+def get_pool_stats():
+    """Get telemetry for both connection pools"""
+    return {
+        "sync": pool_metrics.get_stats(),
+        "async": async_pool_metrics.get_stats()
+    }
+
+def _pool_metric_families():
+    """Expose the pool counters and gauges from get_pool_stats in the /metrics format
+
+    Wait and connect times are REGISTRY histograms of their own (services/pool_metrics.py).
+    """
+    counters = ("checkouts", "connects", "closes", "invalidations", "timeouts", "overflow_checkouts")
+    gauges = ("checked_out", "checked_in", "overflow", "peak_checked_out")
+    stats = get_pool_stats()
+    families = [
+        (f"kpum_db_pool_{name}", "counter", f"Connection pool {name.replace('_', ' ')}",
+         [("_total", {"pool": pool}, pool_stats[name]) for pool, pool_stats in stats.items()])
+        for name in counters
+    ]
+    families += [
+        (f"kpum_db_pool_{name}", "gauge", f"Connection pool {name.replace('_', ' ')}",
+         [("", {"pool": pool}, pool_stats[name]) for pool, pool_stats in stats.items() if name in pool_stats])
+        for name in gauges
+    ]
+    return families
+
+REGISTRY.register_collector(_pool_metric_families)
+
 def test_connection():
     """Test database connection"""
     try:
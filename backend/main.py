@@ -1,24 +1,40 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
 import asyncio
 import json
 import logging
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Union
 from datetime import datetime, timedelta
+import os
 import random
 import time
 
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 from models.database import engine, Base
 from models.patient import Patient, PatientCreate, PatientResponse
 from models.vitals import Vitals, VitalsCreate, VitalsResponse
+from models.vitals_rollup import VitalsRollupMinute, VitalsRollupHour, VitalsRollupResponse
 from models.treatment import Treatment, TreatmentCreate, TreatmentResponse
 from models.dispatch import Dispatch, DispatchCreate, DispatchResponse
 from services.simulation_engine import SimulationEngine
 from services.classification_engine import ClassificationEngine
 from services.websocket_manager import WebSocketManager
-from database import get_db, SessionLocal, test_connection
+from services.vitals_maintenance import VitalsMaintenance
+from services.simulation_workers import ShardedSimulationEngine
+from services.vitals_export import (
+    EXPORT_BATCH_ROWS, EXPORT_MEDIA_TYPES, MAX_EXPORT_BATCH_ROWS, build_export_query, resolve_format, stream_export
+)
+from services.vitals_ingest import VitalsIngest, IngestError, IngestTooLarge
+from services.vitals_history import MAX_HISTORY_LIMIT, build_history_query, parse_fields, stream_vitals_history
+from services.metrics import REGISTRY, TEXT_CONTENT_TYPE
+from services.serialization import FastJSONResponse, response_columns, rows_to_dicts
+from services.vitals_frames import BINARY_SUBPROTOCOL
+from database import async_engine, get_async_db, get_pool_stats, test_connection
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -28,11 +44,26 @@ logger = logging.getLogger(__name__)
 simulation_engine: Optional[SimulationEngine] = None
 classification_engine: Optional[ClassificationEngine] = None
 websocket_manager: Optional[WebSocketManager] = None
+vitals_maintenance: Optional[VitalsMaintenance] = None
+vitals_ingest: Optional[VitalsIngest] = None
+
+# History resolutions served from rollup tables instead of raw vitals
+ROLLUP_MODELS = {
+    "1m": VitalsRollupMinute,
+    "1h": VitalsRollupHour
+}
+
+# List endpoints select these columns and encode the row tuples directly;
+# the response models only document the shape
+PATIENT_FIELDS, PATIENT_COLUMNS = response_columns(Patient, PatientResponse)
+VITALS_FIELDS, VITALS_COLUMNS = response_columns(Vitals, VitalsResponse)
+TREATMENT_FIELDS, TREATMENT_COLUMNS = response_columns(Treatment, TreatmentResponse)
+DISPATCH_FIELDS, DISPATCH_COLUMNS = response_columns(Dispatch, DispatchResponse)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    global simulation_engine, classification_engine, websocket_manager
+    global simulation_engine, classification_engine, websocket_manager, vitals_maintenance, vitals_ingest
     
     # Wait for database to be ready
     logger.info("Waiting for database connection...")
@@ -53,35 +84,75 @@ async def lifespan(app: FastAPI):
     # Create database tables
     try:
         Base.metadata.create_all(bind=engine)
+        # create_all skips indexes on tables that already exist
+        for index in Vitals.__table__.indexes:
+            index.create(bind=engine, checkfirst=True)
         logger.info("Database tables created successfully")
     except Exception as e:
         logger.error(f"Failed to create database tables: {e}")
         raise
     
+    # Partitions must exist before the simulation writes its first row
+    vitals_maintenance = VitalsMaintenance()
+    await vitals_maintenance.start()
+    
     # Initialize services
     classification_engine = ClassificationEngine()
+    await classification_engine.start_rule_watcher()
     websocket_manager = WebSocketManager()
-    simulation_engine = SimulationEngine(
-        classification_engine=classification_engine,
-        websocket_manager=websocket_manager
-    )
+    # SIMULATION_WORKERS > 0 moves generation, classification and persistence
+    # into that many worker processes, each owning a slice of the patients
+    simulation_workers = int(os.getenv("SIMULATION_WORKERS", "0"))
+    if simulation_workers > 0:
+        simulation_engine = ShardedSimulationEngine(
+            classification_engine=classification_engine,
+            websocket_manager=websocket_manager,
+            worker_count=simulation_workers
+        )
+    else:
+        simulation_engine = SimulationEngine(
+            classification_engine=classification_engine,
+            websocket_manager=websocket_manager
+        )
     
     # Start simulation in background
     asyncio.create_task(simulation_engine.start_simulation())
     
+    def on_ingest_flush(vitals_rows):
+        simulation_engine.update_latest_vitals(vitals_rows)
+        # Backfilled readings can land in buckets that were already rolled up
+        vitals_maintenance.mark_dirty(vitals_rows)
+    
+    # Readings pushed by bedside gateways share classification and fan-out
+    vitals_ingest = VitalsIngest(
+        classification_engine=classification_engine,
+        websocket_manager=websocket_manager,
+        on_flush=on_ingest_flush
+    )
+    await vitals_ingest.start()
+    
     logger.info("KPUM Demo system started successfully")
     yield
     
     # Shutdown
     if simulation_engine:
         await simulation_engine.stop_simulation()
+    if vitals_ingest:
+        await vitals_ingest.stop()
+    if vitals_maintenance:
+        await vitals_maintenance.stop()
+    if classification_engine:
+        await classification_engine.stop_rule_watcher()
+    # Close pooled async connections while the event loop is still running
+    await async_engine.dispose()
     logger.info("KPUM Demo system shutdown complete")
 
 app = FastAPI(
     title="KPUM Demo API",
     description="Real-time hospital monitoring system API",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 # CORS middleware - updated to include the actual Render URL
@@ -101,99 +172,229 @@ app.add_middleware(
 
 # WebSocket endpoint for real-time data
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
-    await websocket_manager.add_connection(websocket)
+async def websocket_endpoint(websocket: WebSocket, slow_consumer: Optional[str] = None,
+                             protocol: Optional[str] = None):
+    # Clients that offer the binary sub-protocol get binary vitals frames
+    subprotocol = BINARY_SUBPROTOCOL if BINARY_SUBPROTOCOL in websocket.scope.get("subprotocols", []) else None
+    await websocket.accept(subprotocol=subprotocol)
+    if subprotocol:
+        protocol = "binary"
+    await websocket_manager.add_connection(websocket, slow_consumer_policy=slow_consumer, protocol=protocol)
     try:
         while True:
-            # Keep connection alive
-            await websocket.receive_text()
+            # Control messages (protocol switch, resync) also keep the connection alive
+            text = await websocket.receive_text()
+            await websocket_manager.handle_client_message(websocket, text)
     except WebSocketDisconnect:
         await websocket_manager.remove_connection(websocket)
+    except Exception:
+        # Never leave a failed socket registered with its writer task running
+        logger.exception("WebSocket handler failed")
+        await websocket_manager.remove_connection(websocket, reason="error")
+        try:
+            await websocket.close(code=1011)
+        except Exception:
+            pass
 
 # Patient endpoints
 @app.get("/api/patients", response_model=List[PatientResponse])
-async def get_patients(db: SessionLocal = Depends(get_db)):
+async def get_patients(db: AsyncSession = Depends(get_async_db)):
     """Get all patients"""
-    patients = db.query(Patient).all()
-    return [PatientResponse.from_orm(patient) for patient in patients]
+    rows = (await db.execute(select(*PATIENT_COLUMNS))).all()
+    return FastJSONResponse(rows_to_dicts(PATIENT_FIELDS, rows))
 
 @app.get("/api/patients/{patient_id}", response_model=PatientResponse)
-async def get_patient(patient_id: int, db: SessionLocal = Depends(get_db)):
+async def get_patient(patient_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get a specific patient"""
-    patient = db.query(Patient).filter(Patient.id == patient_id).first()
+    patient = await db.get(Patient, patient_id)
     if not patient:
         raise HTTPException(status_code=404, detail="Patient not found")
     return PatientResponse.from_orm(patient)
 
 @app.post("/api/patients", response_model=PatientResponse)
-async def create_patient(patient: PatientCreate, db: SessionLocal = Depends(get_db)):
+async def create_patient(patient: PatientCreate, db: AsyncSession = Depends(get_async_db)):
     """Create a new patient"""
     db_patient = Patient(**patient.dict())
     db.add(db_patient)
-    db.commit()
-    db.refresh(db_patient)
+    await db.commit()
+    await db.refresh(db_patient)
     return PatientResponse.from_orm(db_patient)
 
 # Vitals endpoints
-@app.get("/api/patients/{patient_id}/vitals", response_model=List[VitalsResponse])
+@app.get("/api/patients/{patient_id}/vitals", response_model=Union[List[VitalsResponse], List[VitalsRollupResponse]])
 async def get_patient_vitals(
     patient_id: int, 
     limit: int = 100,
-    db: SessionLocal = Depends(get_db)
+    resolution: str = "raw",
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get vitals history for a patient
+    
+    resolution is "raw" for individual readings, or "1m" / "1h" for
+    min/max/mean rollups, which cover far longer ranges per row.
+    """
+    if resolution in ROLLUP_MODELS:
+        rollup = ROLLUP_MODELS[resolution]
+        fields, columns = response_columns(rollup, VitalsRollupResponse)
+        rows = (await db.execute(
+            select(*columns).where(
+                rollup.patient_id == patient_id
+            ).order_by(rollup.bucket.desc()).limit(limit)
+        )).all()
+        return FastJSONResponse(rows_to_dicts(fields, rows))
+    if resolution != "raw":
+        raise HTTPException(status_code=400, detail="resolution must be one of: raw, 1m, 1h")
+    
+    rows = (await db.execute(
+        select(*VITALS_COLUMNS).where(
+            Vitals.patient_id == patient_id
+        ).order_by(Vitals.timestamp.desc()).limit(limit)
+    )).all()
+    return FastJSONResponse(rows_to_dicts(VITALS_FIELDS, rows))
+
+@app.get("/api/patients/{patient_id}/trend")
+async def get_patient_trend(patient_id: int):
+    """Rolling mean and slope per minute of each vital over the trend window"""
+    trend = simulation_engine.get_patient_trend(patient_id) if simulation_engine else None
+    if trend is None:
+        raise HTTPException(status_code=404, detail="No trend for this patient")
+    return {"patient_id": patient_id, "window": simulation_engine.trend_classifier.window, "vitals": trend}
+
+@app.get("/api/patients/{patient_id}/vitals/history")
+async def get_patient_vitals_history(
+    patient_id: int,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = 500,
+    fields: Optional[str] = None,
+    order: str = "desc",
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get vitals history for a patient"""
-    vitals = db.query(Vitals).filter(
-        Vitals.patient_id == patient_id
-    ).order_by(Vitals.timestamp.desc()).limit(limit).all()
-    return [VitalsResponse.from_orm(vital) for vital in vitals]
+    """Page through a patient's raw vitals between since and until
+    
+    Pages are keyset-paginated on (timestamp, id): pass the next_cursor of
+    one response as cursor to get the next. fields is a comma-separated
+    column list; ekg_data is only read when listed. The page is streamed.
+    """
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be one of: asc, desc")
+    if not 1 <= limit <= MAX_HISTORY_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_HISTORY_LIMIT}")
+    try:
+        query = build_history_query(patient_id, parse_fields(fields), since=since, until=until,
+                                    cursor=cursor, limit=limit, order=order)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not await db.get(Patient, patient_id):
+        raise HTTPException(status_code=404, detail="Patient not found")
+    
+    return StreamingResponse(stream_vitals_history(patient_id, query, limit), media_type="application/json")
 
 @app.get("/api/vitals/latest", response_model=Dict[int, VitalsResponse])
-async def get_latest_vitals(db: SessionLocal = Depends(get_db)):
+async def get_latest_vitals(db: AsyncSession = Depends(get_async_db)):
     """Get latest vitals for all patients"""
-    # Get the latest vitals for each patient
-    latest_vitals = {}
-    for patient in db.query(Patient).all():
-        latest = db.query(Vitals).filter(
-            Vitals.patient_id == patient.id
-        ).order_by(Vitals.timestamp.desc()).first()
-        if latest:
-            latest_vitals[patient.id] = VitalsResponse.from_orm(latest)
-    return latest_vitals
+    # Steady state: serve the rows the simulation has just persisted
+    if simulation_engine and simulation_engine.patients and \
+            len(simulation_engine.latest_vitals) >= len(simulation_engine.patients):
+        return FastJSONResponse({
+            patient_id: {field: row[field] for field in VITALS_FIELDS}
+            for patient_id, row in simulation_engine.latest_vitals.items()
+        })
+    
+    # Otherwise pick each patient's newest row in one query, walking the
+    # (patient_id, timestamp) index once per patient
+    newer = aliased(Vitals)
+    latest_id = select(newer.id).where(
+        newer.patient_id == Patient.id
+    ).order_by(newer.timestamp.desc()).limit(1).correlate(Patient).scalar_subquery()
+    rows = (await db.execute(
+        select(*VITALS_COLUMNS).join(Patient, Vitals.id == latest_id)
+    )).all()
+    return FastJSONResponse({row.patient_id: dict(zip(VITALS_FIELDS, row)) for row in rows})
+
+@app.post("/api/vitals/ingest", status_code=202)
+async def ingest_vitals(request: Request):
+    """Ingest a batch of readings from a bedside gateway
+    
+    The body is NDJSON (application/x-ndjson, one reading per line) or a
+    binary frame (application/vnd.kpum.vitals-frame, see
+    services/vitals_ingest.py). Valid readings are classified, queued for
+    persistence and broadcast; invalid ones are reported by index.
+    """
+    if not vitals_ingest:
+        raise HTTPException(status_code=503, detail="Ingest not initialized")
+    try:
+        body = await vitals_ingest.read_body(request.headers.get("content-length"), request.stream())
+        return await vitals_ingest.ingest(body, request.headers.get("content-type", ""))
+    except IngestTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except IngestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/vitals/export")
+async def export_vitals(
+    format: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    patient_id: Optional[List[int]] = Query(None),
+    batch_size: int = Query(EXPORT_BATCH_ROWS, ge=1, le=MAX_EXPORT_BATCH_ROWS)
+):
+    """Stream raw vitals as Arrow IPC, Parquet or CSV for offline analysis
+    
+    Rows are read through a server-side cursor and written in record
+    batches of batch_size, so memory use does not grow with the table.
+    EKG waveforms are decoded into list<float> columns.
+    """
+    try:
+        export_format = resolve_format(format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    filename = f"vitals-{datetime.now():%Y%m%d-%H%M%S}.{export_format}"
+    return StreamingResponse(
+        stream_export(export_format, build_export_query(since, until, patient_id), batch_size),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
 # Treatment endpoints
 @app.post("/api/treatments", response_model=TreatmentResponse)
-async def create_treatment(treatment: TreatmentCreate, db: SessionLocal = Depends(get_db)):
+async def create_treatment(treatment: TreatmentCreate, db: AsyncSession = Depends(get_async_db)):
     """Create a treatment decision"""
     db_treatment = Treatment(**treatment.dict())
     db.add(db_treatment)
-    db.commit()
-    db.refresh(db_treatment)
+    await db.commit()
+    await db.refresh(db_treatment)
     return TreatmentResponse.from_orm(db_treatment)
 
 @app.get("/api/patients/{patient_id}/treatments", response_model=List[TreatmentResponse])
-async def get_patient_treatments(patient_id: int, db: SessionLocal = Depends(get_db)):
+async def get_patient_treatments(patient_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get treatment history for a patient"""
-    treatments = db.query(Treatment).filter(
-        Treatment.patient_id == patient_id
-    ).order_by(Treatment.timestamp.desc()).all()
-    return [TreatmentResponse.from_orm(treatment) for treatment in treatments]
+    rows = (await db.execute(
+        select(*TREATMENT_COLUMNS).where(
+            Treatment.patient_id == patient_id
+        ).order_by(Treatment.timestamp.desc())
+    )).all()
+    return FastJSONResponse(rows_to_dicts(TREATMENT_FIELDS, rows))
 
 # Dispatch endpoints
 @app.post("/api/dispatches", response_model=DispatchResponse)
-async def create_dispatch(dispatch: DispatchCreate, db: SessionLocal = Depends(get_db)):
+async def create_dispatch(dispatch: DispatchCreate, db: AsyncSession = Depends(get_async_db)):
     """Create a dispatch decision"""
     db_dispatch = Dispatch(**dispatch.dict())
     db.add(db_dispatch)
-    db.commit()
-    db.refresh(db_dispatch)
+    await db.commit()
+    await db.refresh(db_dispatch)
     return DispatchResponse.from_orm(db_dispatch)
 
 @app.get("/api/dispatches", response_model=List[DispatchResponse])
-async def get_dispatches(db: SessionLocal = Depends(get_db)):
+async def get_dispatches(db: AsyncSession = Depends(get_async_db)):
     """Get all dispatch records"""
-    dispatches = db.query(Dispatch).order_by(Dispatch.timestamp.desc()).all()
-    return [DispatchResponse.from_orm(dispatch) for dispatch in dispatches]
+    rows = (await db.execute(
+        select(*DISPATCH_COLUMNS).order_by(Dispatch.timestamp.desc())
+    )).all()
+    return FastJSONResponse(rows_to_dicts(DISPATCH_FIELDS, rows))
 
 # System status endpoint
 @app.get("/api/status")
@@ -202,13 +403,39 @@ async def get_system_status():
     if not simulation_engine:
         raise HTTPException(status_code=503, detail="Simulation engine not initialized")
     
-    return {
+    trend_classifier = getattr(simulation_engine, "trend_classifier", None)
+    status = {
         "status": "running",
         "patients_count": len(simulation_engine.patients),
-        "active_connections": len(websocket_manager.active_connections),
+        "active_connections": websocket_manager.get_connection_count(),
+        "websocket": websocket_manager.get_stats(),
         "simulation_started": simulation_engine.is_running,
+        # The sharded engine's workers report these under simulation_workers
+        "scheduler": simulation_engine.scheduler.get_stats() if simulation_engine.scheduler else None,
+        "vitals_writer": simulation_engine.vitals_writer.get_stats() if simulation_engine.vitals_writer else None,
+        "ingest": vitals_ingest.get_stats() if vitals_ingest else None,
+        "classification_rules": classification_engine.rules.describe(),
+        "trend_classifier": trend_classifier.get_stats() if trend_classifier else None,
         "last_update": datetime.now().isoformat()
     }
+    if isinstance(simulation_engine, ShardedSimulationEngine):
+        status["simulation_workers"] = simulation_engine.get_worker_stats()
+    return status
+
+# Metrics endpoint
+@app.get("/api/metrics")
+async def get_metrics():
+    """Get connection pool telemetry: checkouts, wait times, overflow and churn"""
+    return {
+        "database_pools": get_pool_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+# Prometheus scrape endpoint
+@app.get("/metrics", include_in_schema=False)
+async def get_prometheus_metrics():
+    """Hot-path histograms and counters in the Prometheus text exposition format"""
+    return Response(REGISTRY.render(), media_type=TEXT_CONTENT_TYPE)
 
 # Health check endpoint
 @app.get("/health")
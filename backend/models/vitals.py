@@ -1,17 +1,27 @@
-from sqlalchemy import Column, Integer, Float, DateTime, String, Text, ForeignKey
+from sqlalchemy import Column, Integer, Float, DateTime, String, Text, ForeignKey, Index, LargeBinary
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 from typing import Optional, List
 from datetime import datetime
-from models.database import Base
+import base64
+from models.database import Base, engine
+
+# On PostgreSQL the table is range-partitioned by day on timestamp
+# (see services/vitals_maintenance.py), which requires timestamp in the key
+PARTITIONED = engine.dialect.name == "postgresql"
 
 class Vitals(Base):
     __tablename__ = "vitals"
+    __table_args__ = (
+        # Serves latest-per-patient and per-patient history lookups
+        Index("ix_vitals_patient_id_timestamp", "patient_id", "timestamp"),
+        {"postgresql_partition_by": "RANGE (timestamp)"} if PARTITIONED else {},
+    )
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     patient_id = Column(Integer, ForeignKey("patients.id"), nullable=False)
-    timestamp = Column(DateTime, default=func.now())
+    timestamp = Column(DateTime, primary_key=PARTITIONED, nullable=False, default=func.now())
     
     # Vital signs
     heart_rate = Column(Float, nullable=False)
@@ -21,8 +31,8 @@ class Vitals(Base):
     oxygen_saturation = Column(Float, nullable=False)
     temperature = Column(Float, nullable=False)
     
-    # EKG data (stored as JSON string)
-    ekg_data = Column(Text, nullable=True)
+    # EKG waveform, little-endian int16 samples (see services/ekg_codec.py)
+    ekg_data = Column(LargeBinary, nullable=True)
     
     # Classification
     status = Column(String, nullable=False)  # normal, watch, critical
@@ -40,7 +50,7 @@ class VitalsCreate(BaseModel):
     respiratory_rate: float
     oxygen_saturation: float
     temperature: float
-    ekg_data: Optional[str] = None
+    ekg_data: Optional[str] = None  # base64 of the binary waveform
     status: str
     classification_reason: Optional[str] = None
     recommended_action: Optional[str] = None
@@ -55,10 +65,17 @@ class VitalsResponse(BaseModel):
     respiratory_rate: float
     oxygen_saturation: float
     temperature: float
-    ekg_data: Optional[str]
+    ekg_data: Optional[str]  # base64 of the binary waveform
     status: str
     classification_reason: Optional[str]
     recommended_action: Optional[str]
     
+    @field_validator("ekg_data", mode="before")
+    @classmethod
+    def encode_ekg_data(cls, value):
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return base64.b64encode(value).decode("ascii")
+        return value
+    
     class Config:
         from_attributes = True 
\ No newline at end of file
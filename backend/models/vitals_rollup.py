@@ -0,0 +1,62 @@
+from sqlalchemy import Column, Integer, Float, DateTime, ForeignKey
+from pydantic import BaseModel
+from datetime import datetime
+from models.database import Base
+
+class VitalsRollupMixin:
+    """Per-patient min/max/mean of each vital over one time bucket"""
+    
+    patient_id = Column(Integer, ForeignKey("patients.id"), primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    sample_count = Column(Integer, nullable=False)
+    
+    heart_rate_min = Column(Float, nullable=False)
+    heart_rate_max = Column(Float, nullable=False)
+    heart_rate_mean = Column(Float, nullable=False)
+    systolic_bp_min = Column(Float, nullable=False)
+    systolic_bp_max = Column(Float, nullable=False)
+    systolic_bp_mean = Column(Float, nullable=False)
+    diastolic_bp_min = Column(Float, nullable=False)
+    diastolic_bp_max = Column(Float, nullable=False)
+    diastolic_bp_mean = Column(Float, nullable=False)
+    respiratory_rate_min = Column(Float, nullable=False)
+    respiratory_rate_max = Column(Float, nullable=False)
+    respiratory_rate_mean = Column(Float, nullable=False)
+    oxygen_saturation_min = Column(Float, nullable=False)
+    oxygen_saturation_max = Column(Float, nullable=False)
+    oxygen_saturation_mean = Column(Float, nullable=False)
+    temperature_min = Column(Float, nullable=False)
+    temperature_max = Column(Float, nullable=False)
+    temperature_mean = Column(Float, nullable=False)
+
+class VitalsRollupMinute(VitalsRollupMixin, Base):
+    __tablename__ = "vitals_rollup_1m"
+
+class VitalsRollupHour(VitalsRollupMixin, Base):
+    __tablename__ = "vitals_rollup_1h"
+
+class VitalsRollupResponse(BaseModel):
+    patient_id: int
+    bucket: datetime
+    sample_count: int
+    heart_rate_min: float
+    heart_rate_max: float
+    heart_rate_mean: float
+    systolic_bp_min: float
+    systolic_bp_max: float
+    systolic_bp_mean: float
+    diastolic_bp_min: float
+    diastolic_bp_max: float
+    diastolic_bp_mean: float
+    respiratory_rate_min: float
+    respiratory_rate_max: float
+    respiratory_rate_mean: float
+    oxygen_saturation_min: float
+    oxygen_saturation_max: float
+    oxygen_saturation_mean: float
+    temperature_min: float
+    temperature_max: float
+    temperature_mean: float
+    
+    class Config:
+        from_attributes = True
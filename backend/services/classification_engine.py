@@ -1,105 +1,275 @@
+import asyncio
 import logging
-from typing import Dict, Any, Tuple
+import os
+import time
+from typing import Dict, Any, Tuple, List, Optional, Mapping, Sequence
 import random
+import numpy as np
+
+from services.classification_rules import RuleTable, DEFAULT_RULES_PATH, load_rule_table
+from services.metrics import REGISTRY
 
 logger = logging.getLogger(__name__)
 
+# Column order used by the batch classification path
+VITAL_SIGNS = (
+    "heart_rate",
+    "systolic_bp",
+    "diastolic_bp",
+    "respiratory_rate",
+    "oxygen_saturation",
+    "temperature"
+)
+
+# Status codes returned by classify_batch
+STATUS_NORMAL = 0
+STATUS_WATCH = 1
+STATUS_CRITICAL = 2
+STATUS_NAMES = ("normal", "watch", "critical")
+
+# Largest sample-to-sample EKG change (mV) before the rhythm counts as critical
+EKG_CRITICAL_VARIATION = 2.0
+
+CLASSIFY_SECONDS = REGISTRY.histogram(
+    "kpum_classify_seconds", "Time to classify one reading (single) or one batch (batch)", ["mode"]
+)
+CLASSIFIED_READINGS = REGISTRY.counter("kpum_classified_readings", "Readings classified, by status", ["status"])
+_CLASSIFY_SINGLE = CLASSIFY_SECONDS.labels("single")
+_CLASSIFY_BATCH = CLASSIFY_SECONDS.labels("batch")
+_CLASSIFIED = [CLASSIFIED_READINGS.labels(name) for name in STATUS_NAMES]
+
+class BatchClassification:
+    """Result of classifying a batch of patients with classify_batch.
+
+    Status codes and per-vital bitmasks are computed up front. Bit ``i`` of a
+    mask refers to ``VITAL_SIGNS[i]``. Reason and action strings are only built
+    when requested, and only for the patients they are requested for.
+    """
+
+    def __init__(self, engine: "ClassificationEngine", values: np.ndarray, status_codes: np.ndarray,
+                 critical_mask: np.ndarray, warning_mask: np.ndarray):
+        self.engine = engine
+        self.values = values
+        self.status_codes = status_codes
+        self.critical_mask = critical_mask
+        self.warning_mask = warning_mask
+        self._messages: Dict[Tuple[int, int, int], Tuple[str, str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.status_codes)
+
+    def status(self, index: int) -> str:
+        """Get the status name for one patient"""
+        return STATUS_NAMES[self.status_codes[index]]
+
+    def reason(self, index: int) -> str:
+        """Get the classification reason for one patient"""
+        return self._get_messages(index)[0]
+
+    def recommended_action(self, index: int) -> str:
+        """Get the recommended action for one patient"""
+        return self._get_messages(index)[1]
+
+    def result(self, index: int) -> Tuple[str, str, str]:
+        """Get (status, reason, recommended_action) for one patient, as classify_vitals returns"""
+        reason, recommended_action = self._get_messages(index)
+        return self.status(index), reason, recommended_action
+
+    def _get_messages(self, index: int) -> Tuple[str, str]:
+        # Messages name the out-of-range vitals but not their values, so rows
+        # with the same status and masks share them
+        key = (int(self.status_codes[index]), int(self.critical_mask[index]), int(self.warning_mask[index]))
+        if key not in self._messages:
+            self._messages[key] = self.engine._build_batch_messages(self.values[index], *key)
+        return self._messages[key]
+
 class ClassificationEngine:
-    def __init__(self):
-        # Normal ranges for vital signs
-        self.normal_ranges = {
-            "heart_rate": {"min": 60, "max": 100},
-            "systolic_bp": {"min": 90, "max": 140},
-            "diastolic_bp": {"min": 60, "max": 90},
-            "respiratory_rate": {"min": 12, "max": 20},
-            "oxygen_saturation": {"min": 95, "max": 100},
-            "temperature": {"min": 36.5, "max": 37.5}
-        }
-        
-        # Warning ranges (watch status)
-        self.warning_ranges = {
-            "heart_rate": {"min": 50, "max": 110},
-            "systolic_bp": {"min": 80, "max": 160},
-            "diastolic_bp": {"min": 50, "max": 100},
-            "respiratory_rate": {"min": 10, "max": 25},
-            "oxygen_saturation": {"min": 90, "max": 100},
-            "temperature": {"min": 36.0, "max": 38.0}
-        }
+    def __init__(self, rules_path: Optional[str] = None):
+        # Thresholds come from a versioned rule file, compiled into a RuleTable
+        self.rules_path = rules_path or os.getenv("CLASSIFICATION_RULES_FILE", DEFAULT_RULES_PATH)
+        self.rules: RuleTable = load_rule_table(self.rules_path)
+        self.rules_mtime = os.stat(self.rules_path).st_mtime
+        self.rules_poll_interval = float(os.getenv("CLASSIFICATION_RULES_POLL_INTERVAL", "2"))
+        self.rule_watcher_task: Optional[asyncio.Task] = None
+        logger.info(f"Loaded classification rules version {self.rules.version} from {self.rules_path}")
+    
+    # Default ranges of the current rule version, as dicts keyed by vital name
+    @property
+    def normal_ranges(self) -> Dict[str, Dict[str, float]]:
+        return self.rules.ranges["normal"]
+    
+    @property
+    def warning_ranges(self) -> Dict[str, Dict[str, float]]:
+        return self.rules.ranges["warning"]
+    
+    @property
+    def critical_ranges(self) -> Dict[str, Dict[str, float]]:
+        return self.rules.ranges["critical"]
+    
+    def reload_rules(self) -> bool:
+        """Recompile the rule file if it changed; the swap is a single assignment
         
-        # Critical ranges
-        self.critical_ranges = {
-            "heart_rate": {"min": 40, "max": 120},
-            "systolic_bp": {"min": 70, "max": 180},
-            "diastolic_bp": {"min": 40, "max": 110},
-            "respiratory_rate": {"min": 8, "max": 30},
-            "oxygen_saturation": {"min": 85, "max": 100},
-            "temperature": {"min": 35.5, "max": 38.5}
-        }
-    
-    def classify_vitals(self, vitals: Dict[str, float]) -> Tuple[str, str, str]:
+        Returns True when a new version was installed. A file that fails to
+        load or validate is logged and the current rules stay in effect.
+        """
+        try:
+            mtime = os.stat(self.rules_path).st_mtime
+            if mtime == self.rules_mtime:
+                return False
+            # Recorded up front so a broken file is reported once, not every poll
+            self.rules_mtime = mtime
+            rules = load_rule_table(self.rules_path)
+        except Exception as e:
+            logger.error(f"Keeping classification rules version {self.rules.version}; "
+                         f"could not load {self.rules_path}: {e}")
+            return False
+        self.rules = rules
+        logger.info(f"Reloaded classification rules version {rules.version}")
+        return True
+    
+    async def start_rule_watcher(self):
+        """Poll the rule file and hot-reload it when it changes"""
+        if self.rule_watcher_task is None:
+            self.rule_watcher_task = asyncio.create_task(self._rule_watcher_loop())
+    
+    async def stop_rule_watcher(self):
+        if self.rule_watcher_task:
+            self.rule_watcher_task.cancel()
+            try:
+                await self.rule_watcher_task
+            except asyncio.CancelledError:
+                pass
+            self.rule_watcher_task = None
+    
+    async def _rule_watcher_loop(self):
+        while True:
+            await asyncio.sleep(self.rules_poll_interval)
+            # Parsing and compiling happen off the event loop; classification
+            # keeps using the previous table until the swap
+            await asyncio.to_thread(self.reload_rules)
+    
+    def classify_vitals(self, vitals: Dict[str, float], patient_id: Optional[int] = None,
+                        conditions: Optional[str] = None) -> Tuple[str, str, str]:
         """
         Classify patient vitals into status categories
         
+        Uses the same compiled rule profile as classify_batch, so patient and
+        condition overrides apply; vital signs missing from `vitals` are not checked.
+        
         Returns:
             Tuple of (status, reason, recommended_action)
         """
-        critical_vitals = []
-        warning_vitals = []
+        with _CLASSIFY_SINGLE.time():
+            values = np.array([[vitals.get(name, np.nan) for name in VITAL_SIGNS]], dtype=np.float64)
+            ekg_critical = np.array([self._has_critical_ekg(vitals.get("ekg_data"))])
+            result = self._classify(values, ekg_critical, [patient_id], [conditions])
+            status, reason, recommended_action = result.result(0)
+        _CLASSIFIED[result.status_codes[0]].inc()
+        return status, reason, recommended_action
+    
+    def classify_batch(self, vitals: Any, ekg_critical: Optional[np.ndarray] = None,
+                       patient_ids: Optional[Sequence[int]] = None,
+                       conditions: Optional[Sequence[Optional[str]]] = None) -> BatchClassification:
+        """
+        Classify vitals for N patients at once
         
-        # Check each vital sign
-        for vital_name, value in vitals.items():
-            if vital_name == "ekg_data":
-                continue  # Skip EKG data for now
-                
-            if vital_name in self.critical_ranges:
-                range_data = self.critical_ranges[vital_name]
-                if value < range_data["min"] or value > range_data["max"]:
-                    critical_vitals.append((vital_name, value, range_data))
-                elif vital_name in self.warning_ranges:
-                    warning_range = self.warning_ranges[vital_name]
-                    if value < warning_range["min"] or value > warning_range["max"]:
-                        warning_vitals.append((vital_name, value, warning_range))
-            elif vital_name in self.warning_ranges:
-                warning_range = self.warning_ranges[vital_name]
-                if value < warning_range["min"] or value > warning_range["max"]:
-                    warning_vitals.append((vital_name, value, warning_range))
+        Args:
+            vitals: Structured array with VITAL_SIGNS fields, a mapping of
+                vital name to column array, or an (N, 6) array ordered by VITAL_SIGNS
+            ekg_critical: Optional boolean array marking patients with a critical EKG
+            patient_ids: Optional patient id per row, for patient overrides
+            conditions: Optional medical_conditions per row, for condition overrides
         
-
+        Returns:
+            BatchClassification with status codes and per-vital bitmasks
+        """
+        start = time.perf_counter()
+        result = self._classify(self._as_vitals_matrix(vitals), ekg_critical, patient_ids, conditions)
+        _CLASSIFY_BATCH.observe(time.perf_counter() - start)
+        for counter, count in zip(_CLASSIFIED, np.bincount(result.status_codes, minlength=len(STATUS_NAMES)).tolist()):
+            counter.inc(count)
+        return result
+    
+    def _classify(self, values: np.ndarray, ekg_critical: Optional[np.ndarray],
+                  patient_ids: Optional[Sequence[Optional[int]]],
+                  conditions: Optional[Sequence[Optional[str]]]) -> BatchClassification:
+        # One rule version for the whole batch, even if a reload lands meanwhile
+        rules = self.rules
+        if patient_ids is None:
+            thresholds = rules.thresholds[0]
+        else:
+            # Resolving may add profiles, so read the array afterwards;
+            # (N, 4, vitals) -> four (N, vitals) arrays
+            profiles = rules.profiles_for(patient_ids, conditions)
+            thresholds = np.moveaxis(rules.thresholds[profiles], 1, 0)
+        critical_min, critical_max, warning_min, warning_max = thresholds
+        
+        critical = (values < critical_min) | (values > critical_max)
+        warning = ~critical & ((values < warning_min) | (values > warning_max))
+        critical_count = critical.sum(axis=1)
+        warning_count = warning.sum(axis=1)
+        
+        is_critical = critical_count >= 2
+        if ekg_critical is not None:
+            is_critical |= np.asarray(ekg_critical, dtype=bool)
+        is_watch = (critical_count == 1) | (warning_count >= 2)
         
-        # Determine status based on critical and warning vitals
-        if len(critical_vitals) >= 2 or self._has_critical_ekg(vitals.get("ekg_data")):
-            status = "critical"
-            reason = self._generate_critical_reason(critical_vitals)
-            recommended_action = self._generate_critical_action(critical_vitals)
-        elif len(critical_vitals) == 1 or len(warning_vitals) >= 2:
-            status = "watch"
-            reason = self._generate_watch_reason(warning_vitals, critical_vitals)
-            recommended_action = self._generate_watch_action(warning_vitals, critical_vitals)
+        status_codes = np.where(is_critical, STATUS_CRITICAL,
+                                np.where(is_watch, STATUS_WATCH, STATUS_NORMAL)).astype(np.uint8)
+        critical_mask = np.packbits(critical, axis=1, bitorder="little")[:, 0]
+        warning_mask = np.packbits(warning, axis=1, bitorder="little")[:, 0]
+        return BatchClassification(self, values, status_codes, critical_mask, warning_mask)
+    
+    def _as_vitals_matrix(self, vitals: Any) -> np.ndarray:
+        """Convert batch input into an (N, 6) float array ordered by VITAL_SIGNS"""
+        if isinstance(vitals, np.ndarray) and vitals.dtype.names:
+            columns = [vitals[name] for name in VITAL_SIGNS]
+        elif isinstance(vitals, Mapping):
+            columns = [vitals[name] for name in VITAL_SIGNS]
         else:
-            status = "normal"
-            reason = "All vital signs within normal ranges"
-            recommended_action = "Continue monitoring"
+            matrix = np.asarray(vitals, dtype=np.float64)
+            if matrix.ndim != 2 or matrix.shape[1] != len(VITAL_SIGNS):
+                raise ValueError(f"Expected an (N, {len(VITAL_SIGNS)}) vitals array, got shape {matrix.shape}")
+            return matrix
+        return np.column_stack([np.asarray(c, dtype=np.float64) for c in columns])
+    
+    def _build_batch_messages(self, values: np.ndarray, status_code: int,
+                              critical_mask: int, warning_mask: int) -> Tuple[str, str]:
+        """Build reason and action strings for one row of a batch result"""
+        if status_code == STATUS_NORMAL:
+            return "All vital signs within normal ranges", "Continue monitoring"
         
-        return status, reason, recommended_action
+        critical_vitals = self._expand_mask(values, critical_mask, self.critical_ranges)
+        if status_code == STATUS_CRITICAL:
+            return (self._generate_critical_reason(critical_vitals),
+                    self._generate_critical_action(critical_vitals))
+        
+        warning_vitals = self._expand_mask(values, warning_mask, self.warning_ranges)
+        return (self._generate_watch_reason(warning_vitals, critical_vitals),
+                self._generate_watch_action(warning_vitals, critical_vitals))
+    
+    def _expand_mask(self, values: np.ndarray, mask: int, ranges: Dict[str, Dict[str, float]]) -> List[tuple]:
+        """Turn a per-vital bitmask back into (vital_name, value, range) tuples"""
+        return [
+            (name, float(values[i]), ranges[name])
+            for i, name in enumerate(VITAL_SIGNS)
+            if mask & (1 << i)
+        ]
     
-    def _has_critical_ekg(self, ekg_data: str) -> bool:
+    def _has_critical_ekg(self, ekg_data: Optional[np.ndarray]) -> bool:
         """Check if EKG data indicates critical condition"""
-        if not ekg_data:
+        if ekg_data is None or len(ekg_data) <= 10:
             return False
         
-        # Simple EKG analysis - in a real system this would be more sophisticated
-        try:
-            ekg_values = [float(x) for x in ekg_data.split(",")]
-            # Check for arrhythmia patterns
-            if len(ekg_values) > 10:
-                # Simple arrhythmia detection
-                variations = [abs(ekg_values[i] - ekg_values[i-1]) for i in range(1, len(ekg_values))]
-                if max(variations) > 2.0:  # High variation indicates arrhythmia
-                    return True
-        except:
-            pass
-        
-        return False
+        # Simple arrhythmia detection - in a real system this would be more sophisticated.
+        # High sample-to-sample variation indicates arrhythmia
+        return bool(np.abs(np.diff(ekg_data)).max() > EKG_CRITICAL_VARIATION)
+    
+    def critical_ekg_batch(self, ekg: np.ndarray) -> np.ndarray:
+        """Vectorized _has_critical_ekg over an (N, samples) array of waveforms"""
+        if ekg.shape[1] <= 10:
+            return np.zeros(ekg.shape[0], dtype=bool)
+        return np.abs(np.diff(ekg, axis=1)).max(axis=1) > EKG_CRITICAL_VARIATION
     
     def _generate_critical_reason(self, critical_vitals: list) -> str:
         """Generate human-readable reason for critical status"""
@@ -0,0 +1,197 @@
+import copy
+import json
+import logging
+import math
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Must match the column order of classification_engine.VITAL_SIGNS
+RULE_VITALS = (
+    "heart_rate",
+    "systolic_bp",
+    "diastolic_bp",
+    "respiratory_rate",
+    "oxygen_saturation",
+    "temperature"
+)
+RULE_LEVELS = ("normal", "warning", "critical")
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                  "rules", "classification_rules.json")
+
+class RuleFileError(ValueError):
+    """The rule file is missing required data or has inconsistent thresholds"""
+
+def merge_levels(ranges: Dict[str, Any], layers: Sequence[Dict[str, Any]]) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """Warning and critical bounds after applying override layers in order"""
+    levels = copy.deepcopy({level: ranges[level] for level in ("warning", "critical")})
+    for layer in layers:
+        for level in ("warning", "critical"):
+            for vital, bounds in layer.get(level, {}).items():
+                levels[level][vital].update(bounds)
+    return levels
+
+class RuleTable:
+    """Immutable, compiled form of one version of the classification rules.
+
+    Every distinct combination of overrides becomes a profile: one row in the
+    (profiles, vitals) threshold arrays. Profile 0 is the defaults. Patients
+    are mapped to their profile once per rule version, so classifying a
+    reading is a row gather plus four array comparisons.
+    """
+
+    def __init__(self, rules: Dict[str, Any], source: Optional[str] = None):
+        self.version = rules["version"]
+        self.source = source
+        self.loaded_at = datetime.now()
+        self.ranges = rules["ranges"]
+        self.condition_overrides = rules.get("condition_overrides", [])
+        self.patient_overrides = {int(k): v for k, v in rules.get("patient_overrides", {}).items()}
+
+        # Override key -> profile index; profiles are added the first time a
+        # combination is seen, copy-on-write so readers never see a partial row
+        self._lock = threading.Lock()
+        self._profile_index: Dict[Tuple[str, ...], int] = {}
+        self._patient_profiles: Dict[Tuple[int, Optional[str]], int] = {}
+        self.profile_names: List[Tuple[str, ...]] = []
+        self.thresholds = np.empty((0, 4, len(RULE_VITALS)))
+        self._add_profile(())
+
+    def _layer(self, override: str) -> Dict[str, Any]:
+        if override.startswith("patient:"):
+            return self.patient_overrides[int(override.split(":", 1)[1])]
+        return next(o for o in self.condition_overrides if o["condition"] == override)
+
+    def _add_profile(self, key: Tuple[str, ...]) -> int:
+        levels = merge_levels(self.ranges, [self._layer(override) for override in key])
+
+        row = np.array([
+            [levels["critical"][v]["min"] for v in RULE_VITALS],
+            [levels["critical"][v]["max"] for v in RULE_VITALS],
+            [levels["warning"][v]["min"] for v in RULE_VITALS],
+            [levels["warning"][v]["max"] for v in RULE_VITALS]
+        ], dtype=np.float64)
+        self.thresholds = np.concatenate([self.thresholds, row[None]])
+        self.profile_names.append(key)
+        self._profile_index[key] = len(self.profile_names) - 1
+        return self._profile_index[key]
+
+    def _override_key(self, patient_id: Optional[int], conditions: Optional[str]) -> Tuple[str, ...]:
+        key = []
+        text = (conditions or "").lower()
+        for override in self.condition_overrides:
+            if override["condition"].lower() in text:
+                key.append(override["condition"])
+        if patient_id in self.patient_overrides:
+            key.append(f"patient:{patient_id}")
+        return tuple(key)
+
+    def profile_for(self, patient_id: Optional[int], conditions: Optional[str] = None) -> int:
+        """Profile index for one patient"""
+        cache_key = (patient_id, conditions)
+        profile = self._patient_profiles.get(cache_key)
+        if profile is None:
+            with self._lock:
+                key = self._override_key(patient_id, conditions)
+                profile = self._profile_index.get(key)
+                if profile is None:
+                    profile = self._add_profile(key)
+                self._patient_profiles[cache_key] = profile
+        return profile
+
+    def profiles_for(self, patient_ids: Sequence[Optional[int]],
+                     conditions: Optional[Sequence[Optional[str]]] = None) -> np.ndarray:
+        """Profile index for each patient of a batch"""
+        if conditions is None:
+            conditions = [None] * len(patient_ids)
+        return np.fromiter(
+            (self.profile_for(patient_id, condition) for patient_id, condition in zip(patient_ids, conditions)),
+            dtype=np.intp, count=len(patient_ids)
+        )
+
+    def describe(self) -> Dict[str, Any]:
+        """Summary for status endpoints"""
+        return {
+            "version": self.version,
+            "source": self.source,
+            "loaded_at": self.loaded_at.isoformat(),
+            "condition_overrides": [o["condition"] for o in self.condition_overrides],
+            "patient_overrides": sorted(self.patient_overrides),
+            "profiles": len(self.profile_names)
+        }
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+def _check_override(name: str, override: Any):
+    if not isinstance(override, dict):
+        raise RuleFileError(f"Override {name} must be an object")
+    for level in ("warning", "critical"):
+        vitals = override.get(level, {})
+        if not isinstance(vitals, dict):
+            raise RuleFileError(f"Override {name}: {level} must be an object")
+        for vital, bounds in vitals.items():
+            if vital not in RULE_VITALS:
+                raise RuleFileError(f"Unknown vital sign in override: {vital}")
+            if not isinstance(bounds, dict) or set(bounds) - {"min", "max"}:
+                raise RuleFileError(f"Override for {vital} may only set min and max")
+            if not all(_is_number(value) for value in bounds.values()):
+                raise RuleFileError(f"Override {name}: {level}.{vital} bounds must be numbers")
+
+def validate_rules(rules: Dict[str, Any]):
+    """Check a parsed rule file, including every profile its overrides can compile to"""
+    if not isinstance(rules.get("version"), int):
+        raise RuleFileError("version must be an integer")
+    ranges = rules.get("ranges", {})
+    for level in RULE_LEVELS:
+        for vital in RULE_VITALS:
+            bounds = ranges.get(level, {}).get(vital)
+            if not bounds or "min" not in bounds or "max" not in bounds:
+                raise RuleFileError(f"ranges.{level}.{vital} needs min and max")
+            if not (_is_number(bounds["min"]) and _is_number(bounds["max"])):
+                raise RuleFileError(f"ranges.{level}.{vital} bounds must be numbers")
+            if bounds["min"] > bounds["max"]:
+                raise RuleFileError(f"ranges.{level}.{vital} has min above max")
+
+    layers: List[Tuple[str, Dict[str, Any]]] = []
+    for override in rules.get("condition_overrides", []):
+        if not isinstance(override, dict) or not isinstance(override.get("condition"), str) or not override["condition"]:
+            raise RuleFileError("condition overrides need a condition")
+        if any(name == override["condition"] for name, _ in layers):
+            raise RuleFileError(f"Duplicate condition override: {override['condition']}")
+        _check_override(override["condition"], override)
+        layers.append((override["condition"], override))
+    conditions = len(layers)
+    for patient_id, override in rules.get("patient_overrides", {}).items():
+        try:
+            int(patient_id)
+        except ValueError:
+            raise RuleFileError(f"Patient override key must be a patient id, got {patient_id!r}")
+        _check_override(f"patient:{patient_id}", override)
+        layers.append((f"patient:{patient_id}", override))
+
+    # Each merged bound comes from a single layer, so checking every layer
+    # alone and every ordered pair (a patient's own layer is always last)
+    # covers every combination RuleTable can compile
+    keys = [(i,) for i in range(len(layers))]
+    keys += [(i, j) for i in range(conditions) for j in range(i + 1, len(layers))]
+    for key in keys:
+        levels = merge_levels(ranges, [layers[i][1] for i in key])
+        for level, vitals in levels.items():
+            for vital, bounds in vitals.items():
+                if bounds["min"] > bounds["max"]:
+                    profile = " + ".join(layers[i][0] for i in key)
+                    raise RuleFileError(f"Profile {profile} has min above max for {level}.{vital}")
+
+def load_rule_table(path: str = DEFAULT_RULES_PATH) -> RuleTable:
+    """Read, validate and compile a rule file"""
+    with open(path) as f:
+        rules = json.load(f)
+    validate_rules(rules)
+    return RuleTable(rules, source=path)
@@ -0,0 +1,26 @@
+import base64
+from typing import Optional, Union
+import numpy as np
+
+# Waveforms are stored as little-endian int16 samples in units of 1/EKG_SCALE mV,
+# which covers +/-32.767 mV at 1 uV resolution in two bytes per sample
+EKG_SAMPLE_DTYPE = np.dtype("<i2")
+EKG_SCALE = 1000.0
+
+def encode_waveform(signal: np.ndarray) -> bytes:
+    """Pack a waveform in millivolts into the binary storage format"""
+    scaled = np.rint(np.asarray(signal, dtype=np.float32) * EKG_SCALE)
+    info = np.iinfo(EKG_SAMPLE_DTYPE)
+    return np.clip(scaled, info.min, info.max).astype(EKG_SAMPLE_DTYPE).tobytes()
+
+def decode_waveform(data: bytes) -> np.ndarray:
+    """Unpack stored waveform bytes into a float32 array in millivolts"""
+    return np.frombuffer(data, dtype=EKG_SAMPLE_DTYPE).astype(np.float32) / np.float32(EKG_SCALE)
+
+def waveform_to_base64(waveform: Optional[Union[np.ndarray, bytes]]) -> Optional[str]:
+    """Encode a waveform (array or stored bytes) as base64 for JSON clients"""
+    if waveform is None:
+        return None
+    if isinstance(waveform, np.ndarray):
+        waveform = encode_waveform(waveform)
+    return base64.b64encode(waveform).decode("ascii")
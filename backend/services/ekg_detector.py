@@ -0,0 +1,196 @@
+import logging
+from typing import Dict, Any
+
+import numpy as np
+
+from services.classification_engine import EKG_CRITICAL_VARIATION
+
+logger = logging.getLogger(__name__)
+
+# Arrhythmia flag bits reported per patient
+EKG_FLAG_SPIKE = 1       # sample-to-sample jump above EKG_CRITICAL_VARIATION
+EKG_FLAG_IRREGULAR = 2   # RR intervals vary too much (e.g. atrial fibrillation)
+EKG_FLAG_ASYSTOLE = 4    # no R-peak for longer than ASYSTOLE_SECONDS
+EKG_FLAG_NAMES = {
+    EKG_FLAG_SPIKE: "spike",
+    EKG_FLAG_IRREGULAR: "irregular_rhythm",
+    EKG_FLAG_ASYSTOLE: "asystole"
+}
+
+# Below this rate R-peaks cannot be resolved and only the spike check runs
+MIN_RHYTHM_SAMPLE_RATE = 100.0
+REFRACTORY_SECONDS = 0.2
+ASYSTOLE_SECONDS = 3.0
+# Successive RR differences (RMSSD) relative to the mean RR above which the
+# rhythm counts as irregular
+IRREGULAR_RR_RMSSD = 0.12
+MIN_RR_FOR_RHYTHM = 6
+# Weight of each new R-peak in the running peak amplitude (Pan-Tompkins style)
+PEAK_LEVEL_WEIGHT = 0.125
+PEAK_THRESHOLD_FRACTION = 0.5
+BASELINE_WEIGHT = 0.05
+
+class EkgAnalysis:
+    """Per-patient result of one StreamingEkgDetector.process call"""
+
+    def __init__(self, flags: np.ndarray, heart_rate: np.ndarray, peaks: np.ndarray):
+        self.flags = flags
+        self.heart_rate = heart_rate
+        self.peaks = peaks
+
+    @property
+    def critical(self) -> np.ndarray:
+        """Boolean array: any arrhythmia flag set"""
+        return self.flags != 0
+
+    def flag_names(self, index: int):
+        """Names of the flags set for one patient"""
+        return [name for bit, name in EKG_FLAG_NAMES.items() if self.flags[index] & bit]
+
+class StreamingEkgDetector:
+    """Incremental R-peak and rhythm detector for a fixed set of patients.
+
+    Each call consumes the next chunk of samples for every patient, as an
+    (N, samples) array. State between chunks is O(1) per patient: the last
+    two samples (so derivatives and local maxima span chunk boundaries), a
+    running baseline and R-peak amplitude for the adaptive threshold, the
+    position of the last R-peak, and a small ring buffer of RR intervals.
+    All work is vectorized across patients and samples; only the detected
+    peaks, a few per patient per chunk, are touched individually.
+    """
+
+    def __init__(self, patient_count: int, sample_rate: float, rr_window: int = 16):
+        self.patient_count = patient_count
+        self.sample_rate = sample_rate
+        self.rr_window = rr_window
+        self.track_rhythm = sample_rate >= MIN_RHYTHM_SAMPLE_RATE
+        self.refractory = int(REFRACTORY_SECONDS * sample_rate)
+
+        n = patient_count
+        self.tail = np.full((n, 2), np.nan, dtype=np.float32)
+        self.baseline = np.full(n, np.nan)
+        self.peak_level = np.full(n, np.nan)
+        self.samples_seen = 0
+        self.last_peak = np.full(n, -1, dtype=np.int64)
+        self.rr = np.zeros((n, rr_window))
+        self.rr_next = np.zeros(n, dtype=np.int64)
+        self.rr_count = np.zeros(n, dtype=np.int64)
+
+    def process(self, chunk: np.ndarray) -> EkgAnalysis:
+        """Consume the next (N, samples) chunk and return current flags"""
+        chunk = np.asarray(chunk, dtype=np.float32)
+        n, samples = chunk.shape
+        flags = np.zeros(n, dtype=np.uint8)
+
+        # Prepend the carried samples so differences span the chunk boundary
+        first_chunk = np.isnan(self.tail[:, 1])
+        extended = np.concatenate([np.where(np.isnan(self.tail), chunk[:, :1], self.tail), chunk], axis=1)
+        variation = np.abs(np.diff(extended[:, 1:], axis=1)).max(axis=1) if samples > 1 else np.zeros(n)
+        # Matches the stateless check for the first chunk (which needs > 10 samples)
+        variation = np.where(first_chunk & (samples <= 10), 0.0, variation)
+        flags[variation > EKG_CRITICAL_VARIATION] |= EKG_FLAG_SPIKE
+
+        peaks = np.zeros(n, dtype=np.int64)
+        if self.track_rhythm:
+            peaks = self._detect_peaks(extended, chunk)
+            flags |= self._rhythm_flags(samples)
+
+        self.tail = extended[:, -2:].copy()
+        self.samples_seen += samples
+        return EkgAnalysis(flags, self.heart_rate(), peaks)
+
+    def _detect_peaks(self, extended: np.ndarray, chunk: np.ndarray) -> np.ndarray:
+        """Find R-peaks, update RR state and return the number of peaks per patient"""
+        # Running baseline removes wander and ST shifts before thresholding
+        chunk_mean = chunk.mean(axis=1)
+        self.baseline = np.where(np.isnan(self.baseline), chunk_mean,
+                                 (1 - BASELINE_WEIGHT) * self.baseline + BASELINE_WEIGHT * chunk_mean)
+        centered = extended - self.baseline[:, None]
+        self.peak_level = np.where(np.isnan(self.peak_level), centered[:, 2:].max(axis=1), self.peak_level)
+        threshold = PEAK_THRESHOLD_FRACTION * self.peak_level
+
+        # Local maxima above threshold; column j of the middle slice is the
+        # sample just before chunk[:, j], so the newest sample waits one chunk
+        middle = centered[:, 1:-1]
+        is_peak = (middle > threshold[:, None]) & (middle > centered[:, :-2]) & (middle >= centered[:, 2:])
+        rows, cols = np.nonzero(is_peak)
+        if not len(rows):
+            return np.zeros(self.patient_count, dtype=np.int64)
+        positions = self.samples_seen - 1 + cols
+
+        # Refractory period: drop a candidate that follows the previous one too closely
+        previous = np.empty_like(positions)
+        previous[1:] = positions[:-1]
+        new_row = np.ones(len(rows), dtype=bool)
+        new_row[1:] = rows[1:] != rows[:-1]
+        previous[new_row] = self.last_peak[rows[new_row]]
+        keep = (previous < 0) | (positions - previous >= self.refractory)
+        rows, positions, previous, amplitudes = rows[keep], positions[keep], previous[keep], middle[is_peak][keep]
+        if not len(rows):
+            return np.zeros(self.patient_count, dtype=np.int64)
+
+        # After filtering, each kept peak's predecessor is the kept peak before it in the row
+        new_row = np.ones(len(rows), dtype=bool)
+        new_row[1:] = rows[1:] != rows[:-1]
+        previous[1:] = np.where(new_row[1:], previous[1:], positions[:-1])
+        previous[new_row] = self.last_peak[rows[new_row]]
+
+        # Push RR intervals into each patient's ring buffer
+        has_rr = previous >= 0
+        rr_rows = rows[has_rr]
+        if len(rr_rows):
+            rr_values = (positions[has_rr] - previous[has_rr]) / self.sample_rate
+            starts = np.flatnonzero(np.r_[True, rr_rows[1:] != rr_rows[:-1]])
+            counts = np.diff(np.r_[starts, len(rr_rows)])
+            ordinal = np.arange(len(rr_rows)) - np.repeat(starts, counts)
+            slots = (self.rr_next[rr_rows] + ordinal) % self.rr_window
+            self.rr[rr_rows, slots] = rr_values
+            unique_rows = rr_rows[starts]
+            self.rr_next[unique_rows] = (self.rr_next[unique_rows] + counts) % self.rr_window
+            self.rr_count[unique_rows] = np.minimum(self.rr_count[unique_rows] + counts, self.rr_window)
+
+        # Track R-peak amplitude for the adaptive threshold, and the last peak position
+        peak_counts = np.bincount(rows, minlength=self.patient_count)
+        detected = peak_counts > 0
+        mean_amplitude = np.bincount(rows, weights=amplitudes, minlength=self.patient_count)[detected] / peak_counts[detected]
+        self.peak_level[detected] = ((1 - PEAK_LEVEL_WEIGHT) * self.peak_level[detected]
+                                     + PEAK_LEVEL_WEIGHT * mean_amplitude)
+        last_index = np.flatnonzero(np.r_[rows[1:] != rows[:-1], True])
+        self.last_peak[rows[last_index]] = positions[last_index]
+        return peak_counts
+
+    def _rhythm_flags(self, samples: int) -> np.ndarray:
+        flags = np.zeros(self.patient_count, dtype=np.uint8)
+        full = self.rr_count >= MIN_RR_FOR_RHYTHM
+        if full.any():
+            # Oldest-first RR series; successive differences (RMSSD) react to
+            # beat-to-beat irregularity but not to a steady change of rate
+            order = (self.rr_next[full, None] + np.arange(self.rr_window)) % self.rr_window
+            series = np.take_along_axis(self.rr[full], order, axis=1)
+            valid = np.arange(self.rr_window) >= self.rr_window - self.rr_count[full, None]
+            steps = np.where(valid[:, 1:] & valid[:, :-1], np.diff(series, axis=1), np.nan)
+            rmssd = np.sqrt(np.nanmean(steps ** 2, axis=1))
+            mean_rr = np.nanmean(np.where(valid, series, np.nan), axis=1)
+            flags[np.flatnonzero(full)[rmssd / mean_rr > IRREGULAR_RR_RMSSD]] |= EKG_FLAG_IRREGULAR
+
+        # Only once a full asystole period has been observed for the patient
+        since_peak = np.where(self.last_peak >= 0, self.samples_seen + samples - self.last_peak,
+                              self.samples_seen + samples)
+        flags[since_peak > ASYSTOLE_SECONDS * self.sample_rate] |= EKG_FLAG_ASYSTOLE
+        return flags
+
+    def heart_rate(self) -> np.ndarray:
+        """Beats per minute from the mean of the buffered RR intervals (NaN until known)"""
+        counts = self.rr_count
+        sums = np.where(np.arange(self.rr_window) < counts[:, None], self.rr, 0.0).sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(counts > 0, 60.0 * counts / sums, np.nan)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get detector configuration and how many patients have a known rhythm"""
+        return {
+            "sample_rate_hz": self.sample_rate,
+            "rhythm_tracking": self.track_rhythm,
+            "patients": self.patient_count,
+            "patients_with_rhythm": int((self.rr_count >= MIN_RR_FOR_RHYTHM).sum())
+        }
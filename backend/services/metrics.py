@@ -0,0 +1,224 @@
+import bisect
+import logging
+import math
+import threading
+import time
+from typing import Dict, Any, Callable, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of latency histogram buckets; +Inf is implicit
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0
+)
+
+# Starlette appends "; charset=utf-8" to text/* responses
+TEXT_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# (name, type, help, samples); a sample is (name suffix, labels, value)
+Family = Tuple[str, str, str, List[Tuple[str, Dict[str, str], float]]]
+
+class Counter:
+    """Monotonically increasing count"""
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self.lock:
+            self.value += amount
+
+    def samples(self):
+        return [("_total", {}, self.value)]
+
+class Gauge:
+    """Value that can go up and down"""
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def samples(self):
+        return [("", {}, self.value)]
+
+class _Timer:
+    def __init__(self, histogram: "Histogram"):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+class Histogram:
+    """Cumulative-bucket histogram; observing is a bisect and three additions"""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self) -> _Timer:
+        """Context manager that observes the elapsed seconds"""
+        return _Timer(self)
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        """Per-bucket (not cumulative) counts, the last one for +Inf, and the sum"""
+        with self.lock:
+            return list(self.counts), self.sum
+
+    def bucket_counts(self, unit: str = "ms", scale: float = 1000.0) -> Dict[str, int]:
+        """Per-bucket counts keyed like le_5ms, for JSON status endpoints"""
+        counts, _ = self.snapshot()
+        histogram = {f"le_{bound * scale:g}{unit}": count for bound, count in zip(self.buckets, counts)}
+        histogram["le_inf"] = counts[-1]
+        return histogram
+
+    def samples(self):
+        counts, total = self.snapshot()
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            samples.append(("_bucket", {"le": "+Inf" if bound == math.inf else f"{bound:g}"}, cumulative))
+        samples.append(("_sum", {}, total))
+        samples.append(("_count", {}, cumulative))
+        return samples
+
+class MetricFamily:
+    """A named metric and its children, one per combination of label values"""
+
+    def __init__(self, name: str, metric_type: str, documentation: str, labelnames: Sequence[str],
+                 factory: Callable[[], Any]):
+        self.name = name
+        self.metric_type = metric_type
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.factory = factory
+        self.children: Dict[Tuple[str, ...], Any] = {}
+        self.lock = threading.Lock()
+        if not self.labelnames:
+            self.children[()] = factory()
+
+    def labels(self, *values: str):
+        """Child metric for these label values; cache it on hot paths"""
+        key = tuple(str(value) for value in values)
+        child = self.children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self.lock:
+                child = self.children.setdefault(key, self.factory())
+        return child
+
+    def __getattr__(self, attribute):
+        # Unlabelled families act as their single child (inc, observe, time, set)
+        if attribute != "children" and () in self.children:
+            return getattr(self.children[()], attribute)
+        raise AttributeError(attribute)
+
+    def collect(self) -> Family:
+        samples = []
+        for key, child in list(self.children.items()):
+            labels = dict(zip(self.labelnames, key))
+            for suffix, extra, value in child.samples():
+                samples.append((suffix, {**labels, **extra}, value))
+        return self.name, self.metric_type, self.documentation, samples
+
+class MetricsRegistry:
+    """Process-wide metrics, rendered in the Prometheus text exposition format.
+
+    Metrics are created once at import time by the module that records them.
+    Collectors add families computed at scrape time (pool statistics, shard
+    worker snapshots), so nothing is done for them between scrapes.
+    """
+
+    def __init__(self):
+        self.families: Dict[str, MetricFamily] = {}
+        self.collectors: List[Callable[[], Iterable[Family]]] = []
+        self.lock = threading.Lock()
+
+    def _register(self, name, metric_type, documentation, labelnames, factory) -> MetricFamily:
+        with self.lock:
+            family = self.families.get(name)
+            if family is None:
+                family = self.families[name] = MetricFamily(name, metric_type, documentation, labelnames, factory)
+            return family
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> MetricFamily:
+        """Counter family; samples are exposed as <name>_total"""
+        return self._register(name, "counter", documentation, labelnames, Counter)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> MetricFamily:
+        return self._register(name, "gauge", documentation, labelnames, Gauge)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> MetricFamily:
+        return self._register(name, "histogram", documentation, labelnames, lambda: Histogram(buckets))
+
+    def register_collector(self, collector: Callable[[], Iterable[Family]]):
+        self.collectors.append(collector)
+
+    def snapshot(self) -> List[Family]:
+        """This process's own families, as plain data that can cross a process boundary"""
+        return [family.collect() for family in list(self.families.values())]
+
+    def render(self) -> str:
+        """All families, including collected ones, in the text exposition format"""
+        merged: Dict[str, Family] = {}
+        families = self.snapshot()
+        for collector in self.collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {e}")
+        for name, metric_type, documentation, samples in families:
+            if name in merged:
+                merged[name][3].extend(samples)
+            else:
+                merged[name] = (name, metric_type, documentation, list(samples))
+
+        lines = []
+        for name, metric_type, documentation, samples in merged.values():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for suffix, labels, value in samples:
+                lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels.items()) + "}"
+
+def _escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def with_labels(families: Iterable[Family], **labels: str) -> List[Family]:
+    """Add labels to every sample, e.g. the worker a snapshot came from"""
+    return [
+        (name, metric_type, documentation, [(suffix, {**labels, **sample_labels}, value)
+                                            for suffix, sample_labels, value in samples])
+        for name, metric_type, documentation, samples in families
+    ]
+
+REGISTRY = MetricsRegistry()
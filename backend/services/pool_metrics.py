@@ -0,0 +1,178 @@
+import logging
+import threading
+import time
+from typing import Dict, Any, Optional, Tuple
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+from services.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the checkout wait histogram buckets; +Inf is implicit
+WAIT_BUCKETS: Tuple[float, ...] = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+POOL_WAIT_SECONDS = REGISTRY.histogram(
+    "kpum_db_pool_wait_seconds", "Time spent queued for a pooled connection, excluding connect time", ["pool"],
+    buckets=WAIT_BUCKETS
+)
+POOL_CONNECT_SECONDS = REGISTRY.histogram(
+    "kpum_db_pool_connect_seconds", "Time to open a new connection during checkout", ["pool"]
+)
+
+class PoolMetrics:
+    """Connection pool telemetry collected from SQLAlchemy pool events.
+
+    Counts checkouts, checkins and connection churn (connects, closes,
+    invalidations), tracks how many connections are checked out and how often
+    the pool had to dip into overflow, and keeps histograms of how long
+    callers queued for a connection and how long new connections took to
+    open. A rising wait time or timeout count means the pool is exhausted;
+    a rising connect time means the database is slow to accept connections.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.pool = None
+        self.lock = threading.Lock()
+
+        # Statistics
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.closes = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.overflow_checkouts = 0
+        self.peak_checked_out = 0
+        self.wait = POOL_WAIT_SECONDS.labels(name)
+        self.connect = POOL_CONNECT_SECONDS.labels(name)
+        self.max_wait_ms = 0.0
+        self.max_connect_ms = 0.0
+
+    def attach(self, engine):
+        """Listen to the events of an engine's pool"""
+        pool = engine.pool
+        pool.metrics = self
+        self.pool = pool
+        event.listen(pool, "connect", self._on_connect)
+        event.listen(pool, "checkout", self._on_checkout)
+        event.listen(pool, "checkin", self._on_checkin)
+        event.listen(pool, "close", self._on_close)
+        event.listen(pool, "invalidate", self._on_invalidate)
+        event.listen(pool, "soft_invalidate", self._on_invalidate)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self.lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        checked_out = self.pool.checkedout() if isinstance(self.pool, QueuePool) else 0
+        with self.lock:
+            self.checkouts += 1
+            self.peak_checked_out = max(self.peak_checked_out, checked_out)
+            if isinstance(self.pool, QueuePool) and checked_out > self.pool.size():
+                self.overflow_checkouts += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self.lock:
+            self.checkins += 1
+
+    def _on_close(self, dbapi_connection, connection_record):
+        with self.lock:
+            self.closes += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self.lock:
+            self.invalidations += 1
+
+    def record_wait(self, wait_seconds: float, timed_out: bool = False):
+        """Record how long one checkout queued for a connection"""
+        self.wait.observe(wait_seconds)
+        with self.lock:
+            self.max_wait_ms = max(self.max_wait_ms, wait_seconds * 1000)
+            if timed_out:
+                self.timeouts += 1
+
+    def record_connect(self, connect_seconds: float):
+        """Record how long a checkout spent opening a new connection"""
+        self.connect.observe(connect_seconds)
+        with self.lock:
+            self.max_connect_ms = max(self.max_connect_ms, connect_seconds * 1000)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get pool occupancy, churn counters and the checkout wait histogram"""
+        wait_counts, wait_sum = self.wait.snapshot()
+        connect_counts, connect_sum = self.connect.snapshot()
+        stats = {
+            "pool_class": type(self.pool).__name__ if self.pool else None,
+            "checkouts": self.checkouts,
+            "checkins": self.checkins,
+            "connects": self.connects,
+            "closes": self.closes,
+            "invalidations": self.invalidations,
+            "timeouts": self.timeouts,
+            "overflow_checkouts": self.overflow_checkouts,
+            "peak_checked_out": self.peak_checked_out,
+            "avg_wait_ms": round(wait_sum * 1000 / sum(wait_counts), 3) if sum(wait_counts) else 0.0,
+            "max_wait_ms": round(self.max_wait_ms, 3),
+            "wait_histogram": self.wait.bucket_counts(),
+            "avg_connect_ms": round(connect_sum * 1000 / sum(connect_counts), 3) if sum(connect_counts) else 0.0,
+            "max_connect_ms": round(self.max_connect_ms, 3)
+        }
+        if isinstance(self.pool, QueuePool):
+            stats.update({
+                "pool_size": self.pool.size(),
+                "max_overflow": self.pool._max_overflow,
+                "checked_out": self.pool.checkedout(),
+                "checked_in": self.pool.checkedin(),
+                "overflow": max(self.pool.overflow(), 0)
+            })
+        return stats
+
+class _TimedCheckoutMixin:
+    """Times how long each checkout waits for a free connection.
+
+    When the pool opens a new connection inside the checkout, the connect
+    time is reported separately and left out of the wait.
+    """
+
+    def _create_connection(self):
+        start = time.perf_counter()
+        record = super()._create_connection()
+        # Read back by the _do_get that created it
+        record.connect_seconds = time.perf_counter() - start
+        return record
+
+    def _do_get(self):
+        metrics: Optional[PoolMetrics] = getattr(self, "metrics", None)
+        start = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            if metrics:
+                metrics.record_wait(time.perf_counter() - start, timed_out=True)
+            logger.warning(f"Connection pool exhausted: {self.status()}")
+            raise
+        elapsed = time.perf_counter() - start
+        connect_seconds = record.__dict__.pop("connect_seconds", None)
+        if metrics:
+            if connect_seconds is not None:
+                metrics.record_connect(connect_seconds)
+                elapsed = max(elapsed - connect_seconds, 0.0)
+            metrics.record_wait(elapsed)
+        return record
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = getattr(self, "metrics", None)
+        if pool.metrics:
+            pool.metrics.pool = pool
+        return pool
+
+class InstrumentedQueuePool(_TimedCheckoutMixin, QueuePool):
+    """QueuePool that reports checkout wait times to PoolMetrics"""
+
+class InstrumentedAsyncAdaptedQueuePool(_TimedCheckoutMixin, AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that reports checkout wait times to PoolMetrics"""
@@ -0,0 +1,85 @@
+import base64
+import json
+import logging
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Sequence, Tuple, Type
+
+import numpy as np
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # The stdlib encoder is used instead
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+JSON_ENCODERS = ("orjson", "json")
+
+def _default(value: Any) -> Any:
+    """Encode the types the API sends that JSON has no native form for"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        # Stored EKG waveforms, as VitalsResponse sends them
+        return base64.b64encode(value).decode("ascii")
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _resolve_encoder() -> str:
+    encoder = os.getenv("JSON_ENCODER", "orjson" if orjson else "json")
+    if encoder not in JSON_ENCODERS:
+        raise ValueError(f"Unknown JSON encoder: {encoder}")
+    if encoder == "orjson" and orjson is None:
+        logger.warning("JSON_ENCODER=orjson but orjson is not installed; using the json module")
+        encoder = "json"
+    return encoder
+
+JSON_ENCODER = _resolve_encoder()
+
+if JSON_ENCODER == "orjson":
+    # Patient-keyed dicts have int keys; numpy arrays are written natively
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(value: Any) -> bytes:
+        """Encode a value as UTF-8 JSON"""
+        return orjson.dumps(value, default=_default, option=_ORJSON_OPTIONS)
+
+    def dumps_text(value: Any) -> str:
+        """Encode a value as a JSON string, e.g. for a WebSocket text frame"""
+        return orjson.dumps(value, default=_default, option=_ORJSON_OPTIONS).decode()
+
+    loads = orjson.loads
+else:
+    def dumps(value: Any) -> bytes:
+        """Encode a value as UTF-8 JSON"""
+        return json.dumps(value, default=_default, separators=(",", ":")).encode()
+
+    def dumps_text(value: Any) -> str:
+        """Encode a value as a JSON string, e.g. for a WebSocket text frame"""
+        return json.dumps(value, default=_default, separators=(",", ":"))
+
+    loads = json.loads
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with the configured encoder"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def response_columns(orm_model: Any, response_model: Type[BaseModel]) -> Tuple[List[str], List[Any]]:
+    """Field names of a response model and the matching ORM columns, in the same order"""
+    fields = list(response_model.model_fields)
+    return fields, [getattr(orm_model, field) for field in fields]
+
+def rows_to_dicts(fields: Sequence[str], rows: Iterable[Sequence[Any]]) -> List[Dict[str, Any]]:
+    """Turn raw row tuples into dicts ready for FastJSONResponse, with no model objects"""
+    return [dict(zip(fields, row)) for row in rows]
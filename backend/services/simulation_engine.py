@@ -1,7 +1,9 @@
 import asyncio
 import json
 import logging
+import os
 import random
+import time
 import numpy as np
 from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
@@ -12,16 +14,67 @@ from models.vitals import Vitals, VitalsCreate
 from database import SessionLocal
 from services.classification_engine import ClassificationEngine
 from services.websocket_manager import WebSocketManager
+from services.vitals_writer import VitalsWriter
+from services.ekg_codec import encode_waveform
+from services.tick_scheduler import TickScheduler
+from services.vitals_generator import VitalsGenerator, EKG_SAMPLES
+from services.ekg_detector import MIN_RHYTHM_SAMPLE_RATE, StreamingEkgDetector
+from services.trend_classifier import TrendClassifier
+from services.classification_engine import VITAL_SIGNS, STATUS_NAMES
+from services.metrics import REGISTRY
 
 logger = logging.getLogger(__name__)
 
+TICK_SECONDS = REGISTRY.histogram("kpum_simulation_tick_seconds", "Wall time of one simulation tick")
+TICK_STAGE_SECONDS = REGISTRY.histogram(
+    "kpum_simulation_stage_seconds", "Wall time of each stage of a simulation tick", ["stage"]
+)
+SIMULATION_ERRORS = REGISTRY.counter("kpum_simulation_errors", "Simulation ticks that raised an exception")
+_TICK_STAGE_METRICS = {
+    stage: TICK_STAGE_SECONDS.labels(stage) for stage in ("generate", "ekg", "classify", "build", "store", "broadcast")
+}
+
 class SimulationEngine:
-    def __init__(self, classification_engine: ClassificationEngine, websocket_manager: WebSocketManager):
+    # Whether this engine runs ticks itself; the sharded engine leaves that to its workers
+    runs_ticks = True
+    
+    def __init__(self, classification_engine: ClassificationEngine, websocket_manager: WebSocketManager,
+                 patient_ids: Optional[List[int]] = None, seed: Optional[int] = None):
         self.classification_engine = classification_engine
         self.websocket_manager = websocket_manager
+        # Number of simulated beds, and optionally the slice of patients this engine owns
+        self.patient_count = int(os.getenv("SIMULATION_PATIENTS", "30"))
+        self.patient_ids = patient_ids
         self.patients: List[Patient] = []
+        # Seed for the vitals generator; set it to make runs reproducible
+        seed_env = os.getenv("SIMULATION_SEED")
+        self.seed = seed if seed is not None else (int(seed_env) if seed_env else None)
+        # Draws for one-off readings outside the ward generator (_generate_vitals)
+        self.rng = np.random.default_rng(self.seed)
+        self.vitals_generator: Optional[VitalsGenerator] = None
+        # medical_conditions per patient, for condition-specific thresholds
+        self.patient_conditions: List[Optional[str]] = []
+        # Seconds between ticks; sub-second rates are supported
+        self.tick_interval = float(os.getenv("SIMULATION_INTERVAL", "3"))
+        # EKG samples per second; 0 keeps the 50-samples-per-tick demo waveform
+        self.ekg_sample_rate = float(os.getenv("EKG_SAMPLE_RATE", "0"))
+        self.ekg_detector: Optional[StreamingEkgDetector] = None
+        # Windowed, hysteretic status on top of the per-reading classification
+        self.trend_classifier: Optional[TrendClassifier] = None
+        # Status codes broadcast on the previous tick, to detect transitions
+        self.previous_status: Optional[np.ndarray] = None
+        self.scheduler: Optional[TickScheduler] = None
+        self.vitals_writer: Optional[VitalsWriter] = None
+        if self.runs_ticks:
+            self.scheduler = TickScheduler(
+                self.tick_interval,
+                overrun_policy=os.getenv("SIMULATION_OVERRUN_POLICY", "skip")
+            )
+            self.vitals_writer = VitalsWriter(on_flush=self.update_latest_vitals)
         self.is_running = False
         self.simulation_task: Optional[asyncio.Task] = None
+        # Most recent persisted vitals row per patient, served by /api/vitals/latest
+        self.latest_vitals: Dict[int, Dict[str, Any]] = {}
         
         # Patient names for realistic simulation
         self.first_names = [
@@ -60,6 +113,24 @@ class SimulationEngine:
         
         # Initialize patients if not already done
         await self._initialize_patients()
+        self.vitals_generator = VitalsGenerator(
+            self.patients, seed=self.seed,
+            ekg_sample_rate=self.ekg_sample_rate or None, tick_interval=self.tick_interval
+        )
+        self.ekg_detector = StreamingEkgDetector(
+            len(self.patients), self.ekg_sample_rate or EKG_SAMPLES / self.tick_interval
+        )
+        if not self.ekg_detector.track_rhythm:
+            logger.warning(
+                f"EKG is sampled at {self.ekg_detector.sample_rate:.1f} Hz, below the "
+                f"{MIN_RHYTHM_SAMPLE_RATE:g} Hz rhythm detection needs: only spikes are flagged, "
+                f"not irregular rhythm or asystole. Set EKG_SAMPLE_RATE=250 to enable them"
+            )
+        self.patient_conditions = [patient.medical_conditions for patient in self.patients]
+        self.trend_classifier = TrendClassifier(len(self.patients), self.tick_interval)
+        self.previous_status = None
+        
+        await self.vitals_writer.start()
         
         self.is_running = True
         self.simulation_task = asyncio.create_task(self._simulation_loop())
@@ -74,22 +145,35 @@ class SimulationEngine:
                 await self.simulation_task
             except asyncio.CancelledError:
                 pass
+        await self.vitals_writer.stop()
         logger.info("Vital signs simulation stopped")
     
     async def _initialize_patients(self):
-        """Initialize 30 patients in the database"""
+        """Initialize the simulated patients in the database"""
+        # The sync session would block the event loop, so it runs in a thread
+        await asyncio.to_thread(self._load_or_create_patients)
+    
+    def _load_or_create_patients(self):
         db = SessionLocal()
         try:
+            # An engine that owns a slice of patients only loads that slice
+            if self.patient_ids is not None:
+                self.patients = db.query(Patient).filter(
+                    Patient.id.in_(self.patient_ids)
+                ).order_by(Patient.id).all()
+                logger.info(f"Using {len(self.patients)} assigned patients")
+                return
+            
             # Check if patients already exist
             existing_patients = db.query(Patient).count()
-            if existing_patients >= 30:
-                self.patients = db.query(Patient).limit(30).all()
+            if existing_patients >= self.patient_count:
+                self.patients = db.query(Patient).order_by(Patient.id).limit(self.patient_count).all()
                 logger.info(f"Using existing {len(self.patients)} patients")
                 return
             
-            # Create 30 new patients
-            logger.info("Creating 30 new patients...")
-            for i in range(30):
+            # Create the missing patients
+            logger.info(f"Creating {self.patient_count - existing_patients} new patients...")
+            for i in range(existing_patients, self.patient_count):
                 if i == 0:  # Patient 1 - Critical (Heart Attack)
                     patient_data = {
                         "name": f"{random.choice(self.first_names)} {random.choice(self.last_names)}",
@@ -129,7 +213,7 @@ class SimulationEngine:
                 db.add(patient)
             
             db.commit()
-            self.patients = db.query(Patient).limit(30).all()
+            self.patients = db.query(Patient).order_by(Patient.id).limit(self.patient_count).all()
             logger.info(f"Created {len(self.patients)} patients")
             
         except Exception as e:
@@ -160,20 +244,49 @@ class SimulationEngine:
         }
     
     async def _simulation_loop(self):
-        """Main simulation loop that generates vitals every second"""
+        """Main simulation loop that generates vitals on a fixed-rate schedule"""
         while self.is_running:
+            deadline = await self.scheduler.wait_for_next_tick()
+            tick_start = mark = time.perf_counter()
             try:
-                # Generate vitals for all patients
+                # Generate and classify the whole ward at once
                 vitals_data = {}
+                vitals_rows = []
+                # Rows carry the tick they were scheduled for, not when the loop got to them
+                tick_time = self.scheduler.deadline_time(deadline)
+                values, ekg = self.vitals_generator.generate_tick()
+                mark = self._observe_stage("generate", mark)
+                # The detector carries R-peak and RR state from tick to tick
+                ekg_analysis = self.ekg_detector.process(ekg)
+                mark = self._observe_stage("ekg", mark)
+                results = self.classification_engine.classify_batch(
+                    values, ekg_critical=ekg_analysis.critical,
+                    patient_ids=self.vitals_generator.patient_ids, conditions=self.patient_conditions
+                )
+                trend = self.trend_classifier.update(values, results.status_codes)
+                changed = self._changed_statuses(trend.status_codes)
+                status_changes = []
+                mark = self._observe_stage("classify", mark)
                 
-                for patient in self.patients:
-                    vitals = self._generate_vitals(patient)
+                for i, (patient, readings) in enumerate(zip(self.patients, values.tolist())):
+                    vitals = dict(zip(VITAL_SIGNS, readings))
+                    vitals["ekg_data"] = ekg[i]
+                    status, reason, recommended_action = trend.result(i, results)
                     
-                    # Classify the vitals
-                    status, reason, recommended_action = self.classification_engine.classify_vitals(vitals)
+                    # Collect the row for this tick's batched insert
+                    vitals_rows.append(self._build_vitals_row(
+                        patient.id, vitals, status, reason, recommended_action, tick_time
+                    ))
                     
-                    # Store vitals in database
-                    await self._store_vitals(patient.id, vitals, status, reason, recommended_action)
+                    if i in changed:
+                        status_changes.append({
+                            "patient_id": patient.id,
+                            "room_id": patient.room_id,
+                            "previous_status": changed[i],
+                            "status": status,
+                            "reason": reason,
+                            "recommended_action": recommended_action
+                        })
                     
                     # Prepare data for WebSocket broadcast
                     vitals_data[patient.id] = {
@@ -183,167 +296,87 @@ class SimulationEngine:
                         "vitals": vitals,
                         "status": status,
                         "reason": reason,
-                        "recommended_action": recommended_action
+                        "recommended_action": recommended_action,
+                        "ews_score": int(trend.ews[i])
                     }
                 
-                # Broadcast to all connected clients
-                await self.websocket_manager.broadcast_vitals(vitals_data)
+                mark = self._observe_stage("build", mark)
+                
+                # Hand the whole tick to the background writer
+                await self._store_vitals(vitals_rows)
+                mark = self._observe_stage("store", mark)
+                
+                # Transitions go out first: they are what pagers and wall displays wait for
+                for change in status_changes:
+                    await self.websocket_manager.broadcast_patient_status(**change)
                 
-                # Wait 3 seconds before next update
-                await asyncio.sleep(3)
+                # Broadcast to all connected clients
+                await self.websocket_manager.broadcast_vitals(vitals_data, generated_at=tick_time.timestamp())
+                self._observe_stage("broadcast", mark)
+                TICK_SECONDS.observe(time.perf_counter() - tick_start)
                 
-            except Exception as e:
-                logger.error(f"Error in simulation loop: {e}")
-                await asyncio.sleep(1)
+            except Exception:
+                SIMULATION_ERRORS.inc()
+                logger.exception("Error in simulation loop")
     
-    def _generate_vitals(self, patient: Patient) -> Dict[str, float]:
-        """Generate realistic vital signs for a patient"""
-        
-        # Create specific critical and watch conditions for demonstration
-        if patient.id == 1:  # Patient 1 - Critical (Heart Attack)
-            hr = random.uniform(110, 130)  # High heart rate
-            systolic = random.uniform(180, 200)  # Very high BP
-            diastolic = random.uniform(100, 120)  # High diastolic
-            rr = random.uniform(25, 30)  # High respiratory rate
-            spo2 = random.uniform(85, 90)  # Low oxygen
-            temp = random.uniform(37.8, 38.5)  # Elevated temperature
-            ekg_data = self._generate_critical_ekg_data()
-            
-        elif patient.id == 2:  # Patient 2 - Watch (Hypertension)
-            hr = random.uniform(95, 110)  # Elevated heart rate
-            systolic = random.uniform(160, 180)  # High systolic
-            diastolic = random.uniform(95, 105)  # High diastolic
-            rr = random.uniform(20, 25)  # Elevated respiratory rate
-            spo2 = random.uniform(92, 95)  # Slightly low oxygen
-            temp = random.uniform(37.2, 37.8)  # Slightly elevated
-            ekg_data = self._generate_normal_ekg_data()
-            
-        elif patient.id == 3:  # Patient 3 - Watch (Respiratory Distress)
-            hr = random.uniform(95, 110)  # Elevated heart rate
-            systolic = random.uniform(150, 170)  # Elevated systolic
-            diastolic = random.uniform(85, 95)  # Normal diastolic
-            rr = random.uniform(25, 30)  # High respiratory rate
-            spo2 = random.uniform(88, 92)  # Low oxygen
-            temp = random.uniform(37.8, 38.5)  # Elevated temperature
-            ekg_data = self._generate_normal_ekg_data()
-            
-        elif patient.id == 4:  # Patient 4 - Watch (Sepsis)
-            hr = random.uniform(100, 115)  # High heart rate
-            systolic = random.uniform(90, 110)  # Low systolic
-            diastolic = random.uniform(50, 65)  # Low diastolic
-            rr = random.uniform(22, 28)  # High respiratory rate
-            spo2 = random.uniform(90, 94)  # Low oxygen
-            temp = random.uniform(38.5, 39.0)  # High fever
-            ekg_data = self._generate_normal_ekg_data()
-            
-        else:  # Normal patients
-            # Base values with some randomness
-            base_hr = random.randint(65, 85)
-            base_systolic = random.randint(110, 130)
-            base_diastolic = random.randint(70, 85)
-            base_rr = random.randint(14, 18)
-            base_spo2 = random.uniform(96.0, 99.0)
-            base_temp = random.uniform(36.8, 37.2)
-            
-            # Add some variation based on patient characteristics
-            if "Heart Disease" in (patient.medical_conditions or ""):
-                base_hr += random.randint(-10, 15)
-                base_systolic += random.randint(-5, 20)
-            
-            if "COPD" in (patient.medical_conditions or ""):
-                base_rr += random.randint(2, 6)
-                base_spo2 -= random.uniform(1.0, 3.0)
-            
-            if "Diabetes" in (patient.medical_conditions or ""):
-                base_temp += random.uniform(0.2, 0.8)
-            
-            # Add random noise
-            hr = base_hr + random.uniform(-5, 5)
-            systolic = base_systolic + random.uniform(-8, 8)
-            diastolic = base_diastolic + random.uniform(-5, 5)
-            rr = base_rr + random.uniform(-2, 2)
-            spo2 = base_spo2 + random.uniform(-1, 1)
-            temp = base_temp + random.uniform(-0.3, 0.3)
-            ekg_data = self._generate_normal_ekg_data()
-        
+    def _observe_stage(self, stage: str, since: float) -> float:
+        """Record the time since the previous stage ended and return the new mark"""
+        now = time.perf_counter()
+        _TICK_STAGE_METRICS[stage].observe(now - since)
+        return now
+    
+    def _changed_statuses(self, status_codes: np.ndarray) -> Dict[int, str]:
+        """Map patient index -> previous status name for patients whose status changed"""
+        previous, self.previous_status = self.previous_status, status_codes
+        if previous is None:
+            return {}
+        return {int(i): STATUS_NAMES[previous[i]] for i in np.flatnonzero(status_codes != previous)}
+    
+    def _generate_vitals(self, patient: Patient) -> Dict[str, Any]:
+        """Generate realistic vital signs for a single patient from the engine's seeded stream"""
+        values, ekg = VitalsGenerator([patient], seed=self.rng).generate_tick()
+        vitals = dict(zip(VITAL_SIGNS, values[0].tolist()))
+        vitals["ekg_data"] = ekg[0]
+        return vitals
+    
+    def _build_vitals_row(self, patient_id: int, vitals: Dict[str, float], status: str,
+                          reason: str, recommended_action: str, timestamp: datetime) -> Dict[str, Any]:
+        """Build a vitals row for bulk insertion"""
         return {
-            "heart_rate": max(40, min(180, hr)),
-            "systolic_bp": max(70, min(200, systolic)),
-            "diastolic_bp": max(40, min(120, diastolic)),
-            "respiratory_rate": max(8, min(30, rr)),
-            "oxygen_saturation": max(85, min(100, spo2)),
-            "temperature": max(35.5, min(39.0, temp)),
-            "ekg_data": ekg_data
+            "patient_id": patient_id,
+            "timestamp": timestamp,
+            "heart_rate": vitals["heart_rate"],
+            "systolic_bp": vitals["systolic_bp"],
+            "diastolic_bp": vitals["diastolic_bp"],
+            "respiratory_rate": vitals["respiratory_rate"],
+            "oxygen_saturation": vitals["oxygen_saturation"],
+            "temperature": vitals["temperature"],
+            "ekg_data": encode_waveform(vitals["ekg_data"]),
+            "status": status,
+            "classification_reason": reason,
+            "recommended_action": recommended_action
         }
     
-    def _generate_normal_ekg_data(self) -> str:
-        """Generate normal EKG waveform data"""
-        # Generate 50 data points representing EKG waveform
-        t = np.linspace(0, 2*np.pi, 50)
-        
-        # Normal sinus rhythm with some noise
-        signal = np.sin(t) + 0.3 * np.sin(3*t) + 0.1 * np.random.randn(50)
-        
-        # Occasionally add minor arrhythmia patterns
-        if random.random() < 0.05:  # 5% chance of minor arrhythmia
-            # Add irregular beats
-            arrhythmia_points = random.sample(range(50), 3)
-            for point in arrhythmia_points:
-                signal[point] += random.uniform(-1, 1)
-        
-        # Convert to string format
-        return ",".join([f"{val:.3f}" for val in signal])
+    async def _store_vitals(self, vitals_rows: List[Dict[str, Any]]):
+        """Queue one tick of vitals rows for batched persistence"""
+        await self.vitals_writer.submit(vitals_rows)
     
-    def _generate_critical_ekg_data(self) -> str:
-        """Generate critical EKG waveform data (arrhythmia)"""
-        # Generate 50 data points representing EKG waveform
-        t = np.linspace(0, 2*np.pi, 50)
-        
-        # Normal sinus rhythm base
-        signal = np.sin(t) + 0.3 * np.sin(3*t)
-        
-        # Add severe arrhythmia patterns (ST elevation, irregular beats)
-        arrhythmia_points = random.sample(range(50), 8)
-        for point in arrhythmia_points:
-            signal[point] += random.uniform(-2, 2)  # Large variations
-        
-        # Add ST elevation (heart attack pattern)
-        st_elevation_points = range(20, 30)
-        for point in st_elevation_points:
-            signal[point] += 1.5  # ST elevation
-        
-        # Add noise
-        signal += 0.2 * np.random.randn(50)
-        
-        return ",".join([f"{val:.3f}" for val in signal])
+    def update_latest_vitals(self, vitals_rows: List[Dict[str, Any]]):
+        """Record the newest persisted row for each patient; also the flush hook for ingest"""
+        for row in vitals_rows:
+            # Backfilled or out-of-order rows must not replace a newer reading
+            current = self.latest_vitals.get(row["patient_id"])
+            if current is None or row["timestamp"] >= current["timestamp"]:
+                self.latest_vitals[row["patient_id"]] = row
     
-    async def _store_vitals(self, patient_id: int, vitals: Dict[str, float], 
-                           status: str, reason: str, recommended_action: str):
-        """Store vitals data in database"""
-        db = SessionLocal()
-        try:
-            vitals_record = Vitals(
-                patient_id=patient_id,
-                heart_rate=vitals["heart_rate"],
-                systolic_bp=vitals["systolic_bp"],
-                diastolic_bp=vitals["diastolic_bp"],
-                respiratory_rate=vitals["respiratory_rate"],
-                oxygen_saturation=vitals["oxygen_saturation"],
-                temperature=vitals["temperature"],
-                ekg_data=vitals["ekg_data"],
-                status=status,
-                classification_reason=reason,
-                recommended_action=recommended_action
-            )
-            
-            db.add(vitals_record)
-            db.commit()
-            
-        except Exception as e:
-            logger.error(f"Error storing vitals: {e}")
-            db.rollback()
-        finally:
-            db.close()
+    def get_patient_trend(self, patient_id: int) -> Optional[Dict[str, Any]]:
+        """Rolling mean and slope of each vital for a simulated patient, or None"""
+        if self.trend_classifier is None:
+            return None
+        for i, patient in enumerate(self.patients):
+            if patient.id == patient_id:
+                return self.trend_classifier.patient_trend(i)
+        return None
     
     def get_patient_status_summary(self) -> Dict[str, int]:
         """Get summary of patient statuses"""
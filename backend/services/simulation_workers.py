@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import time
+from typing import Dict, List, Any, Optional
+
+# Worker processes do not import main.py, so register every model the
+# Patient relationships refer to before the mappers are configured
+import models.treatment  # noqa: F401
+import models.dispatch  # noqa: F401
+from services.classification_engine import ClassificationEngine
+from services.simulation_engine import SimulationEngine
+from services.metrics import REGISTRY, with_labels
+from services.websocket_manager import WebSocketManager
+
+logger = logging.getLogger(__name__)
+
+# Seconds between metrics snapshots sent from each worker to the API process
+WORKER_METRICS_INTERVAL = 1.0
+
+class ShardPublisher:
+    """Stands in for WebSocketManager inside a worker and forwards to the API process"""
+
+    def __init__(self, worker_id: int, out_queue: multiprocessing.Queue):
+        self.worker_id = worker_id
+        self.out_queue = out_queue
+
+    async def broadcast_vitals(self, vitals_data: Dict[str, Any], generated_at: Optional[float] = None):
+        """Publish one tick of this shard's vitals"""
+        self.out_queue.put(("vitals", self.worker_id, (vitals_data, generated_at)))
+
+    async def broadcast_patient_status(self, **change):
+        """Publish one status transition as soon as the shard detects it"""
+        self.out_queue.put(("status", self.worker_id, change))
+
+    def publish_persisted(self, vitals_rows: List[Dict[str, Any]]):
+        """Publish rows the shard has written, ids included"""
+        self.out_queue.put(("persisted", self.worker_id, vitals_rows))
+
+    def publish_metrics(self, stats: Dict[str, Any]):
+        """Publish this worker's metrics and /api/status statistics to the API process"""
+        self.out_queue.put(("metrics", self.worker_id, (REGISTRY.snapshot(), stats)))
+
+class ShardSimulationEngine(SimulationEngine):
+    """SimulationEngine for one worker process and its slice of patients"""
+
+    def update_latest_vitals(self, vitals_rows: List[Dict[str, Any]]):
+        super().update_latest_vitals(vitals_rows)
+        self.websocket_manager.publish_persisted(vitals_rows)
+
+def run_simulation_worker(worker_id: int, patient_ids: List[int], out_queue: multiprocessing.Queue,
+                          stop_event: multiprocessing.Event, seed: Optional[int] = None):
+    """Process entry point: generate, classify and persist vitals for one shard"""
+    logging.basicConfig(level=logging.INFO)
+
+    async def run():
+        classification_engine = ClassificationEngine()
+        await classification_engine.start_rule_watcher()
+        engine = ShardSimulationEngine(
+            classification_engine=classification_engine,
+            websocket_manager=ShardPublisher(worker_id, out_queue),
+            patient_ids=patient_ids,
+            seed=seed
+        )
+        await engine.start_simulation()
+        last_metrics = 0.0
+        while not stop_event.is_set():
+            await asyncio.sleep(0.2)
+            if time.monotonic() - last_metrics >= WORKER_METRICS_INTERVAL:
+                engine.websocket_manager.publish_metrics({
+                    "patients": len(engine.patients),
+                    "scheduler": engine.scheduler.get_stats(),
+                    "vitals_writer": engine.vitals_writer.get_stats()
+                })
+                last_metrics = time.monotonic()
+        await engine.stop_simulation()
+        await classification_engine.stop_rule_watcher()
+
+    asyncio.run(run())
+
+class ShardedSimulationEngine(SimulationEngine):
+    """Runs the simulation in worker processes that each own a slice of patients.
+
+    The API process keeps the patient list, merges each tick from every shard
+    into one ward update for WebSocket fan-out, and keeps the latest-vitals map
+    current from the rows the shards report as persisted. It has no scheduler
+    or vitals writer of its own; the workers report theirs.
+    """
+
+    runs_ticks = False
+
+    def __init__(self, classification_engine: ClassificationEngine, websocket_manager: WebSocketManager,
+                 worker_count: Optional[int] = None):
+        super().__init__(classification_engine, websocket_manager)
+        self.worker_count = worker_count or int(os.getenv("SIMULATION_WORKERS", "2"))
+        self.context = multiprocessing.get_context("spawn")
+        self.out_queue = self.context.Queue()
+        self.stop_event = self.context.Event()
+        self.workers: List[multiprocessing.Process] = []
+        self.worker_ids: List[int] = []
+        # Latest metrics snapshot from each worker, exposed with a worker label
+        self.worker_metrics: Dict[int, Any] = {}
+        # Latest scheduler and vitals writer statistics from each worker
+        self.worker_stats: Dict[int, Dict[str, Any]] = {}
+        REGISTRY.register_collector(self._worker_metric_families)
+
+    async def start_simulation(self):
+        """Create patients, then start one worker process per shard"""
+        if self.is_running:
+            logger.warning("Simulation already running")
+            return
+
+        await self._initialize_patients()
+        patient_ids = [patient.id for patient in self.patients]
+
+        self.stop_event.clear()
+        for worker_id in range(self.worker_count):
+            shard = patient_ids[worker_id::self.worker_count]
+            if not shard:
+                continue
+            process = self.context.Process(
+                target=run_simulation_worker,
+                # Distinct but reproducible stream per shard
+                args=(worker_id, shard, self.out_queue, self.stop_event,
+                      None if self.seed is None else self.seed + worker_id),
+                name=f"simulation-worker-{worker_id}",
+                daemon=True
+            )
+            process.start()
+            self.workers.append(process)
+            self.worker_ids.append(worker_id)
+
+        self.is_running = True
+        self.simulation_task = asyncio.create_task(self._simulation_loop())
+        logger.info(f"Sharded simulation started with {len(self.workers)} workers for {len(patient_ids)} patients")
+
+    async def stop_simulation(self):
+        """Stop the merge loop and the worker processes"""
+        self.is_running = False
+        self.stop_event.set()
+        if self.simulation_task:
+            self.simulation_task.cancel()
+            try:
+                await self.simulation_task
+            except asyncio.CancelledError:
+                pass
+        for process in self.workers:
+            await asyncio.to_thread(process.join, 10)
+            if process.is_alive():
+                logger.warning(f"{process.name} did not stop, terminating")
+                process.terminate()
+        self.workers = []
+        self.worker_ids = []
+        logger.info("Sharded simulation stopped")
+
+    async def _simulation_loop(self):
+        """Merge shard ticks and broadcast one ward update per tick"""
+        loop = asyncio.get_running_loop()
+        pending: Dict[int, Dict[str, Any]] = {}
+        first_pending_at = 0.0
+        active_shards = len(self.workers)
+
+        while self.is_running:
+            try:
+                kind, worker_id, payload = await loop.run_in_executor(None, self.out_queue.get, True, 0.5)
+            except queue.Empty:
+                kind = None
+            except Exception as e:
+                logger.error(f"Error reading from simulation workers: {e}")
+                continue
+
+            if kind == "persisted":
+                self.update_latest_vitals(payload)
+            elif kind == "metrics":
+                self.worker_metrics[worker_id], self.worker_stats[worker_id] = payload
+            elif kind == "status":
+                try:
+                    await self.websocket_manager.broadcast_patient_status(**payload)
+                except Exception as e:
+                    logger.error(f"Error broadcasting status change: {e}")
+            elif kind == "vitals":
+                if worker_id in pending:
+                    # This shard is a tick ahead of a slower one; send what has
+                    # arrived rather than overwrite its earlier tick
+                    await self._broadcast_merged(pending, complete=False)
+                    pending = {}
+                if not pending:
+                    first_pending_at = time.monotonic()
+                pending[worker_id] = payload
+
+            # Broadcast once every shard has reported, or when a shard is late
+            stale = pending and time.monotonic() - first_pending_at > 2 * self.tick_interval
+            if pending and (len(pending) >= active_shards or stale):
+                await self._broadcast_merged(pending, complete=len(pending) >= active_shards)
+                pending = {}
+
+            if stale:
+                dead = [p.name for p in self.workers if not p.is_alive()]
+                if dead:
+                    logger.error(f"Simulation workers not running: {', '.join(dead)}")
+
+    async def _broadcast_merged(self, pending: Dict[int, Any], complete: bool):
+        """Broadcast the shard ticks received so far as one update.
+
+        An incomplete merge is sent as partial, so the missing shards'
+        patients keep their last known state instead of disappearing.
+        """
+        vitals_data = {}
+        for shard_data, _ in pending.values():
+            vitals_data.update(shard_data)
+        # Staleness is measured from the oldest shard's readings
+        stamps = [stamp for _, stamp in pending.values() if stamp]
+        try:
+            await self.websocket_manager.broadcast_vitals(
+                vitals_data, partial=not complete, generated_at=min(stamps, default=None)
+            )
+        except Exception as e:
+            logger.error(f"Error broadcasting merged vitals: {e}")
+
+    def _worker_metric_families(self):
+        families = []
+        for worker_id, snapshot in list(self.worker_metrics.items()):
+            families.extend(with_labels(snapshot, worker=str(worker_id)))
+        return families
+
+    def get_worker_stats(self) -> List[Dict[str, Any]]:
+        """Get liveness and the latest scheduler and writer statistics of each worker process"""
+        return [
+            {"name": process.name, "pid": process.pid, "alive": process.is_alive(),
+             **self.worker_stats.get(worker_id, {})}
+            for worker_id, process in zip(self.worker_ids, self.workers)
+        ]
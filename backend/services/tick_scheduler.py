@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
+
+from services.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+OVERRUN_POLICIES = ("skip", "catch_up")
+
+# Upper bounds (seconds) of the tick-lag histogram buckets; +Inf is implicit
+LAG_BUCKETS: Tuple[float, ...] = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+TICK_LAG_SECONDS = REGISTRY.histogram(
+    "kpum_tick_lag_seconds", "How late each tick started after its deadline", buckets=LAG_BUCKETS
+)
+
+class TickScheduler:
+    """Fixed-rate scheduler that targets absolute deadlines.
+
+    Deadlines are ``start + n * interval`` so processing time never shifts the
+    cadence. When a tick's work runs past the next deadline the next tick
+    starts late; if whole periods were missed the scheduler either drops them
+    and serves only the latest deadline ("skip"), or runs the missed ticks back
+    to back until it has caught up ("catch_up", bounded by max_catch_up).
+    """
+
+    def __init__(self, interval: float, overrun_policy: str = "skip", max_catch_up: int = 10):
+        if interval <= 0:
+            raise ValueError("Tick interval must be positive")
+        if overrun_policy not in OVERRUN_POLICIES:
+            raise ValueError(f"Unknown overrun policy: {overrun_policy}")
+        self.interval = interval
+        self.overrun_policy = overrun_policy
+        self.max_catch_up = max_catch_up
+        self.next_deadline: Optional[float] = None
+
+        # Statistics
+        self.tick_count = 0
+        self.overruns = 0
+        self.skipped_ticks = 0
+        # The process has one scheduler, so it owns the registry histogram
+        self.lag = TICK_LAG_SECONDS
+        self.lag_sum_ms = 0.0
+        self.max_lag_ms = 0.0
+
+    async def wait_for_next_tick(self) -> float:
+        """Sleep until the next deadline and return the deadline being served"""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if self.next_deadline is None:
+            self.next_deadline = now
+
+        behind = now - self.next_deadline
+        if behind > 0:
+            # The previous tick ran past this deadline
+            self.overruns += 1
+            missed = int(behind // self.interval)
+            if missed and (self.overrun_policy == "skip" or missed > self.max_catch_up):
+                # Drop the deadlines that passed entirely and serve the latest one now
+                self.next_deadline += missed * self.interval
+                self.skipped_ticks += missed
+                logger.warning(f"Tick overran, skipped {missed} tick(s)")
+
+        delay = self.next_deadline - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        deadline = self.next_deadline
+        self._record_lag((loop.time() - deadline) * 1000)
+        self.next_deadline = deadline + self.interval
+        self.tick_count += 1
+        return deadline
+
+    def deadline_time(self, deadline: float) -> datetime:
+        """Naive local wall-clock time of a deadline returned by wait_for_next_tick"""
+        # Deadlines are on the loop's monotonic clock; anchor to the wall clock now,
+        # so a stepped system clock moves later ticks with it instead of drifting
+        return datetime.fromtimestamp(time.time() - (asyncio.get_running_loop().time() - deadline))
+
+    def _record_lag(self, lag_ms: float):
+        lag_ms = max(lag_ms, 0.0)
+        self.lag.observe(lag_ms / 1000)
+        self.lag_sum_ms += lag_ms
+        self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get tick counts, overrun accounting and the tick-lag histogram"""
+        return {
+            "interval_s": self.interval,
+            "overrun_policy": self.overrun_policy,
+            "ticks": self.tick_count,
+            "overruns": self.overruns,
+            "skipped_ticks": self.skipped_ticks,
+            "avg_lag_ms": round(self.lag_sum_ms / self.tick_count, 2) if self.tick_count else 0.0,
+            "max_lag_ms": round(self.max_lag_ms, 2),
+            "lag_histogram": self.lag.bucket_counts()
+        }
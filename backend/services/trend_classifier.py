@@ -0,0 +1,246 @@
+import logging
+import os
+from typing import Dict, Any, Tuple
+
+import numpy as np
+
+from services.classification_engine import (
+    BatchClassification, VITAL_SIGNS, STATUS_NAMES, STATUS_NORMAL, STATUS_WATCH
+)
+
+logger = logging.getLogger(__name__)
+
+# NEWS2-style scoring: (band edges, score per band) for np.digitize, per vital.
+# Diastolic pressure is not scored.
+EWS_BANDS = {
+    "respiratory_rate": ((9, 12, 21, 25), (3, 1, 0, 2, 3)),
+    "oxygen_saturation": ((92, 94, 96), (3, 2, 1, 0)),
+    "systolic_bp": ((91, 101, 111, 220), (3, 2, 1, 0, 3)),
+    "heart_rate": ((41, 51, 91, 111, 131), (3, 1, 0, 1, 2, 3)),
+    "temperature": ((35.05, 36.05, 38.05, 39.05), (3, 1, 0, 1, 2))
+}
+# An aggregate score this high, or one vital scoring 3 ("red score"), raises
+# a patient to watch even when every reading is inside its threshold range.
+# The score never raises a patient to critical; that stays with the rules.
+EWS_WATCH_SCORE = 5
+EWS_RED_SCORE = 3
+EWS_ACTION = "Urgent clinical review - Increase monitoring frequency"
+
+# Change across a full window, from its least-squares slope, that raises a
+# patient to watch; the sign is the direction of deterioration. Each is about
+# seven times the fitted change that the simulated ward's per-reading noise
+# produces over the default window, so only a real drift trips it.
+TREND_LIMITS = {
+    "heart_rate": 40.0,
+    "systolic_bp": -45.0,
+    "respiratory_rate": 9.0,
+    "oxygen_saturation": -6.0,
+    "temperature": 1.5
+}
+TREND_ACTION = "Clinical review - Sustained deterioration in vital signs"
+
+class TrendResult:
+    """Trend-aware statuses for one tick, alongside the instantaneous BatchClassification"""
+
+    def __init__(self, classifier: "TrendClassifier", status_codes: np.ndarray, ews: np.ndarray,
+                 ews_scores: np.ndarray, ews_status: np.ndarray, trend_change: np.ndarray,
+                 trend_status: np.ndarray, settle_count: np.ndarray, confirm_count: np.ndarray):
+        self.classifier = classifier
+        self.status_codes = status_codes
+        self.ews = ews
+        self.ews_scores = ews_scores
+        self.ews_status = ews_status
+        self.trend_change = trend_change
+        self.trend_status = trend_status
+        self.settle_count = settle_count
+        self.confirm_count = confirm_count
+
+    def result(self, index: int, batch: BatchClassification) -> Tuple[str, str, str]:
+        """(status, reason, recommended_action) for one patient"""
+        status = int(self.status_codes[index])
+        instant = int(batch.status_codes[index])
+        if status == instant:
+            return batch.result(index)
+
+        name = STATUS_NAMES[status]
+        if status < instant:
+            # The rules already see a higher status; it is waiting for enough
+            # consecutive readings to confirm it
+            reason, recommended_action = batch.reason(index), batch.recommended_action(index)
+            return (
+                name,
+                f"Pending {STATUS_NAMES[instant]}: {reason} ({self.confirm_count[index]} of "
+                f"{self.classifier.escalate_ticks} readings)",
+                recommended_action
+            )
+
+        if self.ews_status[index] >= status:
+            scored = [
+                f"{vital.replace('_', ' ').title()} {score}"
+                for vital, score in zip(EWS_BANDS, self.ews_scores[index].tolist()) if score >= 2
+            ]
+            reason = f"Early warning score {self.ews[index]}" + (f" ({', '.join(scored)})" if scored else "")
+            return name, reason, EWS_ACTION
+
+        if self.trend_status[index] >= status:
+            trending = [
+                f"{vital.replace('_', ' ').title()} {change:+.1f}"
+                for vital, change, limit in zip(TREND_LIMITS, self.trend_change[index].tolist(), TREND_LIMITS.values())
+                if change / limit >= 1
+            ]
+            return (
+                name,
+                f"Sustained trend over {self.classifier.window} readings: {', '.join(trending)}",
+                TREND_ACTION
+            )
+
+        # Held at a higher level until the improvement has lasted long enough
+        return (
+            name,
+            f"Holding {name} status: readings improved for {self.settle_count[index]} of "
+            f"{self.classifier.deescalate_ticks} checks",
+            "Continue close monitoring until readings are stable"
+        )
+
+class TrendClassifier:
+    """Windowed, hysteretic classification for a fixed set of patients.
+
+    Keeps the last `window` readings of every patient in an (N, window, 6)
+    ring buffer with running sums, so rolling means and least-squares slopes
+    are updated in O(1) per reading. Each tick combines the instantaneous
+    status with a NEWS2-style early warning score and, once the window is
+    full, any sustained deterioration trend, then applies hysteresis:
+    escalation needs `escalate_ticks` consecutive readings at the higher
+    level, de-escalation needs `deescalate_ticks`, so a patient hovering at
+    a threshold does not flap between states.
+    """
+
+    def __init__(self, patient_count: int, tick_interval: float, window: int = None,
+                 escalate_ticks: int = None, deescalate_ticks: int = None):
+        self.patient_count = patient_count
+        self.tick_interval = tick_interval
+        self.window = window if window is not None else int(os.getenv("TREND_WINDOW", "20"))
+        self.escalate_ticks = (escalate_ticks if escalate_ticks is not None
+                               else int(os.getenv("STATUS_ESCALATE_TICKS", "1")))
+        self.deescalate_ticks = (deescalate_ticks if deescalate_ticks is not None
+                                 else int(os.getenv("STATUS_DEESCALATE_TICKS", "5")))
+        for setting, value in (("window", self.window), ("escalate_ticks", self.escalate_ticks),
+                               ("deescalate_ticks", self.deescalate_ticks)):
+            if value < 1:
+                raise ValueError(f"{setting} must be at least 1, got {value}")
+
+        shape = (patient_count, len(VITAL_SIGNS))
+        self.buffer = np.zeros((patient_count, self.window, len(VITAL_SIGNS)))
+        self.count = 0
+        self.next_slot = 0
+        # Running sums of x and t*x, with t = 0 for the oldest reading in the window
+        self.sum_x = np.zeros(shape)
+        self.sum_tx = np.zeros(shape)
+
+        self.status = np.full(patient_count, STATUS_NORMAL, dtype=np.uint8)
+        self.pending = np.zeros(patient_count, dtype=np.int64)
+
+        self._ews_columns = [VITAL_SIGNS.index(vital) for vital in EWS_BANDS]
+        self._trend_columns = [VITAL_SIGNS.index(vital) for vital in TREND_LIMITS]
+        self._trend_limits = np.array(list(TREND_LIMITS.values()))
+
+        # Statistics
+        self.suppressed_changes = 0
+        self.status_changes = 0
+
+    def update(self, values: np.ndarray, instant_status: np.ndarray) -> TrendResult:
+        """Add one tick of (N, 6) readings and return the stable statuses"""
+        self._push(values)
+        ews_scores = self._ews_scores(values)
+        ews = ews_scores.sum(axis=1)
+        ews_status = np.where((ews >= EWS_WATCH_SCORE) | (ews_scores >= EWS_RED_SCORE).any(axis=1),
+                              STATUS_WATCH, STATUS_NORMAL)
+        trend_change = self._trend_change()
+        trend_status = np.where((trend_change / self._trend_limits >= 1).any(axis=1), STATUS_WATCH, STATUS_NORMAL)
+        target = np.maximum.reduce([instant_status, ews_status, trend_status]).astype(np.uint8)
+
+        # Hysteresis: count consecutive readings pointing the same way
+        rising = target > self.status
+        falling = target < self.status
+        moving = rising | falling
+        same_direction = np.sign(target.astype(np.int8) - self.status.astype(np.int8)) == np.sign(self.pending)
+        self.pending = np.where(moving, np.where(same_direction, self.pending, 0) + np.where(rising, 1, -1), 0)
+        change = (rising & (self.pending >= self.escalate_ticks)) | (falling & (-self.pending >= self.deescalate_ticks))
+
+        self.suppressed_changes += int((moving & ~change).sum())
+        self.status_changes += int(change.sum())
+        self.status = np.where(change, target, self.status).astype(np.uint8)
+        self.pending[change] = 0
+        settle_count = np.where(falling & ~change, -self.pending, 0)
+        confirm_count = np.where(rising & ~change, self.pending, 0)
+        return TrendResult(self, self.status.copy(), ews, ews_scores, ews_status, trend_change, trend_status,
+                           settle_count, confirm_count)
+
+    def _push(self, values: np.ndarray):
+        """Append a reading per patient and update the running sums"""
+        slot = self.next_slot
+        if self.count < self.window:
+            self.sum_tx += self.count * values
+            self.sum_x += values
+            self.count += 1
+        else:
+            # Dropping the oldest reading shifts every remaining t down by one
+            oldest = self.buffer[:, slot]
+            self.sum_tx += -self.sum_x + oldest + (self.window - 1) * values
+            self.sum_x += values - oldest
+        self.buffer[:, slot] = values
+        self.next_slot = (slot + 1) % self.window
+
+        if self.next_slot == 0 and self.count == self.window:
+            # Once per lap, recompute the sums exactly so rounding never accumulates
+            t = np.arange(self.window)[None, :, None]
+            self.sum_x = self.buffer.sum(axis=1)
+            self.sum_tx = (t * self.buffer).sum(axis=1)
+
+    def _ews_scores(self, values: np.ndarray) -> np.ndarray:
+        scores = np.empty((len(values), len(EWS_BANDS)), dtype=np.int64)
+        for k, (vital, (edges, band_scores)) in enumerate(EWS_BANDS.items()):
+            scores[:, k] = np.asarray(band_scores)[np.digitize(values[:, self._ews_columns[k]], edges)]
+        return scores
+
+    def _trend_change(self) -> np.ndarray:
+        """(N, len(TREND_LIMITS)) fitted change across the window; zero until the window is full"""
+        if self.count < self.window or self.window < 2:
+            return np.zeros((self.patient_count, len(TREND_LIMITS)))
+        return self._slope_per_tick()[:, self._trend_columns] * (self.window - 1)
+
+    def rolling_mean(self) -> np.ndarray:
+        """(N, 6) mean of the readings in the window"""
+        return self.sum_x / max(self.count, 1)
+
+    def _slope_per_tick(self) -> np.ndarray:
+        n = self.count
+        if n < 2:
+            return np.zeros_like(self.sum_x)
+        sum_t = n * (n - 1) / 2
+        sum_tt = (n - 1) * n * (2 * n - 1) / 6
+        return (n * self.sum_tx - sum_t * self.sum_x) / (n * sum_tt - sum_t ** 2)
+
+    def slope_per_minute(self) -> np.ndarray:
+        """(N, 6) least-squares trend of each vital, in units per minute"""
+        return self._slope_per_tick() * 60.0 / self.tick_interval
+
+    def patient_trend(self, index: int) -> Dict[str, Any]:
+        """Rolling mean and slope of each vital for one patient, served by /api/patients/{id}/trend"""
+        mean = self.rolling_mean()[index]
+        slope = self.slope_per_minute()[index]
+        return {
+            vital: {"mean": round(float(mean[k]), 2), "slope_per_min": round(float(slope[k]), 3)}
+            for k, vital in enumerate(VITAL_SIGNS)
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get window configuration and how many status flips hysteresis absorbed"""
+        return {
+            "window": self.window,
+            "readings_in_window": self.count,
+            "escalate_ticks": self.escalate_ticks,
+            "deescalate_ticks": self.deescalate_ticks,
+            "status_changes": self.status_changes,
+            "suppressed_changes": self.suppressed_changes
+        }
@@ -0,0 +1,227 @@
+import argparse
+import csv
+import io
+import logging
+import os
+import time
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import select
+
+from database import engine, async_engine
+from models.vitals import Vitals
+from services.classification_engine import VITAL_SIGNS
+from services.ekg_codec import EKG_SAMPLE_DTYPE, decode_waveform
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Arrow IPC and Parquet need pyarrow; CSV works without it
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("arrow", "parquet", "csv")
+EXPORT_MEDIA_TYPES = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+    "csv": "text/csv"
+}
+EXPORT_COLUMNS = ("id", "patient_id", "timestamp") + tuple(VITAL_SIGNS) + (
+    "status", "classification_reason", "recommended_action", "ekg_data"
+)
+EXPORT_BATCH_ROWS = int(os.getenv("VITALS_EXPORT_BATCH_ROWS", "10000"))
+# Largest batch_size a client may ask for; one batch is held in memory at a time
+MAX_EXPORT_BATCH_ROWS = max(100000, EXPORT_BATCH_ROWS)
+
+def resolve_format(export_format: Optional[str]) -> str:
+    """Pick the export format, defaulting to Parquet when pyarrow is installed"""
+    if export_format is None:
+        return "parquet" if pa else "csv"
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    if export_format != "csv" and pa is None:
+        raise ValueError(f"{export_format} export requires pyarrow; use format=csv or install pyarrow")
+    return export_format
+
+def build_export_query(since: Optional[datetime] = None, until: Optional[datetime] = None,
+                       patient_ids: Optional[Sequence[int]] = None):
+    """Select raw vitals rows in storage order; no ORDER BY, so no sort"""
+    table = Vitals.__table__
+    query = select(*[table.c[column] for column in EXPORT_COLUMNS])
+    if since:
+        query = query.where(table.c.timestamp >= since)
+    if until:
+        query = query.where(table.c.timestamp < until)
+    if patient_ids:
+        query = query.where(table.c.patient_id.in_(list(patient_ids)))
+    return query
+
+def _arrow_schema():
+    fields = [
+        pa.field("id", pa.int64(), nullable=False),
+        pa.field("patient_id", pa.int64(), nullable=False),
+        pa.field("timestamp", pa.timestamp("us"), nullable=False)
+    ]
+    fields += [pa.field(vital, pa.float64(), nullable=False) for vital in VITAL_SIGNS]
+    fields += [
+        pa.field("status", pa.string()),
+        pa.field("classification_reason", pa.string()),
+        pa.field("recommended_action", pa.string()),
+        pa.field("ekg_data", pa.list_(pa.float32()))
+    ]
+    return pa.schema(fields)
+
+def _decode_waveforms(waveforms: List[Optional[bytes]]):
+    """Decode a batch of stored waveforms in one pass.
+
+    Returns (offsets, values, nulls) in the layout of an Arrow list array:
+    row i's samples are values[offsets[i]:offsets[i + 1]].
+    """
+    lengths = np.fromiter(
+        (len(waveform) // EKG_SAMPLE_DTYPE.itemsize if waveform else 0 for waveform in waveforms),
+        dtype=np.int32, count=len(waveforms)
+    )
+    offsets = np.zeros(len(waveforms) + 1, dtype=np.int32)
+    np.cumsum(lengths, out=offsets[1:])
+    values = decode_waveform(b"".join(bytes(waveform) for waveform in waveforms if waveform))
+    nulls = np.fromiter((waveform is None for waveform in waveforms), dtype=bool, count=len(waveforms))
+    return offsets, values, nulls
+
+class _ChunkSink:
+    """Write-only file object whose contents are drained after each batch"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+class VitalsExportWriter:
+    """Writes batches of vitals rows to a binary file object as Arrow, Parquet or CSV"""
+
+    def __init__(self, export_format: str, sink):
+        self.export_format = export_format
+        self.sink = sink
+        self.rows_written = 0
+        if export_format == "arrow":
+            self.writer = pa.ipc.new_stream(sink, _arrow_schema())
+        elif export_format == "parquet":
+            self.writer = pq.ParquetWriter(sink, _arrow_schema())
+        else:
+            self.text = io.StringIO()
+            self.writer = csv.writer(self.text)
+            self.writer.writerow(EXPORT_COLUMNS)
+            self._flush_text()
+
+    def write_rows(self, rows: Sequence[Sequence]):
+        """Write one record batch"""
+        if not rows:
+            return
+        columns = list(zip(*rows))
+        if self.export_format == "csv":
+            self._write_csv(rows)
+        else:
+            self.writer.write_batch(self._record_batch(columns))
+        self.rows_written += len(rows)
+
+    def _record_batch(self, columns):
+        offsets, values, nulls = _decode_waveforms(columns[-1])
+        ekg = pa.ListArray.from_arrays(
+            pa.array(offsets), pa.array(values),
+            mask=pa.array(nulls) if nulls.any() else None
+        )
+        arrays = [pa.array(column) for column in columns[:-1]] + [ekg]
+        return pa.RecordBatch.from_arrays(arrays, schema=_arrow_schema())
+
+    def _write_csv(self, rows):
+        offsets, values, nulls = _decode_waveforms([row[-1] for row in rows])
+        for i, row in enumerate(rows):
+            # CSV has no list type, so samples are space-separated in one cell
+            ekg = "" if nulls[i] else " ".join(f"{sample:.3f}" for sample in values[offsets[i]:offsets[i + 1]])
+            self.writer.writerow(list(row[:-1]) + [ekg])
+        self._flush_text()
+
+    def _flush_text(self):
+        self.sink.write(self.text.getvalue().encode("utf-8"))
+        self.text.seek(0)
+        self.text.truncate()
+
+    def close(self):
+        """Finish the file (Arrow end-of-stream marker, Parquet footer)"""
+        if self.export_format != "csv":
+            self.writer.close()
+
+async def stream_export(export_format: str, query, batch_size: int = EXPORT_BATCH_ROWS) -> AsyncIterator[bytes]:
+    """Stream an export through a server-side cursor, one record batch at a time"""
+    sink = _ChunkSink()
+    writer = VitalsExportWriter(export_format, sink)
+    async with async_engine.connect() as conn:
+        result = await conn.stream(query)
+        async for rows in result.partitions(batch_size):
+            writer.write_rows(rows)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    writer.close()
+    yield sink.drain()
+    logger.info(f"Exported {writer.rows_written} vitals rows as {export_format}")
+
+def export_to_file(export_format: str, path: str, query, batch_size: int = EXPORT_BATCH_ROWS) -> int:
+    """Export to a local file through a server-side cursor; returns the row count"""
+    with open(path, "wb") as sink, engine.connect() as conn:
+        writer = VitalsExportWriter(export_format, sink)
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(query)
+        for rows in result.partitions():
+            writer.write_rows(rows)
+        writer.close()
+    return writer.rows_written
+
+def main():
+    parser = argparse.ArgumentParser(description="Export raw vitals to Arrow IPC, Parquet or CSV")
+    parser.add_argument("output", help="Destination file")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, help="Defaults to parquet, or csv without pyarrow")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Inclusive start, ISO 8601")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="Exclusive end, ISO 8601")
+    parser.add_argument("--patient", type=int, action="append", dest="patient_ids", help="Repeat for several patients")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_ROWS, help="Rows per record batch")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        export_format = resolve_format(args.format)
+    except ValueError as e:
+        parser.error(str(e))
+
+    started = time.perf_counter()
+    rows = export_to_file(export_format, args.output,
+                          build_export_query(args.since, args.until, args.patient_ids), args.batch_size)
+    elapsed = time.perf_counter() - started
+    size_mb = os.path.getsize(args.output) / 1e6
+    logger.info(f"Wrote {rows} rows ({size_mb:.1f} MB) to {args.output} in {elapsed:.1f}s "
+                f"({rows / elapsed if elapsed else 0:.0f} rows/s, {size_mb / elapsed if elapsed else 0:.1f} MB/s)")
+
+if __name__ == "__main__":
+    main()
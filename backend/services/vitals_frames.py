@@ -0,0 +1,145 @@
+import math
+import struct
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+
+from services.classification_engine import VITAL_SIGNS, STATUS_NAMES
+from services.ekg_codec import EKG_SAMPLE_DTYPE, EKG_SCALE, encode_waveform
+
+# WebSocket sub-protocol a client offers on /ws to receive vitals as binary frames
+BINARY_SUBPROTOCOL = "kpum.vitals.v1"
+
+# Binary vitals frame, one per tick, little-endian. Every array starts on a
+# 4-byte boundary so browsers can view it in place with typed arrays:
+#   header: magic "KPVF", version (u8), flags (u8), ekg_samples (u16),
+#           index_version (u32), count (u32), seq (u32), generated_at (f64)
+#   rows:   count uint32 positions in the vitals_index patient list; only with
+#           FLAG_ROWS, otherwise the frame covers positions 0..count-1
+#   vitals: count x 6 float32 in VITAL_SIGNS order, NaN where missing
+#   status: count uint8 codes into STATUS_NAMES, then count uint8 EWS scores
+#           (EWS_MISSING if none), zero-padded to a multiple of 4 bytes
+#   ekg:    count x ekg_samples int16 in the storage encoding of
+#           services/ekg_codec.py, EKG_MISSING past the end of a patient's
+#           waveform; only with FLAG_EKG
+FRAME_MAGIC = b"KPVF"
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct("<4sBBHIIId")
+FLAG_ROWS = 1
+FLAG_EKG = 2
+EWS_MISSING = 255
+EKG_MISSING = int(np.iinfo(EKG_SAMPLE_DTYPE).min)
+
+STATUS_CODES = {name: code for code, name in enumerate(STATUS_NAMES)}
+
+def frame_layout() -> Dict[str, Any]:
+    """What a client needs besides the patient list to decode frames"""
+    return {
+        "frame_version": FRAME_VERSION,
+        "vital_signs": list(VITAL_SIGNS),
+        "status_names": list(STATUS_NAMES),
+        "ekg_scale": EKG_SCALE,
+        "ekg_missing": EKG_MISSING,
+        "ews_missing": EWS_MISSING
+    }
+
+def _reading(value: Any) -> float:
+    return float(value) if value is not None else math.nan
+
+def _waveform_matrix(waveforms: List[Any]) -> Optional[np.ndarray]:
+    """Stack waveforms (arrays in mV or stored bytes) into one int16 matrix"""
+    if all(waveform is None for waveform in waveforms):
+        return None
+    lengths = {len(waveform) for waveform in waveforms if isinstance(waveform, np.ndarray)}
+    if len(lengths) == 1 and all(isinstance(waveform, np.ndarray) for waveform in waveforms):
+        # The simulator's common case: every patient has a waveform of the same length
+        stacked = np.frombuffer(encode_waveform(np.stack(waveforms)), dtype=EKG_SAMPLE_DTYPE)
+        return stacked.reshape(len(waveforms), -1)
+    samples = [
+        np.frombuffer(encode_waveform(waveform) if isinstance(waveform, np.ndarray) else waveform,
+                      dtype=EKG_SAMPLE_DTYPE)
+        if waveform is not None else np.empty(0, dtype=EKG_SAMPLE_DTYPE)
+        for waveform in waveforms
+    ]
+    matrix = np.full((len(samples), max(len(s) for s in samples)), EKG_MISSING, dtype=EKG_SAMPLE_DTYPE)
+    for row, waveform in zip(matrix, samples):
+        row[:len(waveform)] = waveform
+    return matrix
+
+class WardFrame:
+    """One broadcast's vitals as arrays in index order, packed once per subscription"""
+
+    def __init__(self, vitals_data: Dict[Any, Dict[str, Any]], index_rows: Dict[Any, int]):
+        self.patient_ids = sorted(vitals_data, key=index_rows.__getitem__)
+        entries = [vitals_data[patient_id] for patient_id in self.patient_ids]
+        self.rows = np.fromiter((index_rows[p] for p in self.patient_ids), dtype="<u4", count=len(entries))
+        self.values = np.array(
+            [[_reading(entry["vitals"].get(name)) for name in VITAL_SIGNS] for entry in entries],
+            dtype="<f4"
+        ).reshape(len(entries), len(VITAL_SIGNS))
+        self.status = np.fromiter((STATUS_CODES.get(entry.get("status"), 0) for entry in entries),
+                                  dtype=np.uint8, count=len(entries))
+        self.ews = np.fromiter(
+            (EWS_MISSING if entry.get("ews_score") is None else min(int(entry["ews_score"]), EWS_MISSING - 1)
+             for entry in entries),
+            dtype=np.uint8, count=len(entries)
+        )
+        self.ekg = _waveform_matrix([entry["vitals"].get("ekg_data") for entry in entries])
+
+    def positions(self, selection: Sequence[Any]) -> np.ndarray:
+        """Positions in this frame of the selected patients it has"""
+        selection = set(selection)
+        return np.array([i for i, patient_id in enumerate(self.patient_ids) if patient_id in selection], dtype=np.intp)
+
+    def pack(self, seq: int, index_version: int, index_size: int, generated_at: float,
+             positions: Optional[np.ndarray] = None) -> bytes:
+        """Encode the frame, or only the patients at the given positions"""
+        rows, values, status, ews, ekg = self.rows, self.values, self.status, self.ews, self.ekg
+        if positions is not None:
+            rows, values, status, ews = rows[positions], values[positions], status[positions], ews[positions]
+            ekg = ekg[positions] if ekg is not None else None
+        count = len(rows)
+        flags = 0
+        parts = [b""]
+        # Rows are sorted, so covering the whole index means they are 0..count-1
+        if count != index_size:
+            flags |= FLAG_ROWS
+            parts.append(rows.tobytes())
+        parts += [values.tobytes(), status.tobytes(), ews.tobytes(), bytes(-2 * count % 4)]
+        ekg_samples = 0
+        if ekg is not None and ekg.shape[1]:
+            flags |= FLAG_EKG
+            ekg_samples = ekg.shape[1]
+            parts.append(ekg.tobytes())
+        parts[0] = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, flags, ekg_samples,
+                                     index_version, count, seq, generated_at)
+        return b"".join(parts)
+
+def unpack_frame(body: bytes) -> Dict[str, Any]:
+    """Decode a frame into numpy arrays, for tests and tools"""
+    magic, version, flags, ekg_samples, index_version, count, seq, generated_at = FRAME_HEADER.unpack_from(body)
+    if magic != FRAME_MAGIC or version != FRAME_VERSION:
+        raise ValueError("Not a version 1 vitals frame")
+    offset = FRAME_HEADER.size
+    rows = None
+    if flags & FLAG_ROWS:
+        rows = np.frombuffer(body, dtype="<u4", count=count, offset=offset)
+        offset += 4 * count
+    values = np.frombuffer(body, dtype="<f4", count=count * len(VITAL_SIGNS), offset=offset)
+    offset += values.nbytes
+    status = np.frombuffer(body, dtype=np.uint8, count=count, offset=offset)
+    ews = np.frombuffer(body, dtype=np.uint8, count=count, offset=offset + count)
+    offset += 2 * count + (-2 * count % 4)
+    ekg = None
+    if flags & FLAG_EKG:
+        ekg = np.frombuffer(body, dtype=EKG_SAMPLE_DTYPE, count=count * ekg_samples, offset=offset)
+        ekg = ekg.reshape(count, ekg_samples)
+    return {
+        "index_version": index_version,
+        "seq": seq,
+        "generated_at": generated_at,
+        "rows": rows if rows is not None else np.arange(count, dtype="<u4"),
+        "vitals": values.reshape(count, len(VITAL_SIGNS)),
+        "status": status,
+        "ews": ews,
+        "ekg": ekg
+    }
@@ -0,0 +1,152 @@
+import logging
+from typing import List, Optional, Tuple, Union
+import numpy as np
+
+from models.patient import Patient
+from services.classification_engine import VITAL_SIGNS
+
+logger = logging.getLogger(__name__)
+
+# Per-vital (low, high) ranges, ordered by VITAL_SIGNS
+# Demonstration scenarios pinned to the first four patient ids
+SCENARIO_RANGES = {
+    1: ((110, 130), (180, 200), (100, 120), (25, 30), (85, 90), (37.8, 38.5)),  # Critical (Heart Attack)
+    2: ((95, 110), (160, 180), (95, 105), (20, 25), (92, 95), (37.2, 37.8)),    # Watch (Hypertension)
+    3: ((95, 110), (150, 170), (85, 95), (25, 30), (88, 92), (37.8, 38.5)),     # Watch (Respiratory Distress)
+    4: ((100, 115), (90, 110), (50, 65), (22, 28), (90, 94), (38.5, 39.0))      # Watch (Sepsis)
+}
+CRITICAL_EKG_PATIENT_IDS = {1}
+
+# Everyone else: baseline range plus per-tick noise
+NORMAL_BASE_RANGES = ((65, 85), (110, 130), (70, 85), (14, 18), (96.0, 99.0), (36.8, 37.2))
+NORMAL_NOISE = (5, 8, 5, 2, 1, 0.3)
+
+# Extra variation for patients with a condition, keyed by substring of medical_conditions
+CONDITION_MODIFIERS = {
+    "Heart Disease": {"heart_rate": (-10, 15), "systolic_bp": (-5, 20)},
+    "COPD": {"respiratory_rate": (2, 6), "oxygen_saturation": (-3.0, -1.0)},
+    "Diabetes": {"temperature": (0.2, 0.8)}
+}
+
+# Physiological clamp applied to every reading
+VITAL_LIMITS = ((40, 180), (70, 200), (40, 120), (8, 30), (85, 100), (35.5, 39.0))
+
+EKG_SAMPLES = 50
+
+# Beat morphology for continuous EKG: (position in the cardiac cycle, amplitude mV, width)
+PQRST_WAVES = (
+    (0.20, 0.15, 0.025),   # P
+    (0.37, -0.15, 0.010),  # Q
+    (0.40, 1.20, 0.012),   # R
+    (0.43, -0.25, 0.010),  # S
+    (0.65, 0.30, 0.050)    # T
+)
+# Irregular (atrial fibrillation-like) rhythm: beat-rate jitter and how long each rate lasts
+IRREGULAR_RATE_JITTER = 0.35
+IRREGULAR_BLOCK_SECONDS = 0.4
+
+class VitalsGenerator:
+    """Generates a whole tick of vitals and EKG waveforms for a ward at once.
+
+    Patient profiles (scenario ranges, condition modifiers, noise) are turned
+    into (low, high) arrays once at construction, so each tick is a handful of
+    vectorized draws from one seeded numpy.random.Generator. The same seed and
+    patient list always produce the same sequence of ticks.
+    """
+
+    def __init__(self, patients: List[Patient], seed: Optional[Union[int, np.random.Generator]] = None,
+                 ekg_sample_rate: Optional[float] = None, tick_interval: float = 3.0):
+        self.patient_ids = [patient.id for patient in patients]
+        self.rng = np.random.default_rng(seed)
+        n = len(patients)
+
+        # Layer 0 is the baseline, layer 1 the noise, layers 2+ one per condition
+        layers = 2 + len(CONDITION_MODIFIERS)
+        self.low = np.zeros((layers, n, len(VITAL_SIGNS)))
+        self.high = np.zeros((layers, n, len(VITAL_SIGNS)))
+        self.critical_ekg = np.zeros(n, dtype=bool)
+
+        for i, patient in enumerate(patients):
+            scenario = SCENARIO_RANGES.get(patient.id)
+            if scenario:
+                self.low[0, i], self.high[0, i] = np.array(scenario).T
+                self.critical_ekg[i] = patient.id in CRITICAL_EKG_PATIENT_IDS
+                continue
+
+            self.low[0, i], self.high[0, i] = np.array(NORMAL_BASE_RANGES).T
+            self.low[1, i], self.high[1, i] = -np.array(NORMAL_NOISE), np.array(NORMAL_NOISE)
+            conditions = patient.medical_conditions or ""
+            for layer, (condition, modifiers) in enumerate(CONDITION_MODIFIERS.items(), start=2):
+                if condition in conditions:
+                    for vital, (low, high) in modifiers.items():
+                        j = VITAL_SIGNS.index(vital)
+                        self.low[layer, i, j], self.high[layer, i, j] = low, high
+
+        self.limits_low, self.limits_high = np.array(VITAL_LIMITS, dtype=np.float64).T
+
+        # EKG: normal sinus template, plus ST elevation for critical patients
+        t = np.linspace(0, 2 * np.pi, EKG_SAMPLES)
+        template = np.sin(t) + 0.3 * np.sin(3 * t)
+        st_elevation = np.zeros(EKG_SAMPLES)
+        st_elevation[20:30] = 1.5
+        self.ekg_template = np.where(self.critical_ekg[:, None], template + st_elevation, template)
+        self.ekg_noise = np.where(self.critical_ekg, 0.2, 0.1)[:, None]
+
+        # With a sample rate, EKG is a continuous beat train at each patient's
+        # heart rate instead of one 50-sample template per tick
+        self.ekg_sample_rate = ekg_sample_rate
+        self.ekg_samples = int(round(ekg_sample_rate * tick_interval)) if ekg_sample_rate else EKG_SAMPLES
+        self.cardiac_phase = self.rng.random(n) if ekg_sample_rate else None
+
+    def generate_tick(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Generate one tick for every patient
+
+        Returns:
+            Tuple of (vitals, ekg): an (N, 6) float64 array ordered by
+            VITAL_SIGNS and an (N, ekg_samples) float32 array of EKG samples in mV
+        """
+        draws = self.rng.uniform(self.low, self.high)
+        vitals = np.clip(draws.sum(axis=0), self.limits_low, self.limits_high)
+        if self.ekg_sample_rate:
+            return vitals, self._generate_beats(vitals[:, VITAL_SIGNS.index("heart_rate")])
+        return vitals, self._generate_ekg()
+
+    def _generate_beats(self, heart_rate: np.ndarray) -> np.ndarray:
+        """Continue each patient's beat train for one tick at the given heart rates"""
+        n, samples = len(self.patient_ids), self.ekg_samples
+        step = heart_rate / 60.0 / self.ekg_sample_rate
+        rate = np.broadcast_to(step[:, None], (n, samples)).copy()
+
+        # Irregular patients change rate every block, so RR intervals scatter
+        block = max(1, int(IRREGULAR_BLOCK_SECONDS * self.ekg_sample_rate))
+        blocks = -(-samples // block)
+        jitter = 1 + self.rng.uniform(-IRREGULAR_RATE_JITTER, IRREGULAR_RATE_JITTER, (n, blocks))
+        rate[self.critical_ekg] *= np.repeat(jitter, block, axis=1)[self.critical_ekg, :samples]
+
+        phase = self.cardiac_phase[:, None] + np.cumsum(rate, axis=1)
+        self.cardiac_phase = phase[:, -1] % 1.0
+        phase %= 1.0
+
+        signal = np.zeros((n, samples))
+        for center, amplitude, width in PQRST_WAVES:
+            signal += amplitude * np.exp(-((phase - center) ** 2) / (2 * width ** 2))
+        # ST elevation for critical patients
+        signal[self.critical_ekg] += 0.25 * ((phase[self.critical_ekg] > 0.45) & (phase[self.critical_ekg] < 0.6))
+        signal += 0.03 * self.rng.standard_normal((n, samples))
+        return signal.astype(np.float32)
+
+    def _generate_ekg(self) -> np.ndarray:
+        """Generate waveforms: template, noise and random arrhythmic beats"""
+        n = len(self.patient_ids)
+        signal = self.ekg_template + self.ekg_noise * self.rng.standard_normal((n, EKG_SAMPLES))
+
+        # Critical patients get 8 large irregular beats; others have a 5% chance of 3 minor ones
+        minor = self.rng.random(n) < 0.05
+        beats = np.where(self.critical_ekg, 8, np.where(minor, 3, 0))
+        amplitude = np.where(self.critical_ekg, 2.0, 1.0)[:, None]
+        positions = self.rng.random((n, EKG_SAMPLES)).argsort(axis=1)
+        selected = np.zeros((n, EKG_SAMPLES), dtype=bool)
+        np.put_along_axis(selected, positions, np.arange(EKG_SAMPLES) < beats[:, None], axis=1)
+        signal += selected * self.rng.uniform(-amplitude, amplitude, (n, EKG_SAMPLES))
+
+        return signal.astype(np.float32)
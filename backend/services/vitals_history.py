@@ -0,0 +1,115 @@
+import base64
+import logging
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
+
+from sqlalchemy import and_, or_, select
+
+from database import AsyncSessionLocal
+from models.vitals import Vitals
+from services.ekg_codec import waveform_to_base64
+from services.serialization import dumps_text
+
+logger = logging.getLogger(__name__)
+
+# Columns a history request may project; id and timestamp are always sent
+# because the cursor is built from them
+HISTORY_FIELDS = (
+    "heart_rate", "systolic_bp", "diastolic_bp", "respiratory_rate", "oxygen_saturation",
+    "temperature", "ekg_data", "status", "classification_reason", "recommended_action"
+)
+# The waveform is the bulk of every row, so it is only read when asked for
+DEFAULT_HISTORY_FIELDS = tuple(field for field in HISTORY_FIELDS if field != "ekg_data")
+
+MAX_HISTORY_LIMIT = 5000
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    """Turn a comma-separated field list into validated column names"""
+    if not fields:
+        return list(DEFAULT_HISTORY_FIELDS)
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in HISTORY_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return requested
+
+def encode_cursor(timestamp: datetime, vitals_id: int) -> str:
+    """Opaque cursor pointing just past the row with this (timestamp, id)"""
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{vitals_id}".encode()).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors"""
+    try:
+        timestamp, vitals_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(vitals_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def build_history_query(patient_id: int, fields: List[str], since: Optional[datetime] = None,
+                        until: Optional[datetime] = None, cursor: Optional[str] = None,
+                        limit: int = 500, order: str = "desc"):
+    """Select one page of a patient's vitals, keyset-paginated on (timestamp, id).
+
+    One row past the limit is selected so the caller can tell whether
+    another page exists without a count query.
+    """
+    columns = [Vitals.id, Vitals.timestamp] + [getattr(Vitals, field) for field in fields]
+    query = select(*columns).where(Vitals.patient_id == patient_id)
+    if since:
+        query = query.where(Vitals.timestamp >= since)
+    if until:
+        query = query.where(Vitals.timestamp < until)
+
+    descending = order == "desc"
+    if cursor:
+        cursor_timestamp, cursor_id = decode_cursor(cursor)
+        # The plain timestamp bound lets the (patient_id, timestamp) index
+        # narrow the scan; the id comparison breaks ties within a timestamp
+        if descending:
+            query = query.where(Vitals.timestamp <= cursor_timestamp, or_(
+                Vitals.timestamp < cursor_timestamp,
+                and_(Vitals.timestamp == cursor_timestamp, Vitals.id < cursor_id)
+            ))
+        else:
+            query = query.where(Vitals.timestamp >= cursor_timestamp, or_(
+                Vitals.timestamp > cursor_timestamp,
+                and_(Vitals.timestamp == cursor_timestamp, Vitals.id > cursor_id)
+            ))
+
+    if descending:
+        query = query.order_by(Vitals.timestamp.desc(), Vitals.id.desc())
+    else:
+        query = query.order_by(Vitals.timestamp.asc(), Vitals.id.asc())
+    return query.limit(limit + 1)
+
+def _row_to_json(row) -> str:
+    item = dict(row)
+    item["timestamp"] = item["timestamp"].isoformat()
+    if "ekg_data" in item:
+        item["ekg_data"] = waveform_to_base64(item["ekg_data"])
+    return dumps_text(item)
+
+async def stream_vitals_history(patient_id: int, query, limit: int) -> AsyncIterator[str]:
+    """Stream a history page as JSON, one row at a time.
+
+    The body is ``{"patient_id": ..., "items": [...], "next_cursor": ...}``
+    with next_cursor null on the last page. Rows are read through a
+    server-side cursor, so neither the database driver nor the API process
+    holds the whole page in memory.
+    """
+    yield f'{{"patient_id": {patient_id}, "items": ['
+    next_cursor = None
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query)
+        count = 0
+        last = None
+        async for row in result.mappings():
+            if count == limit:
+                # The extra row only proves there is another page
+                next_cursor = encode_cursor(last["timestamp"], last["id"])
+                break
+            yield ("," if count else "") + _row_to_json(row)
+            last = row
+            count += 1
+        await result.close()
+    yield f'], "next_cursor": {dumps_text(next_cursor)}}}'
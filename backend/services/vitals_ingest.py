@@ -0,0 +1,369 @@
+import asyncio
+import logging
+import os
+import struct
+import time
+from datetime import date, datetime, timedelta
+from typing import AsyncIterable, Dict, List, Any, Optional, Callable, Tuple
+
+import numpy as np
+from sqlalchemy import select
+
+from database import AsyncSessionLocal
+from models.patient import Patient
+from services.classification_engine import ClassificationEngine, VITAL_SIGNS
+from services.ekg_codec import EKG_SAMPLE_DTYPE, EKG_SCALE, encode_waveform
+from services.metrics import REGISTRY
+from services.serialization import loads
+from services.vitals_writer import VitalsWriter
+from services.websocket_manager import WebSocketManager
+
+logger = logging.getLogger(__name__)
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+FRAME_CONTENT_TYPE = "application/vnd.kpum.vitals-frame"
+
+# Binary frame: 12-byte header, then `count` fixed-size little-endian records
+#   header: magic "KPVI", version (u8), pad, ekg_samples (u16), count (u32)
+#   record: patient_id (u32), timestamp (f64 unix seconds, 0 = time of receipt),
+#           six float32 vitals in VITAL_SIGNS order, ekg_samples int16 samples
+#           in the storage encoding of services/ekg_codec.py
+FRAME_MAGIC = b"KPVI"
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct("<4sBxHI")
+
+def frame_record_dtype(ekg_samples: int) -> np.dtype:
+    """numpy dtype of one binary frame record"""
+    fields = [("patient_id", "<u4"), ("timestamp", "<f8"), ("vitals", "<f4", (len(VITAL_SIGNS),))]
+    if ekg_samples:
+        fields.append(("ekg", EKG_SAMPLE_DTYPE, (ekg_samples,)))
+    return np.dtype(fields)
+
+# Readings outside these bounds are instrument errors, not patient states
+PLAUSIBLE_LIMITS = np.array([
+    (0, 350),   # heart_rate
+    (0, 350),   # systolic_bp
+    (0, 250),   # diastolic_bp
+    (0, 100),   # respiratory_rate
+    (0, 100),   # oxygen_saturation
+    (25, 45)    # temperature
+], dtype=np.float64).T
+
+MAX_REPORTED_ERRORS = 100
+
+# patients.id is a 32-bit integer column
+MAX_PATIENT_ID = np.iinfo(np.int32).max
+# Kept well under asyncpg's 32767 bind parameters per statement
+PATIENT_LOOKUP_CHUNK = 10000
+# Largest EKG sample, in millivolts, the int16 storage encoding can hold
+MAX_EKG_MV = np.iinfo(EKG_SAMPLE_DTYPE).max / EKG_SCALE
+
+INGEST_SECONDS = REGISTRY.histogram("kpum_ingest_seconds", "Time to process one ingest request", ["format"])
+INGEST_ROWS = REGISTRY.counter("kpum_ingest_rows", "Ingested readings, by outcome", ["outcome"])
+
+def body_format(content_type: str) -> Optional[str]:
+    """"frame", "ndjson", or None for an unsupported content type"""
+    media_type = content_type.split(";")[0].strip().lower()
+    if media_type == FRAME_CONTENT_TYPE or media_type == "application/octet-stream":
+        return "frame"
+    if media_type in NDJSON_CONTENT_TYPES:
+        return "ndjson"
+    return None
+
+class IngestError(ValueError):
+    """The request body could not be decoded at all"""
+
+class IngestTooLarge(IngestError):
+    """The request body is over the byte or reading limit"""
+
+def _from_unix(ts: float) -> Optional[datetime]:
+    """Naive local time for a unix timestamp, or None if it is out of range"""
+    try:
+        return datetime.fromtimestamp(ts)
+    except (OverflowError, OSError, ValueError):
+        return None
+
+def _naive_local(timestamp: datetime) -> datetime:
+    """Stored timestamps are naive local time; convert any with an offset"""
+    if timestamp.tzinfo is None:
+        return timestamp
+    return timestamp.astimezone().replace(tzinfo=None)
+
+def _waveform(samples: Any) -> np.ndarray:
+    """An NDJSON ekg_data list as float32 millivolts, or ValueError if it cannot be stored as-is"""
+    waveform = np.asarray(samples, dtype=np.float64)
+    if waveform.ndim != 1 or not np.isfinite(waveform).all() or (np.abs(waveform) > MAX_EKG_MV).any():
+        raise ValueError("ekg_data must be a flat list of finite samples within the storage range")
+    return waveform.astype(np.float32)
+
+class VitalsIngest:
+    """Accepts batches of readings from bedside gateways.
+
+    A batch is decoded into arrays, validated and classified in bulk off the
+    event loop, queued on its own VitalsWriter (which switches to COPY for
+    large batches on PostgreSQL) and fanned out to WebSocket clients with
+    each patient's newest reading. Invalid rows are rejected individually;
+    the rest of the batch is still accepted. Readings timestamped before the
+    oldest retained vitals partition, or too far in the future, are rejected
+    too, since PostgreSQL would fail the whole flush for them.
+    """
+
+    def __init__(self, classification_engine: ClassificationEngine, websocket_manager: WebSocketManager,
+                 on_flush: Optional[Callable[[List[Dict[str, Any]]], None]] = None):
+        self.classification_engine = classification_engine
+        self.websocket_manager = websocket_manager
+        self.max_rows = int(os.getenv("VITALS_INGEST_MAX_ROWS", "50000"))
+        self.max_bytes = int(os.getenv("VITALS_INGEST_MAX_BYTES", str(64 * 1024 * 1024)))
+        self.max_future_seconds = float(os.getenv("VITALS_INGEST_MAX_FUTURE_SECONDS", "300"))
+        # Matches VitalsMaintenance: partitions are kept for this many days back
+        self.retention_days = int(os.getenv("VITALS_RETENTION_DAYS", "7"))
+        # A single ingest batch is one queue entry, so it is also one flush
+        self.vitals_writer = VitalsWriter(max_batch_ticks=1, on_flush=on_flush)
+
+        # Statistics
+        self.batches = 0
+        self.accepted_rows = 0
+        self.rejected_rows = 0
+        self.total_ingest_ms = 0.0
+
+    async def start(self):
+        await self.vitals_writer.start()
+
+    async def stop(self):
+        await self.vitals_writer.stop()
+
+    async def read_body(self, content_length: Optional[str], chunks: AsyncIterable[bytes]) -> bytes:
+        """Read a request body, stopping as soon as it passes max_bytes"""
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            raise IngestTooLarge(f"Body is {content_length} bytes, the limit is {self.max_bytes}")
+        body = bytearray()
+        async for chunk in chunks:
+            body += chunk
+            if len(body) > self.max_bytes:
+                raise IngestTooLarge(f"Body is over the {self.max_bytes} byte limit")
+        return bytes(body)
+
+    async def ingest(self, body: bytes, content_type: str) -> Dict[str, Any]:
+        """Decode, validate, classify, persist and broadcast one batch"""
+        start = time.perf_counter()
+        patient_ids, timestamps, values, ekg = await asyncio.to_thread(self._decode, body, content_type)
+
+        patients = await self._load_patients(np.unique(patient_ids[patient_ids >= 0]).tolist())
+        rows, broadcast, errors, rejected = await asyncio.to_thread(
+            self._prepare, patient_ids, timestamps, values, ekg, patients
+        )
+
+        await self.vitals_writer.submit(rows)
+        if broadcast:
+            for patient_id, entry in broadcast.items():
+                previous_status = self.websocket_manager.get_patient_status(patient_id)
+                if previous_status is not None and previous_status != entry["status"]:
+                    await self.websocket_manager.broadcast_patient_status(
+                        patient_id, entry["status"], entry["reason"], previous_status=previous_status,
+                        room_id=entry["room_id"], recommended_action=entry["recommended_action"]
+                    )
+            await self.websocket_manager.broadcast_vitals(broadcast, partial=True)
+
+        self.batches += 1
+        self.accepted_rows += len(rows)
+        self.rejected_rows += rejected
+        elapsed = time.perf_counter() - start
+        self.total_ingest_ms += elapsed * 1000
+        INGEST_SECONDS.labels(body_format(content_type)).observe(elapsed)
+        INGEST_ROWS.labels("accepted").inc(len(rows))
+        INGEST_ROWS.labels("rejected").inc(rejected)
+        return {"accepted": len(rows), "rejected": rejected, "errors": errors}
+
+    async def _load_patients(self, patient_ids: List[int]) -> Dict[int, Tuple[str, str, Optional[str]]]:
+        patients = {}
+        async with AsyncSessionLocal() as db:
+            for start in range(0, len(patient_ids), PATIENT_LOOKUP_CHUNK):
+                result = await db.execute(
+                    select(Patient.id, Patient.name, Patient.room_id, Patient.medical_conditions).where(
+                        Patient.id.in_(patient_ids[start:start + PATIENT_LOOKUP_CHUNK])
+                    )
+                )
+                patients.update((patient_id, (name, room_id, conditions))
+                                for patient_id, name, room_id, conditions in result)
+        return patients
+
+    def _decode(self, body: bytes, content_type: str):
+        """Decode a request body into (patient_ids, timestamps, values, ekg)"""
+        kind = body_format(content_type)
+        if kind == "frame":
+            return self._decode_frame(body)
+        if kind == "ndjson":
+            return self._decode_ndjson(body)
+        media_type = content_type.split(";")[0].strip().lower()
+        raise IngestError(f"Unsupported content type {media_type or '(none)'}; "
+                          f"send {NDJSON_CONTENT_TYPES[0]} or {FRAME_CONTENT_TYPE}")
+
+    def _decode_frame(self, body: bytes):
+        if len(body) < FRAME_HEADER.size:
+            raise IngestError("Frame is shorter than its header")
+        magic, version, ekg_samples, count = FRAME_HEADER.unpack_from(body)
+        if magic != FRAME_MAGIC or version != FRAME_VERSION:
+            raise IngestError("Not a version 1 vitals frame")
+        self._check_count(count)
+        dtype = frame_record_dtype(ekg_samples)
+        if len(body) != FRAME_HEADER.size + count * dtype.itemsize:
+            raise IngestError(f"Frame length does not match {count} records of {dtype.itemsize} bytes")
+
+        records = np.frombuffer(body, dtype=dtype, count=count, offset=FRAME_HEADER.size)
+        received = time.time()
+        timestamps = [
+            _from_unix(ts if ts > 0 else received) if np.isfinite(ts) else None
+            for ts in records["timestamp"].tolist()
+        ]
+        # Samples already use the storage encoding; classification needs millivolts
+        ekg = records["ekg"].astype(np.float32) / np.float32(EKG_SCALE) if ekg_samples else None
+        patient_ids = records["patient_id"].astype(np.int64)
+        # Outside the id column's range; rejected as malformed like a bad NDJSON id
+        patient_ids[patient_ids > MAX_PATIENT_ID] = -1
+        return patient_ids, timestamps, records["vitals"].astype(np.float64), ekg
+
+    def _decode_ndjson(self, body: bytes):
+        lines = [line for line in body.split(b"\n") if line.strip()]
+        self._check_count(len(lines))
+        patient_ids = np.full(len(lines), -1, dtype=np.int64)
+        values = np.full((len(lines), len(VITAL_SIGNS)), np.nan)
+        timestamps: List[Optional[datetime]] = []
+        ekg: List[Optional[np.ndarray]] = []
+        received = datetime.now()
+
+        for i, line in enumerate(lines):
+            try:
+                reading = loads(line)
+                patient_id = int(reading["patient_id"])
+                if not 0 <= patient_id <= MAX_PATIENT_ID:
+                    raise ValueError(f"patient_id {patient_id} is out of range")
+                readings = [float(reading.get(vital, np.nan)) for vital in VITAL_SIGNS]
+                timestamp = reading.get("timestamp")
+                if timestamp is None:
+                    timestamp = received
+                elif isinstance(timestamp, (int, float)):
+                    timestamp = datetime.fromtimestamp(timestamp)
+                else:
+                    timestamp = _naive_local(datetime.fromisoformat(timestamp))
+                samples = reading.get("ekg_data")
+                waveform = _waveform(samples) if samples is not None else None
+                values[i] = readings
+                patient_ids[i] = patient_id
+            except (ValueError, TypeError, KeyError, AttributeError, OverflowError, OSError):
+                # Left as patient -1 with no timestamp so bulk validation rejects it
+                timestamps.append(None)
+                ekg.append(None)
+                continue
+            timestamps.append(timestamp)
+            ekg.append(waveform)
+        return patient_ids, timestamps, values, ekg
+
+    def _check_count(self, count: int):
+        if count > self.max_rows:
+            raise IngestTooLarge(f"Batch has {count} readings, the limit is {self.max_rows}")
+
+    def _timestamp_window(self) -> Tuple[datetime, datetime]:
+        """Oldest and newest timestamps a vitals partition exists for"""
+        earliest = datetime.combine(date.today() - timedelta(days=self.retention_days), datetime.min.time())
+        return earliest, datetime.now() + timedelta(seconds=self.max_future_seconds)
+
+    def _prepare(self, patient_ids: np.ndarray, timestamps: List[Optional[datetime]], values: np.ndarray,
+                 ekg, patients: Dict[int, Tuple[str, str, Optional[str]]]):
+        """Validate and classify in bulk; build rows and the per-patient broadcast"""
+        known = np.isin(patient_ids, np.fromiter(patients, dtype=np.int64, count=len(patients)))
+        finite = np.isfinite(values).all(axis=1)
+        plausible = ((values >= PLAUSIBLE_LIMITS[0]) & (values <= PLAUSIBLE_LIMITS[1])).all(axis=1)
+        has_timestamp = np.fromiter((ts is not None for ts in timestamps), dtype=bool, count=len(timestamps))
+        earliest, latest = self._timestamp_window()
+        in_window = np.fromiter((ts is not None and earliest <= ts <= latest for ts in timestamps),
+                                dtype=bool, count=len(timestamps))
+        valid = known & finite & plausible & in_window
+
+        errors = []
+        for i in np.flatnonzero(~valid)[:MAX_REPORTED_ERRORS].tolist():
+            if not has_timestamp[i] or patient_ids[i] < 0:
+                error = "malformed reading"
+            elif not known[i]:
+                error = f"unknown patient_id {patient_ids[i]}"
+            elif not in_window[i]:
+                error = f"timestamp {timestamps[i].isoformat()} is outside the retained range"
+            elif not finite[i]:
+                error = "missing or non-numeric vital sign"
+            else:
+                error = "vital sign outside plausible range"
+            errors.append({"index": i, "error": error})
+
+        index = np.flatnonzero(valid)
+        if not len(index):
+            return [], {}, errors, len(patient_ids)
+
+        accepted_ids = patient_ids[index].tolist()
+        results = self.classification_engine.classify_batch(
+            values[index], ekg_critical=self._critical_ekg(ekg, index),
+            patient_ids=accepted_ids, conditions=[patients[patient_id][2] for patient_id in accepted_ids]
+        )
+
+        encoded_ekg = self._encode_ekg(ekg, index)
+        rows = []
+        broadcast = {}
+        for j, i in enumerate(index.tolist()):
+            patient_id = int(patient_ids[i])
+            vitals = dict(zip(VITAL_SIGNS, values[i].tolist()))
+            waveform = ekg[i] if ekg is not None else None
+            status, reason, recommended_action = results.result(j)
+            rows.append({
+                "patient_id": patient_id,
+                "timestamp": timestamps[i],
+                **vitals,
+                "ekg_data": encoded_ekg[j],
+                "status": status,
+                "classification_reason": reason,
+                "recommended_action": recommended_action
+            })
+
+            # Clients only need each patient's newest reading from the batch
+            current = broadcast.get(patient_id)
+            if current is None or timestamps[i] >= current["timestamp"]:
+                name, room_id, _ = patients[patient_id]
+                broadcast[patient_id] = {
+                    "patient_id": patient_id,
+                    "patient_name": name,
+                    "room_id": room_id,
+                    "vitals": {**vitals, "ekg_data": waveform},
+                    "status": status,
+                    "reason": reason,
+                    "recommended_action": recommended_action,
+                    "timestamp": timestamps[i]
+                }
+
+        for entry in broadcast.values():
+            del entry["timestamp"]
+        return rows, broadcast, errors, len(patient_ids) - len(index)
+
+    def _encode_ekg(self, ekg, index: np.ndarray) -> List[Optional[bytes]]:
+        """Storage encoding for the accepted rows' waveforms"""
+        if ekg is None:
+            return [None] * len(index)
+        if isinstance(ekg, np.ndarray):
+            # Encode the whole block in one call and slice it per row
+            blob = encode_waveform(ekg[index])
+            width = ekg.shape[1] * EKG_SAMPLE_DTYPE.itemsize
+            return [blob[k * width:(k + 1) * width] for k in range(len(index))]
+        return [encode_waveform(ekg[i]) if ekg[i] is not None else None for i in index.tolist()]
+
+    def _critical_ekg(self, ekg, index: np.ndarray) -> Optional[np.ndarray]:
+        if ekg is None:
+            return None
+        if isinstance(ekg, np.ndarray):
+            return self.classification_engine.critical_ekg_batch(ekg[index])
+        return np.array([self.classification_engine._has_critical_ekg(ekg[i]) for i in index.tolist()], dtype=bool)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get ingest counters and the writer's flush statistics"""
+        return {
+            "batches": self.batches,
+            "accepted_rows": self.accepted_rows,
+            "rejected_rows": self.rejected_rows,
+            "avg_ingest_ms": round(self.total_ingest_ms / self.batches, 2) if self.batches else 0.0,
+            "writer": self.vitals_writer.get_stats()
+        }
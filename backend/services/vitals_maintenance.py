@@ -0,0 +1,241 @@
+import asyncio
+import logging
+import os
+import re
+import threading
+from datetime import datetime, date, timedelta
+from typing import Any, Callable, Dict, Optional, List, Tuple
+
+from sqlalchemy import text
+
+from database import engine
+from services.classification_engine import VITAL_SIGNS
+
+logger = logging.getLogger(__name__)
+
+PARTITION_NAME = re.compile(r"^vitals_p(\d{8})$")
+
+Window = Tuple[datetime, datetime]
+
+def _floor_minute(ts: datetime) -> datetime:
+    return ts.replace(second=0, microsecond=0)
+
+def _floor_hour(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+def _bucket_windows(windows: List[Window], floor: Callable[[datetime], datetime], width: timedelta,
+                    bucket_end: datetime) -> List[Window]:
+    """Widen windows to whole buckets before bucket_end and merge the overlapping ones"""
+    widened = sorted(
+        (floor(start), min(floor(end) + width, bucket_end)) for start, end in windows if floor(start) < bucket_end
+    )
+    merged: List[Window] = []
+    for start, end in widened:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+class VitalsMaintenance:
+    """Keeps the partitioned vitals table and its rollups in shape.
+
+    Raw vitals live in one PostgreSQL partition per day. Each run creates the
+    partitions for the next few days, rolls raw rows up into 1-minute buckets
+    and 1-minute buckets into 1-hour buckets, and then drops raw partitions and
+    rollup rows that are past their retention.
+
+    Every run recomputes the buckets of the trailing `rollup_lookback`, so rows
+    still queued in a writer when their minute closed are picked up, plus any
+    older ranges ingest reported through mark_dirty for backfilled readings.
+    """
+
+    def __init__(self):
+        self.interval = int(os.getenv("VITALS_MAINTENANCE_INTERVAL", "60"))
+        self.partition_days_ahead = int(os.getenv("VITALS_PARTITION_DAYS_AHEAD", "3"))
+        self.raw_retention_days = int(os.getenv("VITALS_RETENTION_DAYS", "7"))
+        self.minute_retention_days = int(os.getenv("VITALS_ROLLUP_1M_RETENTION_DAYS", "90"))
+        self.hour_retention_days = int(os.getenv("VITALS_ROLLUP_1H_RETENTION_DAYS", "730"))
+        self.rollup_lookback = timedelta(minutes=int(os.getenv("VITALS_ROLLUP_LOOKBACK_MINUTES", "10")))
+        self.maintenance_task: Optional[asyncio.Task] = None
+        self.enabled = engine.dialect.name == "postgresql"
+        # Ranges each rollup still has to recompute: raw timestamps marked by
+        # ingest on the event loop, and minute windows awaiting the hourly
+        # rollup. Both are taken by run_once in a worker thread.
+        self.dirty: Dict[str, List[Window]] = {"vitals_rollup_1m": [], "vitals_rollup_1h": []}
+        self.dirty_lock = threading.Lock()
+
+    async def start(self):
+        """Prepare partitions now and keep maintaining them in the background"""
+        if not self.enabled:
+            logger.info("Vitals partitioning and rollups require PostgreSQL, skipping")
+            return
+        if not await asyncio.to_thread(self._is_partitioned):
+            logger.warning("vitals table is not partitioned; see DOCUMENTATION.md to migrate it. "
+                           "Partition maintenance and rollups are disabled")
+            self.enabled = False
+            return
+        await asyncio.to_thread(self.ensure_partitions)
+        self.maintenance_task = asyncio.create_task(self._maintenance_loop())
+
+    async def stop(self):
+        """Stop the background maintenance task"""
+        if self.maintenance_task:
+            self.maintenance_task.cancel()
+            try:
+                await self.maintenance_task
+            except asyncio.CancelledError:
+                pass
+            self.maintenance_task = None
+
+    async def _maintenance_loop(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                logger.error(f"Error in vitals maintenance: {e}")
+            await asyncio.sleep(self.interval)
+
+    def run_once(self):
+        """Run one full maintenance pass"""
+        self.ensure_partitions()
+        self.rollup_minutes()
+        self.rollup_hours()
+        self.apply_retention()
+
+    def mark_dirty(self, vitals_rows: List[Dict[str, Any]]):
+        """Flush hook: remember the time range of rows that may land in already rolled-up buckets"""
+        if not self.enabled or not vitals_rows:
+            return
+        timestamps = [row["timestamp"] for row in vitals_rows]
+        self._add_dirty("vitals_rollup_1m", [(min(timestamps), max(timestamps))])
+
+    def _add_dirty(self, target: str, windows: List[Window]):
+        with self.dirty_lock:
+            self.dirty[target].extend(windows)
+
+    def _is_partitioned(self) -> bool:
+        with engine.connect() as conn:
+            relkind = conn.execute(
+                text("SELECT relkind FROM pg_class WHERE oid = to_regclass('vitals')")
+            ).scalar()
+        return relkind == "p"
+
+    def _list_partitions(self, conn) -> List[str]:
+        return list(conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = 'vitals'::regclass"
+        )).scalars())
+
+    def ensure_partitions(self):
+        """Create daily partitions across the retention window through partition_days_ahead
+
+        Ingest accepts backfilled readings as far back as retention keeps, so
+        those days need a partition even if the simulation never wrote them.
+        """
+        today = date.today()
+        with engine.begin() as conn:
+            for offset in range(-self.raw_retention_days, self.partition_days_ahead + 1):
+                day = today + timedelta(days=offset)
+                conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS vitals_p{day:%Y%m%d} PARTITION OF vitals "
+                    f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+                ))
+
+    def rollup_minutes(self) -> List[Window]:
+        """Aggregate raw vitals into complete 1-minute buckets; returns the windows recomputed"""
+        aggregates = ", ".join(
+            f"min({v}), max({v}), avg({v})" for v in VITAL_SIGNS
+        )
+        windows = self._rollup(
+            target="vitals_rollup_1m",
+            source_query=(
+                f"SELECT patient_id, date_trunc('minute', timestamp) AS bucket, count(*), {aggregates} "
+                f"FROM vitals WHERE timestamp >= :start AND timestamp < :end GROUP BY 1, 2"
+            ),
+            floor=_floor_minute,
+            width=timedelta(minutes=1),
+            backfill_days=self.raw_retention_days
+        )
+        # A minute window ends on the next minute boundary; only the hours it touches are dirty
+        self._add_dirty("vitals_rollup_1h", [(start, end - timedelta(microseconds=1)) for start, end in windows])
+        return windows
+
+    def rollup_hours(self) -> List[Window]:
+        """Aggregate 1-minute buckets into complete 1-hour buckets; returns the windows recomputed"""
+        aggregates = ", ".join(
+            f"min({v}_min), max({v}_max), sum({v}_mean * sample_count) / sum(sample_count)"
+            for v in VITAL_SIGNS
+        )
+        return self._rollup(
+            target="vitals_rollup_1h",
+            source_query=(
+                f"SELECT patient_id, date_trunc('hour', bucket) AS hour_bucket, sum(sample_count), {aggregates} "
+                f"FROM vitals_rollup_1m WHERE bucket >= :start AND bucket < :end GROUP BY 1, 2"
+            ),
+            floor=_floor_hour,
+            width=timedelta(hours=1),
+            backfill_days=self.minute_retention_days
+        )
+
+    def _rollup(self, target: str, source_query: str, floor: Callable[[datetime], datetime], width: timedelta,
+                backfill_days: int) -> List[Window]:
+        """Upsert aggregates for the complete buckets that may have changed.
+
+        That is everything since the last bucket written (or the backfill
+        window when there is none), at least the trailing rollup_lookback, and
+        the buckets overlapping each dirty range. Dirty ranges are put back if
+        the upsert fails; anything past the last complete bucket is newer than
+        every bucket written, so the next run starts before it anyway.
+        """
+        columns = ["patient_id", "bucket", "sample_count"] + [
+            f"{v}_{stat}" for v in VITAL_SIGNS for stat in ("min", "max", "mean")
+        ]
+        updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in columns[2:])
+        bucket_end = floor(datetime.now())
+        with self.dirty_lock:
+            dirty, self.dirty[target] = self.dirty[target], []
+        try:
+            with engine.begin() as conn:
+                last_bucket = conn.execute(text(f"SELECT max(bucket) FROM {target}")).scalar()
+                if last_bucket:
+                    start = min(last_bucket, bucket_end - self.rollup_lookback)
+                else:
+                    start = bucket_end - timedelta(days=backfill_days)
+                windows = _bucket_windows([(start, bucket_end)] + dirty, floor, width, bucket_end)
+                for window_start, window_end in windows:
+                    conn.execute(
+                        text(
+                            f"INSERT INTO {target} ({', '.join(columns)}) {source_query} "
+                            f"ON CONFLICT (patient_id, bucket) DO UPDATE SET {updates}"
+                        ),
+                        {"start": window_start, "end": window_end}
+                    )
+        except Exception:
+            self._add_dirty(target, dirty)
+            raise
+        return windows
+
+    def apply_retention(self):
+        """Drop raw partitions and rollup rows older than their retention"""
+        today = date.today()
+        raw_cutoff = today - timedelta(days=self.raw_retention_days)
+        with engine.begin() as conn:
+            for name in self._list_partitions(conn):
+                match = PARTITION_NAME.match(name)
+                if not match:
+                    continue
+                day = datetime.strptime(match.group(1), "%Y%m%d").date()
+                if day < raw_cutoff:
+                    conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                    logger.info(f"Dropped expired vitals partition {name}")
+
+            conn.execute(
+                text("DELETE FROM vitals_rollup_1m WHERE bucket < :cutoff"),
+                {"cutoff": datetime.combine(today - timedelta(days=self.minute_retention_days), datetime.min.time())}
+            )
+            conn.execute(
+                text("DELETE FROM vitals_rollup_1h WHERE bucket < :cutoff"),
+                {"cutoff": datetime.combine(today - timedelta(days=self.hour_retention_days), datetime.min.time())}
+            )
@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Any, Optional, Callable
+
+from sqlalchemy import insert, text
+from sqlalchemy.exc import InterfaceError, OperationalError
+
+from models.vitals import Vitals
+from database import AsyncSessionLocal, async_engine, DB_ERRORS
+from services.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+VITALS_COLUMNS = [column.name for column in Vitals.__table__.columns]
+
+FLUSH_SECONDS = REGISTRY.histogram(
+    "kpum_vitals_flush_seconds", "Time to write and commit one batch of vitals rows", ["method"]
+)
+FLUSHED_ROWS = REGISTRY.counter("kpum_vitals_rows_written", "Vitals rows committed to the database")
+SUBMIT_WAIT_SECONDS = REGISTRY.histogram(
+    "kpum_vitals_submit_wait_seconds", "Time a producer waited to queue a tick for the vitals writer"
+)
+_WRITER_ERRORS = DB_ERRORS.labels("vitals_writer")
+
+def _is_row_error(error: Exception) -> bool:
+    """Whether a failed flush may be down to particular rows rather than the connection"""
+    if isinstance(error, (OperationalError, InterfaceError, OSError, asyncio.TimeoutError)):
+        return False
+    return not getattr(error, "connection_invalidated", False)
+
+class VitalsWriter:
+    """Batches vitals rows and persists them through the async engine.
+
+    Producers submit one tick worth of rows at a time. The queue is bounded in
+    ticks, so a slow database pushes back on the simulation loop instead of
+    letting memory grow without limit.
+    """
+
+    def __init__(self, max_queue_ticks: Optional[int] = None, max_batch_ticks: Optional[int] = None,
+                 on_flush: Optional[Callable[[List[Dict[str, Any]]], None]] = None):
+        self.max_queue_ticks = max_queue_ticks or int(os.getenv("VITALS_WRITER_QUEUE_TICKS", "20"))
+        self.max_batch_ticks = max_batch_ticks or int(os.getenv("VITALS_WRITER_BATCH_TICKS", "5"))
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_queue_ticks)
+        self.writer_task: Optional[asyncio.Task] = None
+        # Called on the event loop with the flushed rows, ids filled in
+        self.on_flush = on_flush
+        # Batches at least this large go through COPY when the driver is asyncpg
+        self.copy_min_rows = int(os.getenv("VITALS_WRITER_COPY_ROWS", "1000"))
+        self.copy_enabled = async_engine.dialect.driver == "asyncpg"
+
+        # Flush statistics
+        self.flush_count = 0
+        self.rows_written = 0
+        self.copy_flushes = 0
+        self.failed_rows = 0
+        self.split_flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+        self.last_batch_rows = 0
+        self.backpressure_waits = 0
+
+    async def start(self):
+        """Start the background writer task"""
+        if self.writer_task and not self.writer_task.done():
+            return
+        self.writer_task = asyncio.create_task(self._writer_loop())
+        logger.info(f"Vitals writer started (queue={self.max_queue_ticks} ticks, batch={self.max_batch_ticks} ticks)")
+
+    async def stop(self):
+        """Flush everything still queued and stop the writer task"""
+        if not self.writer_task:
+            return
+        await self.queue.join()
+        self.writer_task.cancel()
+        try:
+            await self.writer_task
+        except asyncio.CancelledError:
+            pass
+        self.writer_task = None
+        logger.info("Vitals writer stopped")
+
+    async def submit(self, rows: List[Dict[str, Any]]):
+        """Queue one tick of vitals rows, waiting if the queue is full"""
+        if not rows:
+            return
+        if self.queue.full():
+            self.backpressure_waits += 1
+            logger.warning(f"Vitals write queue full ({self.queue.qsize()} ticks), waiting for flush")
+        with SUBMIT_WAIT_SECONDS.time():
+            await self.queue.put(rows)
+
+    async def _writer_loop(self):
+        """Drain queued ticks into batches and flush each batch in one transaction"""
+        while True:
+            batches = [await self.queue.get()]
+            while len(batches) < self.max_batch_ticks and not self.queue.empty():
+                batches.append(self.queue.get_nowait())
+
+            rows = [row for batch in batches for row in batch]
+            try:
+                written = await self._flush_isolating(rows)
+                if written and self.on_flush:
+                    self.on_flush(written)
+            except Exception as e:
+                logger.error(f"Error handling {len(rows)} flushed vitals rows: {e}")
+            finally:
+                for _ in batches:
+                    self.queue.task_done()
+    
+    async def _flush_isolating(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Flush rows, halving a batch the database rejects until the bad rows are isolated.
+        
+        Returns the rows that were written. Connection failures are not split,
+        since every smaller batch would fail the same way.
+        """
+        try:
+            await self._flush(rows)
+            return rows
+        except Exception as e:
+            if len(rows) == 1 or not _is_row_error(e):
+                self.failed_rows += len(rows)
+                _WRITER_ERRORS.inc()
+                logger.error(f"Error flushing {len(rows)} vitals rows: {e}")
+                return []
+        self.split_flushes += 1
+        for row in rows:
+            # Ids drawn for a failed COPY are not reused
+            row.pop("id", None)
+        middle = len(rows) // 2
+        return await self._flush_isolating(rows[:middle]) + await self._flush_isolating(rows[middle:])
+
+    async def _flush(self, rows: List[Dict[str, Any]]):
+        """Insert a batch of vitals rows in one transaction and record their ids"""
+        start = time.perf_counter()
+        method = "copy" if self.copy_enabled and len(rows) >= self.copy_min_rows else "insert"
+        async with AsyncSessionLocal() as db:
+            try:
+                if method == "copy":
+                    await self._copy_rows(db, rows)
+                    self.copy_flushes += 1
+                else:
+                    result = await db.execute(
+                        insert(Vitals).returning(Vitals.id, sort_by_parameter_order=True),
+                        rows
+                    )
+                    for row, vitals_id in zip(rows, result.scalars()):
+                        row["id"] = vitals_id
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+
+        elapsed = time.perf_counter() - start
+        FLUSH_SECONDS.labels(method).observe(elapsed)
+        FLUSHED_ROWS.inc(len(rows))
+        elapsed_ms = elapsed * 1000
+        self.flush_count += 1
+        self.rows_written += len(rows)
+        self.last_batch_rows = len(rows)
+        self.last_flush_ms = elapsed_ms
+        self.total_flush_ms += elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+
+    async def _copy_rows(self, db, rows: List[Dict[str, Any]]):
+        """Write a large batch with COPY, allocating ids from the sequence first.
+
+        COPY cannot return generated keys, so the ids are drawn up front in
+        one round-trip and copied in with the rows.
+        """
+        ids = (await db.execute(
+            text("SELECT nextval(pg_get_serial_sequence('vitals', 'id')) FROM generate_series(1, :n)"),
+            {"n": len(rows)}
+        )).scalars().all()
+        for row, vitals_id in zip(rows, ids):
+            row["id"] = vitals_id
+
+        connection = await db.connection()
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            Vitals.__tablename__,
+            records=[tuple(row.get(column) for column in VITALS_COLUMNS) for row in rows],
+            columns=VITALS_COLUMNS
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get flush latency and queue depth statistics"""
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_capacity": self.max_queue_ticks,
+            "flush_count": self.flush_count,
+            "rows_written": self.rows_written,
+            "copy_flushes": self.copy_flushes,
+            "failed_rows": self.failed_rows,
+            "split_flushes": self.split_flushes,
+            "last_batch_rows": self.last_batch_rows,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "avg_flush_ms": round(self.total_flush_ms / self.flush_count, 2) if self.flush_count else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 2),
+            "backpressure_waits": self.backpressure_waits
+        }
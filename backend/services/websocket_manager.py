@@ -1,76 +1,762 @@
 import asyncio
-import json
 import logging
-from typing import List, Dict, Any
+import os
+import re
+import time
+from typing import List, Dict, Any, Optional, Tuple, Set, Iterable, Sequence, Union
+import numpy as np
 from fastapi import WebSocket
 from datetime import datetime
 
+from services.ekg_codec import waveform_to_base64
+from services.metrics import REGISTRY
+from services.serialization import dumps_text, loads
+from services.vitals_frames import WardFrame, frame_layout
+
 logger = logging.getLogger(__name__)
 
+SERIALIZE_SECONDS = REGISTRY.histogram(
+    "kpum_ws_serialize_seconds", "Time to serialize one outgoing message, by message type", ["type"]
+)
+SEND_SECONDS = REGISTRY.histogram("kpum_ws_send_seconds", "Time to send one message to one client")
+SENT_BYTES = REGISTRY.counter("kpum_ws_sent_bytes", "Bytes sent to WebSocket clients")
+DROPPED_MESSAGES = REGISTRY.counter("kpum_ws_dropped_messages", "Messages dropped by the slow-consumer policy")
+DISCONNECTS = REGISTRY.counter("kpum_ws_disconnects", "WebSocket disconnections, by reason", ["reason"])
+CONNECTIONS = REGISTRY.gauge("kpum_ws_connections", "Connected WebSocket clients")
+
+# What to do when a client's outbound queue is full
+SLOW_CONSUMER_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+
+# Message types whose newest copy supersedes any queued older copy
+COALESCIBLE_MESSAGE_TYPES = {"vitals_update", "vitals_frame"}
+
+# Vitals protocols a client can choose: full vitals_update every tick, one
+# vitals_snapshot followed by sequenced vitals_delta messages, no vitals at
+# all - a status_snapshot followed by status_change events on transitions -
+# or a vitals_index followed by a binary frame per tick (services/vitals_frames.py)
+VITALS_PROTOCOLS = ("full", "delta", "transitions", "binary")
+
+# Protocols that need a snapshot of the current state before anything else
+SNAPSHOT_PROTOCOLS = ("delta", "transitions", "binary")
+
+# Per-patient fields that a delta only carries when they change
+DELTA_FIELDS = ("patient_name", "room_id", "status", "reason", "recommended_action", "ews_score")
+
+# Decimal places kept for numeric vitals in the delta protocol (the dashboard shows one)
+DELTA_VITALS_PRECISION = 1
+
+# Message types a subscription can select; "vitals" covers updates, deltas and snapshots
+SUBSCRIPTION_MESSAGE_TYPES = ("vitals", "status_change", "treatment_decision", "dispatch_decision")
+SUBSCRIPTION_STATUSES = ("normal", "watch", "critical")
+MESSAGE_TYPE_TOPICS = {
+    "vitals_update": "vitals",
+    "vitals_delta": "vitals",
+    "vitals_snapshot": "vitals",
+    "vitals_index": "vitals",
+    "vitals_frame": "vitals",
+    "status_snapshot": "status_change"
+}
+# Upper bound on patients plus rooms one subscription may name
+MAX_SUBSCRIPTION_TOPICS = 10000
+
+ROOM_NUMBER = re.compile(r"^(.*?)(\d+)$")
+
+# Topic of subscriptions that are not limited to particular patients or rooms
+ALL_PATIENTS_TOPIC = ("all",)
+
+def expand_room_range(first: str, last: str) -> List[str]:
+    """Room ids from first to last inclusive, e.g. Room-01..Room-08"""
+    start, end = ROOM_NUMBER.match(first), ROOM_NUMBER.match(last)
+    if not start or not end or start.group(1) != end.group(1):
+        raise ValueError(f"Room range {first}..{last} needs two room ids with the same prefix and a number")
+    prefix, width = start.group(1), len(start.group(2))
+    low, high = int(start.group(2)), int(end.group(2))
+    if high < low or high - low >= MAX_SUBSCRIPTION_TOPICS:
+        raise ValueError(f"Room range {first}..{last} is empty or too large")
+    return [f"{prefix}{number:0{width}d}" for number in range(low, high + 1)]
+
+def _string_list(message: Dict[str, Any], field: str, allowed: Sequence[str]) -> List[str]:
+    """A subscribe field that must be a list of names from `allowed`"""
+    values = message.get(field) or []
+    if (not isinstance(values, list) or not all(isinstance(value, str) for value in values)
+            or set(values) - set(allowed)):
+        raise ValueError(f"{field} must be a list of: {', '.join(allowed)}")
+    return values
+
+class Subscription:
+    """What a client wants to receive; an empty filter matches everything"""
+    
+    def __init__(self, patient_ids: Iterable[int] = (), rooms: Iterable[str] = (),
+                 statuses: Iterable[str] = (), message_types: Iterable[str] = ()):
+        self.patient_ids = frozenset(patient_ids)
+        self.rooms = frozenset(rooms)
+        self.statuses = frozenset(statuses)
+        self.message_types = frozenset(message_types)
+        # Clients with equal subscriptions share one index entry and one payload per message
+        self.key = (self.patient_ids, self.rooms, self.statuses, self.message_types)
+    
+    @classmethod
+    def from_message(cls, message: Dict[str, Any]) -> "Subscription":
+        """Parse a subscribe control message, raising ValueError if it is invalid"""
+        patient_ids = message.get("patient_ids") or []
+        if not isinstance(patient_ids, list) or not all(
+            isinstance(p, int) and not isinstance(p, bool) for p in patient_ids
+        ):
+            raise ValueError("patient_ids must be a list of integers")
+        room_specs = message.get("rooms") or []
+        if not isinstance(room_specs, list):
+            raise ValueError("rooms must be a list of room ids or [first, last] ranges")
+        rooms: List[str] = []
+        for room in room_specs:
+            if isinstance(room, str):
+                rooms.append(room)
+            elif isinstance(room, list) and len(room) == 2 and all(isinstance(r, str) for r in room):
+                rooms.extend(expand_room_range(*room))
+            else:
+                raise ValueError("rooms must be room ids or [first, last] ranges")
+        if len(patient_ids) + len(rooms) > MAX_SUBSCRIPTION_TOPICS:
+            raise ValueError(f"A subscription may name at most {MAX_SUBSCRIPTION_TOPICS} patients and rooms")
+        statuses = _string_list(message, "statuses", SUBSCRIPTION_STATUSES)
+        message_types = _string_list(message, "message_types", SUBSCRIPTION_MESSAGE_TYPES)
+        return cls(patient_ids, rooms, statuses, message_types)
+    
+    @property
+    def scoped(self) -> bool:
+        """Limited to particular patients or rooms"""
+        return bool(self.patient_ids or self.rooms)
+    
+    @property
+    def filters_patients(self) -> bool:
+        return self.scoped or bool(self.statuses)
+    
+    def topics(self) -> List[Tuple]:
+        """Index entries this subscription is reachable from"""
+        if not self.scoped:
+            return [ALL_PATIENTS_TOPIC]
+        return [("patient", p) for p in self.patient_ids] + [("room", r) for r in self.rooms]
+    
+    def wants(self, message_type: str) -> bool:
+        return not self.message_types or MESSAGE_TYPE_TOPICS.get(message_type, message_type) in self.message_types
+    
+    def matches(self, patient_id: Any, room_id: Optional[str], *statuses: Optional[str]) -> bool:
+        """Whether a patient in one of the given statuses is covered"""
+        if self.scoped and patient_id not in self.patient_ids and room_id not in self.rooms:
+            return False
+        return not self.statuses or any(status in self.statuses for status in statuses)
+    
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "patient_ids": sorted(self.patient_ids),
+            "rooms": sorted(self.rooms),
+            "statuses": sorted(self.statuses),
+            "message_types": sorted(self.message_types)
+        }
+
+EVERYTHING = Subscription()
+
+def _delta_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """A patient entry with numeric vitals at delta precision; the EKG stays raw"""
+    return {
+        **entry,
+        "vitals": {
+            name: round(value, DELTA_VITALS_PRECISION) if isinstance(value, float) else value
+            for name, value in entry["vitals"].items()
+        }
+    }
+
+def _json_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """A patient entry with its EKG waveform encoded as base64 for JSON clients"""
+    vitals = entry["vitals"]
+    waveform = vitals.get("ekg_data")
+    if waveform is None and "ekg_data" in vitals:
+        return entry
+    return {**entry, "vitals": {**vitals, "ekg_data": waveform_to_base64(waveform)}}
+
+def _same_reading(before: Any, value: Any) -> bool:
+    """Unchanged since the last tick; waveforms are new arrays whenever they change"""
+    if isinstance(before, np.ndarray) or isinstance(value, np.ndarray):
+        return before is value
+    return before == value
+
+class ClientConnection:
+    """A connected client with its own bounded send queue and writer task"""
+    
+    def __init__(self, websocket: WebSocket, queue_size: int, policy: str, protocol: str = "full"):
+        self.websocket = websocket
+        self.policy = policy
+        self.protocol = protocol
+        # Delta and transitions clients need a snapshot before updates make sense
+        self.needs_snapshot = protocol in SNAPSHOT_PROTOCOLS
+        self.subscription = EVERYTHING
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.writer_task: Optional[asyncio.Task] = None
+        self.dropped_messages = 0
+        self.closing = False
+    
+    def enqueue(self, message_type: str, payload: Union[str, bytes]) -> bool:
+        """Queue a serialized message, applying the slow-consumer policy when full.
+        
+        Returns False if the client should be disconnected.
+        """
+        if self.queue.full():
+            if self.policy == "disconnect":
+                return False
+            if self.policy == "coalesce" and message_type in COALESCIBLE_MESSAGE_TYPES:
+                self._discard_queued(message_type)
+            if self.queue.full():
+                self.queue.get_nowait()
+                self.dropped_messages += 1
+                DROPPED_MESSAGES.inc()
+        self.queue.put_nowait((message_type, payload))
+        return True
+    
+    def _discard_queued(self, message_type: str):
+        """Drop queued messages that a newer message of the same type supersedes"""
+        kept: List[Tuple[str, Union[str, bytes]]] = []
+        while not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item[0] == message_type:
+                self.dropped_messages += 1
+                DROPPED_MESSAGES.inc()
+            else:
+                kept.append(item)
+        for item in kept:
+            self.queue.put_nowait(item)
+
 class WebSocketManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    def __init__(self, queue_size: Optional[int] = None, slow_consumer_policy: Optional[str] = None):
+        self.active_connections: Dict[WebSocket, ClientConnection] = {}
         self.lock = asyncio.Lock()
+        self.queue_size = queue_size or int(os.getenv("WS_SEND_QUEUE_SIZE", "32"))
+        self.slow_consumer_policy = slow_consumer_policy or os.getenv("WS_SLOW_CONSUMER_POLICY", "drop_oldest")
+        if self.slow_consumer_policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Unknown slow consumer policy: {self.slow_consumer_policy}")
+        self.slow_disconnects = 0
+        self.status_changes_sent = 0
+        
+        # Last broadcast entry per patient, as received (EKG still raw), and its sequence number
+        self.latest_vitals: Dict[Any, Dict[str, Any]] = {}
+        self.vitals_seq = 0
+        # The same at delta precision, built only when a delta client needs it; see _delta_state
+        self.vitals_state: Dict[Any, Dict[str, Any]] = {}
+        self._state_seq = -1
+        # Broadcasts happened with nobody connected, so rooms and the binary index are behind
+        self._idle = False
+        
+        # Subscriptions: topic ("patient", id) / ("room", id) / ALL_PATIENTS_TOPIC -> subscription
+        # keys, and each key's subscription and connections
+        self.topic_index: Dict[Tuple, Set[Tuple]] = {}
+        self.subscriptions: Dict[Tuple, Subscription] = {}
+        self.subscribers: Dict[Tuple, Set[ClientConnection]] = {}
+        # Patients each filtered subscription saw on the last broadcast, so its deltas can add and remove
+        self.selections: Dict[Tuple, Set[Any]] = {}
+        self.patient_rooms: Dict[Any, Optional[str]] = {}
+        self.room_patients: Dict[Optional[str], Set[Any]] = {}
+        
+        # Patient order binary frames index into; append-only, versioned on every change
+        self.index_rows: Dict[Any, int] = {}
+        self.index_patients: List[Any] = []
+        self.index_labels: Dict[Any, Tuple[Optional[str], Optional[str]]] = {}
+        self.index_version = 0
+        self._index_payload: Optional[Tuple[Tuple[int, int], str]] = None
     
-    async def add_connection(self, websocket: WebSocket):
-        """Add a new WebSocket connection"""
+    async def add_connection(self, websocket: WebSocket, slow_consumer_policy: Optional[str] = None,
+                             protocol: Optional[str] = None):
+        """Add a new WebSocket connection and start its writer task"""
+        policy = slow_consumer_policy or self.slow_consumer_policy
+        if policy not in SLOW_CONSUMER_POLICIES:
+            policy = self.slow_consumer_policy
+        if protocol not in VITALS_PROTOCOLS:
+            protocol = "full"
+        client = ClientConnection(websocket, self.queue_size, policy, protocol)
+        client.writer_task = asyncio.create_task(self._writer_loop(client))
         async with self.lock:
-            self.active_connections.append(websocket)
+            self.active_connections[websocket] = client
+            self._index_client(client)
+            CONNECTIONS.set(len(self.active_connections))
             logger.info(f"WebSocket connected. Total connections: {len(self.active_connections)}")
+        self._send_snapshot_if_needed(client)
+    
+    async def handle_client_message(self, websocket: WebSocket, text: str):
+        """Handle a control message sent by a client"""
+        client = self.active_connections.get(websocket)
+        if not client:
+            return
+        try:
+            message = loads(text)
+        except ValueError:
+            return
+        if not isinstance(message, dict):
+            return
+        
+        message_type = message.get("type")
+        if message_type == "set_protocol" and message.get("protocol") in VITALS_PROTOCOLS:
+            client.protocol = message["protocol"]
+            client.needs_snapshot = client.protocol in SNAPSHOT_PROTOCOLS
+            self._send_snapshot_if_needed(client)
+        elif message_type == "resync" and client.protocol in SNAPSHOT_PROTOCOLS:
+            client.needs_snapshot = True
+            self._send_snapshot_if_needed(client)
+        elif message_type in ("subscribe", "unsubscribe"):
+            try:
+                subscription = Subscription.from_message(message) if message_type == "subscribe" else EVERYTHING
+            except ValueError as e:
+                self._enqueue(client, "error", self._serialize({"type": "error", "error": str(e)}))
+                return
+            self._subscribe(client, subscription)
+    
+    def _subscribe(self, client: ClientConnection, subscription: Subscription):
+        """Replace a client's subscription and resend its snapshot for the new selection"""
+        self._unindex_client(client)
+        client.subscription = subscription
+        self._index_client(client)
+        self._enqueue(client, "subscribed", self._serialize({"type": "subscribed", "subscription": subscription.describe()}))
+        client.needs_snapshot = client.protocol in SNAPSHOT_PROTOCOLS
+        self._send_snapshot_if_needed(client)
+    
+    def _index_client(self, client: ClientConnection):
+        key = client.subscription.key
+        if key not in self.subscribers:
+            self.subscriptions[key] = client.subscription
+            self.subscribers[key] = set()
+            for topic in client.subscription.topics():
+                self.topic_index.setdefault(topic, set()).add(key)
+        self.subscribers[key].add(client)
+    
+    def _unindex_client(self, client: ClientConnection):
+        key = client.subscription.key
+        clients = self.subscribers.get(key)
+        if clients is None:
+            return
+        clients.discard(client)
+        if clients:
+            return
+        for topic in self.subscriptions[key].topics():
+            keys = self.topic_index.get(topic)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.topic_index[topic]
+        del self.subscribers[key]
+        del self.subscriptions[key]
+        self.selections.pop(key, None)
     
-    async def remove_connection(self, websocket: WebSocket):
+    def _keys_for_patient(self, patient_id: Any, room_id: Optional[str]) -> Set[Tuple]:
+        """Subscription keys that may cover a patient, from the topic index"""
+        keys = set(self.topic_index.get(ALL_PATIENTS_TOPIC, ()))
+        keys.update(self.topic_index.get(("patient", patient_id), ()))
+        keys.update(self.topic_index.get(("room", room_id), ()))
+        return keys
+    
+    def _update_rooms(self, vitals_data: Dict[Any, Dict[str, Any]]):
+        """Keep the room -> patients map current for room subscriptions"""
+        for patient_id, entry in vitals_data.items():
+            room_id = entry.get("room_id")
+            previous_room = self.patient_rooms.get(patient_id)
+            if previous_room != room_id:
+                if previous_room is not None:
+                    self.room_patients[previous_room].discard(patient_id)
+                self.patient_rooms[patient_id] = room_id
+                self.room_patients.setdefault(room_id, set()).add(patient_id)
+    
+    def _select(self, subscription: Subscription) -> Set[Any]:
+        """Patients in the current state that one filtered subscription covers"""
+        state = self.latest_vitals
+        if subscription.scoped:
+            # Only look at the named patients and rooms, not the whole ward
+            candidates = set(subscription.patient_ids)
+            for room_id in subscription.rooms:
+                candidates.update(self.room_patients.get(room_id, ()))
+            candidates.intersection_update(state)
+        else:
+            candidates = state.keys()
+        if not subscription.statuses:
+            return set(candidates)
+        return {patient_id for patient_id in candidates if state[patient_id].get("status") in subscription.statuses}
+    
+    def _select_patients(self) -> Dict[Tuple, Set[Any]]:
+        """Patients in the current state covered by each filtered subscription"""
+        return {
+            key: self._select(subscription)
+            for key, subscription in self.subscriptions.items() if subscription.filters_patients
+        }
+    
+    def _selected_state(self, subscription: Subscription, state: Dict[Any, Dict[str, Any]]) -> Dict[Any, Dict[str, Any]]:
+        """A per-patient state restricted to what one subscription covers"""
+        if not subscription.filters_patients:
+            return state
+        selection = self.selections.get(subscription.key)
+        if selection is None:
+            selection = self.selections[subscription.key] = self._select(subscription)
+        return {patient_id: state[patient_id] for patient_id in selection if patient_id in state}
+    
+    async def remove_connection(self, websocket: WebSocket, reason: str = "closed"):
         """Remove a WebSocket connection"""
         async with self.lock:
-            if websocket in self.active_connections:
-                self.active_connections.remove(websocket)
+            client = self.active_connections.pop(websocket, None)
+            if client:
+                self._unindex_client(client)
+                CONNECTIONS.set(len(self.active_connections))
+                DISCONNECTS.labels(reason).inc()
                 logger.info(f"WebSocket disconnected. Total connections: {len(self.active_connections)}")
+        if client and client.writer_task is not asyncio.current_task():
+            client.writer_task.cancel()
+    
+    async def _writer_loop(self, client: ClientConnection):
+        """Send queued messages to one client until it fails or is removed"""
+        send_seconds = SEND_SECONDS.labels()
+        try:
+            while True:
+                _, payload = await client.queue.get()
+                start = time.perf_counter()
+                if isinstance(payload, bytes):
+                    await client.websocket.send_bytes(payload)
+                else:
+                    await client.websocket.send_text(payload)
+                send_seconds.observe(time.perf_counter() - start)
+                SENT_BYTES.inc(len(payload))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error sending message to WebSocket: {e}")
+            await self.remove_connection(client.websocket, reason="send_error")
+    
+    async def _disconnect_slow_client(self, client: ClientConnection):
+        """Close a client that could not keep up with the broadcast rate"""
+        self.slow_disconnects += 1
+        logger.warning("Disconnecting slow WebSocket consumer")
+        await self.remove_connection(client.websocket, reason="slow_consumer")
+        try:
+            await client.websocket.close(code=1008)
+        except Exception:
+            pass
+    
+    def _serialize(self, message: Dict[str, Any]) -> str:
+        """Stamp a message and serialize it once for every recipient"""
+        start = time.perf_counter()
+        message["timestamp"] = datetime.now().isoformat()
+        payload = dumps_text(message)
+        SERIALIZE_SECONDS.labels(message.get("type", "")).observe(time.perf_counter() - start)
+        return payload
+    
+    def _enqueue(self, client: ClientConnection, message_type: str, payload: Union[str, bytes]):
+        """Queue a payload for one client, disconnecting it if the policy says so"""
+        if client.closing:
+            return
+        if not client.enqueue(message_type, payload):
+            client.closing = True
+            asyncio.create_task(self._disconnect_slow_client(client))
+    
+    def _recipients(self, message_type: str, patient_id: Any = None, room_id: Optional[str] = None,
+                    statuses: Optional[Tuple[Optional[str], ...]] = None) -> List[ClientConnection]:
+        """Clients subscribed to a message, found through the topic index"""
+        if patient_id is None:
+            keys: Iterable[Tuple] = self.subscribers.keys()
+        else:
+            entry = self.latest_vitals.get(patient_id, {})
+            room_id = room_id or entry.get("room_id")
+            statuses = statuses or (entry.get("status"),)
+            keys = [
+                key for key in self._keys_for_patient(patient_id, room_id)
+                if self.subscriptions[key].matches(patient_id, room_id, *statuses)
+            ]
+        return [
+            client for key in keys if self.subscriptions[key].wants(message_type)
+            for client in self.subscribers[key]
+        ]
     
     async def broadcast(self, message: Dict[str, Any]):
-        """Broadcast a message to all connected clients"""
+        """Broadcast a message to every client subscribed to it"""
         if not self.active_connections:
             return
         
-        # Add timestamp to message
-        message["timestamp"] = datetime.now().isoformat()
+        json_message = self._serialize(message)
+        message_type = message.get("type", "")
+        data = message.get("data")
+        patient_id = data.get("patient_id") if isinstance(data, dict) else None
         
-        # Convert to JSON
-        json_message = json.dumps(message)
+        # Enqueue without awaiting any client, so a slow socket never delays the others
+        for client in self._recipients(message_type, patient_id):
+            self._enqueue(client, message_type, json_message)
+    
+    async def broadcast_vitals(self, vitals_data: Dict[str, Any], partial: bool = False,
+                               generated_at: Optional[float] = None):
+        """Broadcast vital signs data to all connected clients
         
-        # Send to all connections
-        disconnected = []
-        async with self.lock:
-            for connection in self.active_connections:
-                try:
-                    await connection.send_text(json_message)
-                except Exception as e:
-                    logger.error(f"Error sending message to WebSocket: {e}")
-                    disconnected.append(connection)
+        With partial=True vitals_data only covers some patients (e.g. an
+        ingested batch); everyone else keeps their last known state.
+        generated_at is the epoch time the readings were produced (now if not
+        given); messages carry it so clients can measure staleness.
+        """
+        generated_at = generated_at or time.time()
+        previous_seq = self.vitals_seq
+        self.latest_vitals = {**self.latest_vitals, **vitals_data} if partial else vitals_data
+        self.vitals_seq += 1
+        if not self.active_connections:
+            # Nobody to send to; rooms, the binary index and the delta state catch up on demand
+            self._idle = True
+            return
+        
+        changed = self.latest_vitals if self._idle else vitals_data
+        self._idle = False
+        self._update_rooms(changed)
+        if self._update_index(changed):
+            # Binary clients need the new patient order before a frame that uses it
+            for client in list(self.active_connections.values()):
+                if client.protocol == "binary":
+                    client.needs_snapshot = True
+                    self._send_snapshot_if_needed(client)
+        
+        # Delta clients see vitals at display precision, so unchanged readings stay unchanged
+        previous_state = {}
+        if any(c.protocol == "delta" for c in self.active_connections.values()):
+            if self._state_seq == previous_seq:
+                previous_state = self.vitals_state
+                current_state = {patient_id: _delta_entry(entry) for patient_id, entry in vitals_data.items()}
+                self.vitals_state = {**previous_state, **current_state} if partial else current_state
+                self._state_seq = self.vitals_seq
+            else:
+                # No delta client was ready last tick; their snapshot comes from the new state
+                self._delta_state()
+        
+        previous_selections, self.selections = self.selections, self._select_patients()
+        
+        # One payload per distinct subscription, shared by all of its clients
+        data = None
+        full_payload = None
+        delta = None
+        delta_payload = None
+        frame = None
+        frame_payload = None
+        for key, subscribers in self.subscribers.items():
+            subscription = self.subscriptions[key]
+            if not subscription.wants("vitals_update"):
+                continue
+            full_clients = [c for c in subscribers if c.protocol == "full"]
+            delta_clients = [c for c in subscribers if c.protocol == "delta" and not c.needs_snapshot]
+            binary_clients = [c for c in subscribers if c.protocol == "binary" and not c.needs_snapshot]
+            selection = self.selections.get(key)
+            
+            if full_clients:
+                if data is None:
+                    # EKG waveforms travel as arrays internally and only become base64 for JSON
+                    data = {patient_id: _json_entry(entry) for patient_id, entry in vitals_data.items()}
+                if selection is None:
+                    if full_payload is None:
+                        full_payload = self._serialize(
+                            {"type": "vitals_update", "generated_at": generated_at, "data": data}
+                        )
+                    payload = full_payload
+                else:
+                    selected = {patient_id: data[patient_id] for patient_id in selection if patient_id in data}
+                    payload = self._serialize(
+                        {"type": "vitals_update", "generated_at": generated_at, "data": selected}
+                    ) if selected else None
+                if payload:
+                    for client in full_clients:
+                        self._enqueue(client, "vitals_update", payload)
             
-            # Remove disconnected connections
-            for connection in disconnected:
-                if connection in self.active_connections:
-                    self.active_connections.remove(connection)
+            if delta_clients:
+                if delta is None:
+                    delta = self._build_vitals_delta(previous_state, self.vitals_state, generated_at)
+                if selection is None:
+                    if delta_payload is None:
+                        delta_payload = self._serialize(dict(delta))
+                    payload = delta_payload
+                else:
+                    payload = self._serialize(self._filter_delta(delta, selection, previous_selections.get(key, set())))
+                for client in delta_clients:
+                    self._enqueue(client, "vitals_delta", payload)
+            
+            if binary_clients:
+                if frame is None:
+                    frame = WardFrame(vitals_data, self.index_rows)
+                if selection is None:
+                    if frame_payload is None:
+                        frame_payload = self._pack_frame(frame, generated_at)
+                    payload = frame_payload
+                else:
+                    positions = frame.positions(selection)
+                    payload = self._pack_frame(frame, generated_at, positions) if len(positions) else None
+                if payload:
+                    for client in binary_clients:
+                        self._enqueue(client, "vitals_frame", payload)
         
-        if disconnected:
-            logger.info(f"Removed {len(disconnected)} disconnected WebSocket connections")
+        # Clients that connected or asked to resync get the new snapshot
+        for client in list(self.active_connections.values()):
+            self._send_snapshot_if_needed(client)
     
-    async def broadcast_vitals(self, vitals_data: Dict[str, Any]):
-        """Broadcast vital signs data to all connected clients"""
-        message = {
-            "type": "vitals_update",
-            "data": vitals_data
+    def _catch_up(self):
+        """Bring rooms and the binary index up to date after broadcasts nobody received"""
+        if self._idle:
+            self._idle = False
+            self._update_rooms(self.latest_vitals)
+            self._update_index(self.latest_vitals)
+    
+    def _delta_state(self) -> Dict[Any, Dict[str, Any]]:
+        """latest_vitals at delta precision, rebuilt only if it is behind"""
+        if self._state_seq != self.vitals_seq:
+            self.vitals_state = {patient_id: _delta_entry(entry) for patient_id, entry in self.latest_vitals.items()}
+            self._state_seq = self.vitals_seq
+        return self.vitals_state
+    
+    def _update_index(self, vitals_data: Dict[Any, Dict[str, Any]]) -> bool:
+        """Add new patients to the binary index and note renames and moves; True if it changed"""
+        changed = False
+        for patient_id, entry in vitals_data.items():
+            labels = (entry.get("patient_name"), entry.get("room_id"))
+            if self.index_labels.get(patient_id) == labels:
+                continue
+            if patient_id not in self.index_rows:
+                self.index_rows[patient_id] = len(self.index_patients)
+                self.index_patients.append(patient_id)
+            self.index_labels[patient_id] = labels
+            changed = True
+        if changed:
+            self.index_version += 1
+        return changed
+    
+    def _vitals_index(self) -> str:
+        """The vitals_index message, serialized once per index version and tick"""
+        key = (self.index_version, self.vitals_seq)
+        if self._index_payload is None or self._index_payload[0] != key:
+            patients = []
+            for patient_id in self.index_patients:
+                name, room_id = self.index_labels[patient_id]
+                entry = self.latest_vitals.get(patient_id, {})
+                patients.append({
+                    "patient_id": patient_id,
+                    "patient_name": name,
+                    "room_id": room_id,
+                    "status": entry.get("status"),
+                    "reason": entry.get("reason"),
+                    "recommended_action": entry.get("recommended_action")
+                })
+            message = {
+                "type": "vitals_index",
+                "seq": self.vitals_seq,
+                "index_version": self.index_version,
+                **frame_layout(),
+                "patients": patients
+            }
+            self._index_payload = (key, self._serialize(message))
+        return self._index_payload[1]
+    
+    def _pack_frame(self, frame: WardFrame, generated_at: float, positions=None) -> bytes:
+        start = time.perf_counter()
+        payload = frame.pack(self.vitals_seq, self.index_version, len(self.index_patients), generated_at, positions)
+        SERIALIZE_SECONDS.labels("vitals_frame").observe(time.perf_counter() - start)
+        return payload
+    
+    def _filter_delta(self, delta: Dict[str, Any], selection: Set[Any], previous_selection: Set[Any]) -> Dict[str, Any]:
+        """Restrict a ward delta to one subscription's patients.
+        
+        Patients that just entered the selection are sent in full, and those
+        that left it (e.g. no longer critical) are listed as removed.
+        """
+        changes = {}
+        for patient_id in selection:
+            if patient_id not in previous_selection:
+                changes[patient_id] = _json_entry(self.vitals_state[patient_id])
+            elif patient_id in delta["changes"]:
+                changes[patient_id] = delta["changes"][patient_id]
+        removed = [patient_id for patient_id in previous_selection if patient_id not in selection]
+        return {**delta, "changes": changes, "removed": removed}
+    
+    def _build_vitals_delta(self, previous: Dict[Any, Dict[str, Any]], current: Dict[Any, Dict[str, Any]],
+                            generated_at: float) -> Dict[str, Any]:
+        """Build a vitals_delta message with only what changed since the previous tick"""
+        changes = {}
+        for patient_id, entry in current.items():
+            before = previous.get(patient_id)
+            if before is None:
+                changes[patient_id] = _json_entry(entry)
+                continue
+            
+            change = {}
+            changed_vitals = {
+                name: value for name, value in entry["vitals"].items()
+                if not _same_reading(before["vitals"].get(name), value)
+            }
+            if "ekg_data" in changed_vitals:
+                changed_vitals["ekg_data"] = waveform_to_base64(changed_vitals["ekg_data"])
+            if changed_vitals:
+                change["vitals"] = changed_vitals
+            for field in DELTA_FIELDS:
+                if entry.get(field) != before.get(field):
+                    change[field] = entry.get(field)
+            if change:
+                changes[patient_id] = change
+        
+        return {
+            "type": "vitals_delta",
+            "generated_at": generated_at,
+            "seq": self.vitals_seq,
+            "base_seq": self.vitals_seq - 1,
+            "changes": changes,
+            "removed": [patient_id for patient_id in previous if patient_id not in current]
         }
-        await self.broadcast(message)
     
-    async def broadcast_patient_status(self, patient_id: int, status: str, reason: str = None):
+    def _send_snapshot_if_needed(self, client: ClientConnection):
+        """Send the current snapshot to a delta, transitions or binary client waiting for one"""
+        self._catch_up()
+        if not client.needs_snapshot or not self.latest_vitals:
+            return
+        client.needs_snapshot = False
+        message_type = {"transitions": "status_snapshot", "binary": "vitals_index"}.get(client.protocol, "vitals_snapshot")
+        if not client.subscription.wants(message_type):
+            return
+        if message_type == "vitals_index":
+            # The whole ward, since frames index into it; subscriptions only limit the frames
+            self._enqueue(client, message_type, self._vitals_index())
+            return
+        if message_type == "status_snapshot":
+            state = self._selected_state(client.subscription, self.latest_vitals)
+            payload = self._serialize({"type": "status_snapshot", "data": self._status_snapshot(state)})
+        else:
+            state = self._selected_state(client.subscription, self._delta_state())
+            data = {patient_id: _json_entry(entry) for patient_id, entry in state.items()}
+            payload = self._serialize({"type": "vitals_snapshot", "seq": self.vitals_seq, "data": data})
+        self._enqueue(client, message_type, payload)
+    
+    def _status_snapshot(self, state: Dict[Any, Dict[str, Any]]) -> Dict[Any, Dict[str, Any]]:
+        """Current status of each patient in a state, without vitals"""
+        return {
+            patient_id: {
+                "room_id": entry.get("room_id"),
+                "status": entry.get("status"),
+                "reason": entry.get("reason")
+            }
+            for patient_id, entry in state.items()
+        }
+    
+    def get_patient_status(self, patient_id: int) -> Optional[str]:
+        """Last broadcast status of a patient"""
+        entry = self.latest_vitals.get(patient_id)
+        return entry.get("status") if entry else None
+    
+    async def broadcast_patient_status(self, patient_id: int, status: str, reason: str = None,
+                                       previous_status: Optional[str] = None, room_id: Optional[str] = None,
+                                       recommended_action: Optional[str] = None):
         """Broadcast patient status change"""
         message = {
             "type": "status_change",
             "patient_id": patient_id,
+            "room_id": room_id,
+            "previous_status": previous_status,
             "status": status,
-            "reason": reason
+            "reason": reason,
+            "recommended_action": recommended_action
         }
-        await self.broadcast(message)
+        if not self.active_connections:
+            return
+        payload = self._serialize(message)
+        # Subscribers to either status hear about the transition; clients still
+        # waiting for a snapshot will see the new status in it
+        for client in self._recipients("status_change", patient_id, room_id, (status, previous_status)):
+            if not client.needs_snapshot:
+                self._enqueue(client, "status_change", payload)
+        self.status_changes_sent += 1
     
     async def broadcast_treatment_decision(self, treatment_data: Dict[str, Any]):
         """Broadcast treatment decision"""
@@ -90,4 +776,19 @@ class WebSocketManager:
     
     def get_connection_count(self) -> int:
         """Get the number of active connections"""
-        return len(self.active_connections) 
\ No newline at end of file
+        return len(self.active_connections)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get fan-out queue statistics"""
+        clients = list(self.active_connections.values())
+        return {
+            "connections": len(clients),
+            "queue_size": self.queue_size,
+            "slow_consumer_policy": self.slow_consumer_policy,
+            "max_queue_depth": max((c.queue.qsize() for c in clients), default=0),
+            "dropped_messages": sum(c.dropped_messages for c in clients),
+            "slow_disconnects": self.slow_disconnects,
+            "status_changes_sent": self.status_changes_sent,
+            "subscriptions": len(self.subscribers),
+            "subscription_topics": len(self.topic_index)
+        } 
\ No newline at end of file
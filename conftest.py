@@ -0,0 +1,56 @@
+"""Shared pytest setup: backend imports and a throwaway SQLite database"""
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+# Settings the services read at import time; tests never touch a real database
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="kpum-test-"), "test.db")
+os.environ.pop("ASYNC_DATABASE_URL", None)
+
+# Every model must be registered before any mapper is used, since Patient's
+# relationships refer to the others by name
+import models.patient, models.vitals, models.vitals_rollup, models.treatment, models.dispatch  # noqa: E402,F401
+
+@pytest.fixture
+def run():
+    """asyncio.run that closes pooled async connections before the loop ends"""
+    from database import async_engine
+
+    def run_async(coro):
+        async def main():
+            try:
+                return await coro
+            finally:
+                await async_engine.dispose()
+        return asyncio.run(main())
+    return run_async
+
+@pytest.fixture
+def database():
+    """Create every table before a test and drop them after it"""
+    from database import Base, engine
+
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    Base.metadata.drop_all(bind=engine)
+
+@pytest.fixture
+def patients(database):
+    """Three admitted patients in Room-01..Room-03; returns their ids"""
+    from database import SessionLocal
+    from models.patient import Patient
+
+    with SessionLocal() as db:
+        rows = [
+            Patient(name=f"Patient {i}", age=50 + i, sex="F", room_id=f"Room-0{i}",
+                    medical_conditions=None, is_active=True)
+            for i in range(1, 4)
+        ]
+        db.add_all(rows)
+        db.commit()
+        return [row.id for row in rows]
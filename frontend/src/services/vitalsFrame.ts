@@ -0,0 +1,102 @@
+import { VitalsIndex } from '../types';
+
+// Decoder for the binary vitals frames of the kpum.vitals.v1 sub-protocol.
+// Layout (little-endian, arrays 4-byte aligned; see backend/services/vitals_frames.py):
+//   header: magic "KPVF", version u8, flags u8, ekg_samples u16,
+//           index_version u32, count u32, seq u32, generated_at f64
+//   rows:   count u32 positions in the vitals_index patient list (FLAG_ROWS only)
+//   vitals: count x 6 f32 in vital_signs order
+//   status: count u8 codes, count u8 EWS scores, padded to 4 bytes
+//   ekg:    count x ekg_samples i16 in mV x 1000 (FLAG_EKG only)
+export const BINARY_SUBPROTOCOL = 'kpum.vitals.v1';
+
+const FRAME_MAGIC = 0x4656504b; // "KPVF" read as a little-endian u32
+const FRAME_VERSION = 1;
+const HEADER_SIZE = 28;
+const FLAG_ROWS = 1;
+const FLAG_EKG = 2;
+
+export interface VitalsFrame {
+  indexVersion: number;
+  seq: number;
+  generatedAt: number;
+  count: number;
+  rows: Uint32Array | null; // null when the frame covers index positions 0..count-1
+  vitals: Float32Array;
+  status: Uint8Array;
+  ews: Uint8Array;
+  ekgSamples: number;
+  ekg: Int16Array | null;
+}
+
+// Views into the frame buffer; nothing is copied
+export function decodeVitalsFrame(buffer: ArrayBuffer, signals = 6): VitalsFrame {
+  const view = new DataView(buffer);
+  if (view.getUint32(0, true) !== FRAME_MAGIC || view.getUint8(4) !== FRAME_VERSION) {
+    throw new Error('Not a version 1 vitals frame');
+  }
+  const flags = view.getUint8(5);
+  const ekgSamples = view.getUint16(6, true);
+  const count = view.getUint32(12, true);
+  let offset = HEADER_SIZE;
+
+  let rows: Uint32Array | null = null;
+  if (flags & FLAG_ROWS) {
+    rows = new Uint32Array(buffer, offset, count);
+    offset += 4 * count;
+  }
+  const vitals = new Float32Array(buffer, offset, count * signals);
+  offset += 4 * count * signals;
+  const status = new Uint8Array(buffer, offset, count);
+  const ews = new Uint8Array(buffer, offset + count, count);
+  offset += (2 * count + 3) & ~3;
+  const ekg = flags & FLAG_EKG ? new Int16Array(buffer, offset, count * ekgSamples) : null;
+
+  return {
+    indexVersion: view.getUint32(8, true),
+    seq: view.getUint32(16, true),
+    generatedAt: view.getFloat64(20, true),
+    count,
+    rows,
+    vitals,
+    status,
+    ews,
+    ekgSamples,
+    ekg,
+  };
+}
+
+// One patient's waveform, without the padding shorter waveforms get
+export function frameWaveform(frame: VitalsFrame, i: number, missing: number): Int16Array | undefined {
+  if (!frame.ekg) return undefined;
+  const samples = frame.ekg.subarray(i * frame.ekgSamples, (i + 1) * frame.ekgSamples);
+  const end = samples.indexOf(missing);
+  return end === -1 ? samples : samples.subarray(0, end);
+}
+
+// Rebuild the data of a vitals_update message, for listeners written against JSON
+export function frameToVitalsUpdate(frame: VitalsFrame, index: VitalsIndex): Record<number, any> {
+  const signals = index.vital_signs.length;
+  const data: Record<number, any> = {};
+  for (let i = 0; i < frame.count; i++) {
+    const patient = index.patients[frame.rows ? frame.rows[i] : i];
+    if (!patient) continue;
+    const vitals: Record<string, any> = {};
+    index.vital_signs.forEach((name, j) => {
+      const value = frame.vitals[i * signals + j];
+      vitals[name] = Number.isNaN(value) ? null : value;
+    });
+    vitals.ekg_data = frameWaveform(frame, i, index.ekg_missing);
+    data[patient.patient_id] = {
+      patient_id: patient.patient_id,
+      patient_name: patient.patient_name,
+      room_id: patient.room_id,
+      vitals,
+      status: index.status_names[frame.status[i]],
+      reason: patient.reason,
+      recommended_action: patient.recommended_action,
+      ews_score: frame.ews[i] === index.ews_missing ? null : frame.ews[i],
+    };
+  }
+  return data;
+}
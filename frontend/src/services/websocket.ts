@@ -1,4 +1,5 @@
-import { WebSocketMessage, ConnectionStatus } from '../types';
+import { WebSocketMessage, ConnectionStatus, VitalsIndex } from '../types';
+import { BINARY_SUBPROTOCOL, decodeVitalsFrame, frameToVitalsUpdate } from './vitalsFrame';
 
 class WebSocketService {
   private ws: WebSocket | null = null;
@@ -6,15 +7,23 @@ class WebSocketService {
   private maxReconnectAttempts = 5;
   private reconnectDelay = 1000;
   private listeners: Map<string, ((data: any) => void)[]> = new Map();
-
-  constructor(private url: string = process.env.REACT_APP_WS_URL || 'ws://localhost:8000/ws') {
+  private vitalsIndex: VitalsIndex | null = null;
+  private resyncPending = false;
+
+  constructor(
+    private url: string = process.env.REACT_APP_WS_URL || 'ws://localhost:8000/ws',
+    // Binary vitals frames instead of JSON vitals_update; the server must accept the sub-protocol
+    private binary: boolean = process.env.REACT_APP_WS_BINARY === 'true'
+  ) {
     console.log('WebSocket URL:', this.url);
   }
 
   connect(): Promise<void> {
     return new Promise((resolve, reject) => {
       try {
-        this.ws = new WebSocket(this.url);
+        this.ws = this.binary ? new WebSocket(this.url, [BINARY_SUBPROTOCOL]) : new WebSocket(this.url);
+        this.ws.binaryType = 'arraybuffer';
+        this.vitalsIndex = null;
 
         this.ws.onopen = () => {
           console.log('WebSocket connected');
@@ -25,6 +34,10 @@ class WebSocketService {
 
         this.ws.onmessage = (event) => {
           try {
+            if (event.data instanceof ArrayBuffer) {
+              this.handleFrame(event.data);
+              return;
+            }
             const message: WebSocketMessage = JSON.parse(event.data);
             this.handleMessage(message);
           } catch (error) {
@@ -66,7 +79,12 @@ class WebSocketService {
       case 'vitals_update':
         this.notifyListeners('vitals_update', message.data);
         break;
+      case 'vitals_index':
+        this.vitalsIndex = message as unknown as VitalsIndex;
+        this.resyncPending = false;
+        break;
       case 'status_change':
+        this.updateIndexStatus(message);
         this.notifyListeners('status_change', {
           patient_id: message.patient_id,
           status: message.status,
@@ -84,6 +102,33 @@ class WebSocketService {
     }
   }
 
+  // Binary frames are delivered as the same vitals_update data as JSON, and
+  // as typed arrays on 'vitals_frame' for listeners that can use them directly
+  private handleFrame(buffer: ArrayBuffer): void {
+    const index = this.vitalsIndex;
+    if (!index) return;
+    const frame = decodeVitalsFrame(buffer, index.vital_signs.length);
+    if (frame.indexVersion !== index.index_version) {
+      // Rows refer to a patient list we do not have; ask for it again
+      if (!this.resyncPending) {
+        this.resyncPending = true;
+        this.send({ type: 'resync' });
+      }
+      return;
+    }
+    this.notifyListeners('vitals_frame', { frame, index });
+    this.notifyListeners('vitals_update', frameToVitalsUpdate(frame, index));
+  }
+
+  private updateIndexStatus(message: WebSocketMessage): void {
+    const patient = this.vitalsIndex?.patients.find(p => p.patient_id === message.patient_id);
+    if (patient) {
+      patient.status = message.status;
+      patient.reason = message.reason;
+      patient.recommended_action = message.recommended_action;
+    }
+  }
+
   on(event: string, callback: (data: any) => void): void {
     if (!this.listeners.has(event)) {
       this.listeners.set(event, []);
@@ -21,7 +21,7 @@ export interface Vitals {
   respiratory_rate: number;
   oxygen_saturation: number;
   temperature: number;
-  ekg_data?: string;
+  ekg_data?: string; // base64, little-endian int16 samples in mV x 1000
   status: 'normal' | 'watch' | 'critical';
   classification_reason?: string;
   recommended_action?: string;
@@ -38,7 +38,9 @@ export interface PatientVitals {
     respiratory_rate: number;
     oxygen_saturation: number;
     temperature: number;
-    ekg_data?: string;
+    // base64 of little-endian int16 samples in mV x 1000, or the samples
+    // themselves when vitals arrive as binary frames
+    ekg_data?: string | Int16Array;
   };
   status: 'normal' | 'watch' | 'critical';
   reason?: string;
@@ -71,12 +73,37 @@ export interface Dispatch {
 }
 
 export interface WebSocketMessage {
-  type: 'vitals_update' | 'status_change' | 'treatment_decision' | 'dispatch_decision';
+  type: 'vitals_update' | 'vitals_index' | 'status_change' | 'treatment_decision' | 'dispatch_decision';
   timestamp: string;
+  generated_at?: number; // epoch seconds the readings were produced (vitals messages)
   data?: any;
   patient_id?: number;
+  room_id?: string;
+  previous_status?: string;
   status?: string;
   reason?: string;
+  recommended_action?: string;
+}
+
+// Sent before binary vitals frames: the patient order their rows index into
+export interface VitalsIndex {
+  type: 'vitals_index';
+  seq: number;
+  index_version: number;
+  frame_version: number;
+  vital_signs: string[];
+  status_names: string[];
+  ekg_scale: number;
+  ekg_missing: number;
+  ews_missing: number;
+  patients: {
+    patient_id: number;
+    patient_name: string;
+    room_id: string;
+    status?: string;
+    reason?: string;
+    recommended_action?: string;
+  }[];
 }
 
 export interface SystemStatus {
@@ -0,0 +1,88 @@
+"""Classification rules: single vs batch agreement, overrides and rule reloads."""
+import copy
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from services.classification_engine import ClassificationEngine, VITAL_SIGNS
+from services.classification_rules import DEFAULT_RULES_PATH, RuleFileError, validate_rules
+
+def default_rules():
+    with open(DEFAULT_RULES_PATH) as f:
+        return json.load(f)
+
+def write_rules(path, rules):
+    path = Path(path)
+    path.write_text(json.dumps(rules))
+    # Reloads are keyed on mtime, which may not tick between quick writes
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    return str(path)
+
+@pytest.fixture
+def engine(tmp_path):
+    rules = default_rules()
+    rules["patient_overrides"] = {"7": {"warning": {"heart_rate": {"max": 130}},
+                                        "critical": {"heart_rate": {"max": 150}}}}
+    return ClassificationEngine(write_rules(tmp_path / "rules.json", rules))
+
+def test_single_and_batch_agree_with_overrides(engine):
+    rng = np.random.default_rng(3)
+    values = rng.uniform([35, 60, 35, 6, 80, 35], [160, 200, 120, 35, 100, 39.5], size=(300, len(VITAL_SIGNS)))
+    patient_ids = rng.choice([1, 7, None], size=len(values)).tolist()
+    conditions = rng.choice(["COPD, diabetes", "hypertension", None], size=len(values)).tolist()
+
+    batch = engine.classify_batch(values, patient_ids=patient_ids, conditions=conditions)
+    for i, row in enumerate(values):
+        single = engine.classify_vitals(dict(zip(VITAL_SIGNS, row.tolist())), patient_ids[i], conditions[i])
+        assert single == batch.result(i)
+
+def test_overrides_change_the_single_reading_status(engine):
+    vitals = {"heart_rate": 125.0, "systolic_bp": 120.0, "diastolic_bp": 80.0,
+              "respiratory_rate": 16.0, "oxygen_saturation": 89.0, "temperature": 37.0}
+    assert engine.classify_vitals(vitals)[0] == "watch"
+    # heart_rate is only a warning for patient 7, and SpO2 89 is on target with COPD
+    assert engine.classify_vitals(vitals, patient_id=7, conditions="COPD")[0] == "normal"
+
+def test_missing_vitals_are_not_checked(engine):
+    assert engine.classify_vitals({"heart_rate": 72.0, "ekg_data": None})[0] == "normal"
+    assert engine.classify_vitals({"heart_rate": 30.0, "temperature": 41.0})[0] == "critical"
+
+@pytest.mark.parametrize("patch, message", [
+    (lambda r: r["condition_overrides"][0]["warning"].update({"heart_rate": {"min": 120}}), "COPD"),
+    (lambda r: r["patient_overrides"].update({"3": {"critical": {"temperature": {"max": "hot"}}}}), "numbers"),
+    (lambda r: r["condition_overrides"].append({"condition": "CKD", "critical": {"heart_rate": {"max": 35}}}),
+     "CKD"),
+    (lambda r: r["patient_overrides"].update({"x": {}}), "patient id"),
+])
+def test_invalid_profiles_are_rejected(patch, message):
+    rules = default_rules()
+    patch(rules)
+    with pytest.raises(RuleFileError, match=message):
+        validate_rules(rules)
+
+def test_conflict_only_in_a_combination_is_rejected():
+    rules = default_rules()
+    rules["condition_overrides"].append({"condition": "A", "warning": {"heart_rate": {"min": 95}}})
+    rules["condition_overrides"].append({"condition": "B", "warning": {"heart_rate": {"max": 90}}})
+    with pytest.raises(RuleFileError, match="A \\+ B"):
+        validate_rules(rules)
+
+def test_bad_reload_keeps_current_rules(engine):
+    current = engine.rules
+    rules = default_rules()
+    rules["version"] = 2
+    rules["patient_overrides"] = {"7": {"warning": {"heart_rate": {"min": 200}}}}
+    write_rules(engine.rules_path, rules)
+
+    assert engine.reload_rules() is False
+    assert engine.rules is current
+
+    good = copy.deepcopy(rules)
+    good["patient_overrides"] = {}
+    write_rules(engine.rules_path, good)
+    assert engine.reload_rules() is True
+    assert engine.rules.version == 2
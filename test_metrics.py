@@ -0,0 +1,107 @@
+"""/metrics exposition: every family parses and histograms are consistent."""
+import math
+import re
+from collections import defaultdict
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+def parse(body):
+    """{family: {"type", "help", "samples": [(name, labels, value)]}}, failing on malformed lines"""
+    families = {}
+    current = None
+    for line in body.splitlines():
+        if line.startswith("# HELP "):
+            name, documentation = line[7:].split(" ", 1)
+            assert name not in families, f"{name} is declared twice"
+            current = families[name] = {"help": documentation, "type": None, "samples": []}
+        elif line.startswith("# TYPE "):
+            name, metric_type = line[7:].split(" ")
+            assert name in families and families[name]["type"] is None
+            families[name]["type"] = metric_type
+        else:
+            match = SAMPLE.match(line)
+            assert match, f"unparseable line: {line!r}"
+            name, labels, value = match.groups()
+            assert name.startswith(next(reversed(families))), f"{name} outside its family"
+            current["samples"].append((name, dict(LABEL.findall(labels or "")), float(value)))
+    return families
+
+def histogram_series(family, name):
+    """Group a histogram's samples by their labels other than le"""
+    series = defaultdict(lambda: {"buckets": []})
+    for sample, labels, value in family["samples"]:
+        key = tuple(sorted((k, v) for k, v in labels.items() if k != "le"))
+        if sample == f"{name}_bucket":
+            series[key]["buckets"].append((float(labels["le"]), value))
+        else:
+            series[key][sample[len(name) + 1:]] = value
+    return series
+
+def test_metrics_endpoint_parses(run, database):
+    import main
+    from database import AsyncSessionLocal, SessionLocal
+    from services.tick_scheduler import TickScheduler
+
+    async def activity():
+        scheduler = TickScheduler(0.01)
+        for _ in range(3):
+            await scheduler.wait_for_next_tick()
+        async with AsyncSessionLocal() as db:
+            await db.execute(text("SELECT 1"))
+
+    run(activity())
+    with SessionLocal() as db:
+        db.execute(text("SELECT 1"))
+
+    # Without a `with` block the app's lifespan (and simulation) does not start
+    response = TestClient(main.app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    families = parse(response.text)
+
+    for name in ("kpum_tick_lag_seconds", "kpum_db_pool_wait_seconds", "kpum_db_pool_connect_seconds"):
+        assert families[name]["type"] == "histogram"
+    assert families["kpum_db_pool_checkouts"]["type"] == "counter"
+
+    for name, family in families.items():
+        if family["type"] != "histogram":
+            continue
+        for labels, series in histogram_series(family, name).items():
+            bounds = [bound for bound, _ in series["buckets"]]
+            counts = [count for _, count in series["buckets"]]
+            assert bounds == sorted(bounds) and bounds[-1] == math.inf, name
+            assert counts == sorted(counts), f"{name}{labels} buckets are not cumulative"
+            assert series["count"] == counts[-1]
+            assert series["sum"] >= 0
+
+    lag = histogram_series(families["kpum_tick_lag_seconds"], "kpum_tick_lag_seconds")[()]
+    assert lag["count"] >= 3
+    waits = histogram_series(families["kpum_db_pool_wait_seconds"], "kpum_db_pool_wait_seconds")
+    assert waits[(("pool", "sync"),)]["count"] >= 1
+    assert waits[(("pool", "async"),)]["count"] >= 1
+
+def test_pool_wait_excludes_connect_time():
+    import sqlite3
+    import time
+    from services.pool_metrics import InstrumentedQueuePool, PoolMetrics
+
+    def slow_connect():
+        time.sleep(0.2)
+        return sqlite3.connect(":memory:")
+
+    pool = InstrumentedQueuePool(slow_connect, pool_size=1, max_overflow=0)
+    metrics = PoolMetrics("test-connect")
+    pool.metrics = metrics
+    metrics.pool = pool
+    pool.connect().close()
+    pool.connect().close()
+
+    stats = metrics.get_stats()
+    assert stats["max_connect_ms"] >= 200
+    assert stats["max_wait_ms"] < 100
+    assert sum(stats["wait_histogram"].values()) == 2
+    pool.dispose()
@@ -0,0 +1,142 @@
+"""Sharded simulation: merging shard ticks and forwarding what the workers report."""
+import asyncio
+import queue
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from services.classification_engine import ClassificationEngine
+from services.metrics import REGISTRY
+from services.simulation_workers import ShardedSimulationEngine
+
+class RecordingManager:
+    """Stands in for WebSocketManager and records what the merge loop sends"""
+
+    def __init__(self, fail_status=False):
+        self.vitals = []
+        self.statuses = []
+        self.fail_status = fail_status
+
+    async def broadcast_vitals(self, vitals_data, partial=False, generated_at=None):
+        self.vitals.append({"data": vitals_data, "partial": partial, "generated_at": generated_at})
+
+    async def broadcast_patient_status(self, **change):
+        if self.fail_status:
+            raise RuntimeError("client went away")
+        self.statuses.append(change)
+
+@pytest.fixture
+def make_engine():
+    engines = []
+
+    def make(manager, shards=2, tick_interval=3.0):
+        engine = ShardedSimulationEngine(ClassificationEngine(), manager, worker_count=shards)
+        engines.append(engine)
+        # Messages come from the test instead of worker processes
+        engine.out_queue = queue.Queue()
+        engine.workers = [SimpleNamespace(name=f"simulation-worker-{i}", pid=1000 + i, is_alive=lambda: True)
+                          for i in range(shards)]
+        engine.worker_ids = list(range(shards))
+        engine.tick_interval = tick_interval
+        return engine
+
+    yield make
+    for engine in engines:
+        REGISTRY.collectors.remove(engine._worker_metric_families)
+
+def shard_tick(worker_id, patient_ids, tick, stamp):
+    data = {pid: {"patient_id": pid, "status": "normal", "tick": tick} for pid in patient_ids}
+    return ("vitals", worker_id, (data, stamp))
+
+def run_loop(engine, messages, done, timeout=5.0):
+    """Feed `messages` to the merge loop and stop it once done() holds"""
+    async def scenario():
+        for message in messages:
+            engine.out_queue.put(message)
+        engine.is_running = True
+        task = asyncio.create_task(engine._simulation_loop())
+        deadline = time.monotonic() + timeout
+        while not done() and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        engine.is_running = False
+        await task
+
+    asyncio.run(scenario())
+
+def test_shard_ticks_merge_into_one_update(make_engine):
+    manager = RecordingManager()
+    engine = make_engine(manager)
+    run_loop(engine, [shard_tick(0, [1, 3], 1, 100.5), shard_tick(1, [2, 4], 1, 100.0)],
+             done=lambda: manager.vitals)
+
+    (update,) = manager.vitals
+    assert sorted(update["data"]) == [1, 2, 3, 4]
+    assert update["partial"] is False
+    # Staleness is measured from the oldest shard
+    assert update["generated_at"] == 100.0
+
+def test_shard_ahead_flushes_a_partial_merge(make_engine):
+    manager = RecordingManager()
+    engine = make_engine(manager)
+    run_loop(engine, [
+        shard_tick(0, [1, 3], 1, 100.0),
+        shard_tick(0, [1, 3], 2, 103.0),
+        shard_tick(1, [2, 4], 1, 100.0),
+    ], done=lambda: len(manager.vitals) == 2)
+
+    first, second = manager.vitals
+    assert first["partial"] is True
+    assert {entry["tick"] for entry in first["data"].values()} == {1} and sorted(first["data"]) == [1, 3]
+    # Shard 0's second tick is not overwritten; it goes out with shard 1's first
+    assert second["partial"] is False
+    assert {pid: entry["tick"] for pid, entry in second["data"].items()} == {1: 2, 3: 2, 2: 1, 4: 1}
+
+def test_late_shard_does_not_hold_up_the_ward(make_engine):
+    manager = RecordingManager()
+    engine = make_engine(manager, tick_interval=0.05)
+    run_loop(engine, [shard_tick(0, [1, 3], 1, 100.0)], done=lambda: manager.vitals)
+
+    (update,) = manager.vitals
+    assert update["partial"] is True and sorted(update["data"]) == [1, 3]
+
+def test_status_changes_are_forwarded_as_they_arrive(make_engine):
+    manager = RecordingManager()
+    engine = make_engine(manager)
+    change = {"patient_id": 3, "status": "critical", "reason": "Critical Heart Rate detected",
+              "previous_status": "watch", "room_id": "Room-03", "recommended_action": "Immediate attention"}
+    run_loop(engine, [("status", 1, change)], done=lambda: manager.statuses)
+
+    assert manager.statuses == [change]
+    assert manager.vitals == []
+
+def test_a_failed_status_broadcast_does_not_stop_the_merge(make_engine):
+    manager = RecordingManager(fail_status=True)
+    engine = make_engine(manager)
+    run_loop(engine, [
+        ("status", 0, {"patient_id": 1, "status": "watch", "reason": "x"}),
+        shard_tick(0, [1], 1, 100.0),
+        shard_tick(1, [2], 1, 100.0),
+    ], done=lambda: manager.vitals)
+
+    assert sorted(manager.vitals[0]["data"]) == [1, 2]
+
+def test_persisted_rows_and_metrics_are_kept_per_worker(make_engine):
+    manager = RecordingManager()
+    engine = make_engine(manager)
+    now = datetime.now()
+    stats = {"patients": 2, "scheduler": {"ticks": 7}, "vitals_writer": {"rows_written": 14}}
+    run_loop(engine, [
+        ("persisted", 0, [{"patient_id": 1, "timestamp": now, "heart_rate": 70.0}]),
+        ("persisted", 0, [{"patient_id": 1, "timestamp": now - timedelta(seconds=3), "heart_rate": 90.0}]),
+        ("metrics", 1, (REGISTRY.snapshot(), stats)),
+    ], done=lambda: 1 in engine.worker_stats)
+
+    assert engine.latest_vitals[1]["heart_rate"] == 70.0
+    worker = engine.get_worker_stats()[1]
+    assert (worker["name"], worker["alive"], worker["scheduler"]) == ("simulation-worker-1", True, {"ticks": 7})
+    assert engine.get_worker_stats()[0] == {"name": "simulation-worker-0", "pid": 1000, "alive": True}
+    families = engine._worker_metric_families()
+    assert families and all(labels["worker"] == "1"
+                            for _, _, _, samples in families for _, labels, _ in samples)
@@ -0,0 +1,110 @@
+"""Topic subscriptions on /ws: parsing, filtering and malformed requests."""
+import asyncio
+import json
+
+import pytest
+
+from services.websocket_manager import Subscription, WebSocketManager
+from test_websocket_protocols import FakeWebSocket, connect, drain, ward
+
+def test_subscription_parses_ids_rooms_and_ranges():
+    subscription = Subscription.from_message({
+        "type": "subscribe", "patient_ids": [7], "rooms": ["ICU-1", ["Room-08", "Room-10"]],
+        "statuses": ["critical"], "message_types": ["vitals", "status_change"]
+    })
+    assert subscription.patient_ids == {7}
+    assert subscription.rooms == {"ICU-1", "Room-08", "Room-09", "Room-10"}
+    assert subscription.statuses == {"critical"}
+    assert subscription.wants("vitals_update") and not subscription.wants("treatment_decision")
+
+@pytest.mark.parametrize("message", [
+    {"statuses": [{}]},
+    {"statuses": "critical"},
+    {"statuses": ["dying"]},
+    {"rooms": 5},
+    {"rooms": "Room-01"},
+    {"rooms": [["Room-01", "Bed-03"]]},
+    {"rooms": [{"room": "Room-01"}]},
+    {"message_types": [[1]]},
+    {"message_types": ["everything"]},
+    {"patient_ids": [True]},
+    {"patient_ids": "1"},
+])
+def test_malformed_subscriptions_are_rejected(message):
+    with pytest.raises(ValueError):
+        Subscription.from_message({"type": "subscribe", **message})
+
+def test_malformed_subscribe_answers_with_an_error_and_keeps_the_subscription():
+    async def scenario():
+        manager = WebSocketManager(queue_size=16)
+        websocket = await connect(manager, "full")
+        await manager.handle_client_message(websocket, json.dumps({"type": "subscribe", "rooms": ["Room-01"]}))
+        await manager.handle_client_message(websocket, json.dumps({"type": "subscribe", "statuses": [{}]}))
+        await drain()
+        return manager, websocket
+
+    manager, websocket = asyncio.run(scenario())
+    assert len(websocket.of_type("subscribed")) == 1
+    assert "statuses" in websocket.of_type("error")[0]["error"]
+    assert manager.active_connections[websocket].subscription.rooms == {"Room-01"}
+
+def test_updates_follow_each_clients_subscription():
+    async def scenario():
+        manager = WebSocketManager(queue_size=16)
+        await manager.broadcast_vitals(ward(0))
+        clients = {name: await connect(manager, "full") for name in ("rooms", "critical", "status_only", "all")}
+        subscriptions = {
+            "rooms": {"rooms": ["Room-01"], "patient_ids": [3]},
+            "critical": {"statuses": ["critical"]},
+            "status_only": {"message_types": ["status_change"]},
+        }
+        for name, subscription in subscriptions.items():
+            await manager.handle_client_message(clients[name], json.dumps({"type": "subscribe", **subscription}))
+        await manager.broadcast_vitals(ward(1))
+        await manager.broadcast_patient_status(2, "critical", "test", previous_status="watch", room_id="Room-02")
+        await drain()
+        return clients
+
+    clients = asyncio.run(scenario())
+    latest = {name: websocket.of_type("vitals_update") for name, websocket in clients.items()}
+    critical = {str(p) for p, entry in ward(1).items() if entry["status"] == "critical"}
+    assert set(latest["rooms"][-1]["data"]) == {"1", "3"}
+    assert set(latest["critical"][-1]["data"]) == critical
+    assert latest["status_only"] == []
+    assert set(latest["all"][-1]["data"]) == {"1", "2", "3"}
+
+    assert clients["rooms"].of_type("status_change") == []
+    assert len(clients["critical"].of_type("status_change")) == 1
+    assert len(clients["status_only"].of_type("status_change")) == 1
+
+def test_unsubscribe_restores_everything():
+    async def scenario():
+        manager = WebSocketManager(queue_size=16)
+        websocket = await connect(manager, "full")
+        await manager.handle_client_message(websocket, json.dumps({"type": "subscribe", "patient_ids": [2]}))
+        await manager.handle_client_message(websocket, json.dumps({"type": "unsubscribe"}))
+        await manager.broadcast_vitals(ward(0))
+        await drain()
+        return manager, websocket
+
+    manager, websocket = asyncio.run(scenario())
+    assert set(websocket.of_type("vitals_update")[-1]["data"]) == {"1", "2", "3"}
+    assert list(manager.topic_index) == [("all",)]
+
+def test_ws_handler_failure_removes_the_connection(monkeypatch):
+    from fastapi.testclient import TestClient
+    import main
+
+    manager = WebSocketManager(queue_size=16)
+
+    async def broken(websocket, text):
+        raise RuntimeError("unexpected")
+
+    monkeypatch.setattr(manager, "handle_client_message", broken)
+    monkeypatch.setattr(main, "websocket_manager", manager)
+    # Without a `with` block the app's lifespan (and simulation) does not start
+    with TestClient(main.app).websocket_connect("/ws") as websocket:
+        websocket.send_text(json.dumps({"type": "subscribe"}))
+        with pytest.raises(Exception):
+            websocket.receive_text()
+    assert manager.active_connections == {}
@@ -0,0 +1,103 @@
+"""Fixed-rate tick scheduling: overrun policies and lag accounting on a fake clock."""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import services.tick_scheduler as tick_scheduler
+from services.tick_scheduler import TickScheduler
+
+class FakeClock:
+    """Stands in for the scheduler's asyncio: loop time only moves when a test or sleep moves it"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def get_running_loop(self):
+        return self
+
+    def time(self):
+        return self.now
+
+    async def sleep(self, delay):
+        self.sleeps.append(delay)
+        self.now += delay
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(tick_scheduler, "asyncio", clock)
+    return clock
+
+def ticks(scheduler, clock, work):
+    """Serve one tick per entry of `work`, spending that many seconds in each; returns the deadlines"""
+    async def scenario():
+        deadlines = []
+        for seconds in work:
+            deadlines.append(await scheduler.wait_for_next_tick())
+            clock.now += seconds
+        return deadlines
+
+    return asyncio.run(scenario())
+
+def test_deadlines_do_not_drift_with_processing_time(clock):
+    scheduler = TickScheduler(1.0)
+    deadlines = ticks(scheduler, clock, [0.3, 0.9, 0.0, 0.5])
+
+    assert deadlines == [1000.0, 1001.0, 1002.0, 1003.0]
+    assert clock.sleeps == pytest.approx([0.7, 0.1, 1.0])
+    stats = scheduler.get_stats()
+    assert (stats["ticks"], stats["overruns"], stats["skipped_ticks"]) == (4, 0, 0)
+    assert stats["max_lag_ms"] == 0.0
+
+def test_skip_serves_only_the_latest_deadline(clock):
+    scheduler = TickScheduler(1.0, overrun_policy="skip")
+    deadlines = ticks(scheduler, clock, [3.5, 0.0, 0.0])
+
+    # 1001 and 1002 passed entirely during the first tick's work
+    assert deadlines == [1000.0, 1003.0, 1004.0]
+    stats = scheduler.get_stats()
+    assert (stats["overruns"], stats["skipped_ticks"]) == (1, 2)
+    assert stats["max_lag_ms"] == pytest.approx(500.0)
+    assert stats["avg_lag_ms"] == pytest.approx(500.0 / 3, abs=0.01)
+
+def test_catch_up_runs_missed_ticks_back_to_back(clock):
+    scheduler = TickScheduler(1.0, overrun_policy="catch_up")
+    deadlines = ticks(scheduler, clock, [3.5, 0.0, 0.0, 0.0, 0.0])
+
+    assert deadlines == [1000.0, 1001.0, 1002.0, 1003.0, 1004.0]
+    # The missed ticks start at once; only the first on-schedule one sleeps
+    assert clock.sleeps == pytest.approx([0.5])
+    stats = scheduler.get_stats()
+    assert (stats["overruns"], stats["skipped_ticks"]) == (3, 0)
+    assert stats["max_lag_ms"] == pytest.approx(2500.0)
+    assert stats["avg_lag_ms"] == pytest.approx((2500.0 + 1500.0 + 500.0) / 5)
+
+def test_catch_up_skips_past_max_catch_up(clock):
+    scheduler = TickScheduler(1.0, overrun_policy="catch_up", max_catch_up=2)
+    deadlines = ticks(scheduler, clock, [5.5, 0.0])
+
+    assert deadlines == [1000.0, 1005.0]
+    assert scheduler.skipped_ticks == 4
+
+def test_lag_is_observed_in_the_registry_histogram(clock):
+    before = sum(tick_scheduler.TICK_LAG_SECONDS.bucket_counts().values())
+    ticks(TickScheduler(1.0), clock, [2.2, 0.0])
+    assert sum(tick_scheduler.TICK_LAG_SECONDS.bucket_counts().values()) == before + 2
+
+def test_deadline_time_maps_loop_time_to_the_wall_clock(clock):
+    scheduler = TickScheduler(1.0)
+
+    async def scenario():
+        deadline = await scheduler.wait_for_next_tick()
+        clock.now += 2.0
+        return scheduler.deadline_time(deadline)
+
+    tick_time = asyncio.run(scenario())
+    assert abs(tick_time - (datetime.now() - timedelta(seconds=2))) < timedelta(seconds=0.5)
+
+@pytest.mark.parametrize("kwargs", [{"interval": 0}, {"interval": 1.0, "overrun_policy": "burst"}])
+def test_invalid_settings_are_rejected(kwargs):
+    with pytest.raises(ValueError):
+        TickScheduler(**kwargs)
@@ -0,0 +1,86 @@
+"""Trend-aware statuses: hysteresis and the reasons reported for each case."""
+import numpy as np
+import pytest
+
+from services.classification_engine import ClassificationEngine, VITAL_SIGNS
+from services.trend_classifier import EWS_ACTION, TrendClassifier
+
+NORMAL = [72.0, 120.0, 80.0, 16.0, 98.0, 37.0]
+# Heart rate and systolic BP past their critical limits
+CRITICAL = [130.0, 190.0, 80.0, 16.0, 98.0, 37.0]
+# Inside every warning range, but heart rate 100, respiratory rate 22 and SpO2 93 add up to EWS 5
+EWS_HIGH = [100.0, 120.0, 80.0, 22.0, 93.0, 37.0]
+
+@pytest.fixture(scope="module")
+def engine():
+    return ClassificationEngine()
+
+def tick(engine, trend, *rows):
+    values = np.array(rows, dtype=np.float64)
+    batch = engine.classify_batch(values)
+    result = trend.update(values, batch.status_codes)
+    return [result.result(i, batch) for i in range(len(rows))], batch
+
+def test_unchanged_status_uses_the_rule_reason(engine):
+    trend = TrendClassifier(1, 1.0, window=5, escalate_ticks=1, deescalate_ticks=3)
+    (result,), batch = tick(engine, trend, CRITICAL)
+    assert result == batch.result(0)
+    assert result[0] == "critical"
+
+def test_pending_escalation_reason(engine):
+    trend = TrendClassifier(1, 1.0, window=5, escalate_ticks=3, deescalate_ticks=3)
+    (first,), batch = tick(engine, trend, CRITICAL)
+    assert first[0] == "normal"
+    assert first[1] == f"Pending critical: {batch.reason(0)} (1 of 3 readings)"
+    assert first[2] == batch.recommended_action(0)
+
+    (second,), _ = tick(engine, trend, CRITICAL)
+    assert second[1].endswith("(2 of 3 readings)")
+    (third,), _ = tick(engine, trend, CRITICAL)
+    assert third[0] == "critical" and not third[1].startswith("Pending")
+
+def test_holding_reason_while_deescalating(engine):
+    trend = TrendClassifier(1, 1.0, window=5, escalate_ticks=1, deescalate_ticks=3)
+    tick(engine, trend, CRITICAL)
+    (held,), _ = tick(engine, trend, NORMAL)
+    assert held[0] == "critical"
+    assert held[1] == "Holding critical status: readings improved for 1 of 3 checks"
+    tick(engine, trend, NORMAL)
+    (settled,), _ = tick(engine, trend, NORMAL)
+    assert settled[0] == "normal"
+
+def test_early_warning_score_reason(engine):
+    trend = TrendClassifier(1, 1.0, window=5, escalate_ticks=1, deescalate_ticks=3)
+    (result,), batch = tick(engine, trend, EWS_HIGH)
+    assert batch.status(0) == "normal"
+    assert result[0] == "watch"
+    assert result[1].startswith("Early warning score 5")
+    assert result[2] == EWS_ACTION
+
+@pytest.mark.parametrize("setting", ["window", "escalate_ticks", "deescalate_ticks"])
+def test_settings_must_be_positive(setting):
+    with pytest.raises(ValueError, match=setting):
+        TrendClassifier(1, 1.0, **{setting: 0})
+
+def test_sustained_trend_raises_to_watch(engine):
+    trend = TrendClassifier(2, 1.0, window=10, escalate_ticks=1, deescalate_ticks=3)
+    for k in range(10):
+        # Heart rate climbs 5 bpm a reading but every reading stays inside its normal range
+        climbing = [60.0 + 5 * k] + NORMAL[1:]
+        results, batch = tick(engine, trend, climbing, NORMAL)
+        assert batch.status(0) == "normal"
+        assert results[0][0] == ("watch" if k == 9 else "normal")
+
+    assert results[0][1] == "Sustained trend over 10 readings: Heart Rate +45.0"
+    assert results[1][0] == "normal"
+    stats = trend.patient_trend(0)["heart_rate"]
+    assert stats == {"mean": 82.5, "slope_per_min": 300.0}
+
+def test_noisy_but_flat_readings_do_not_trend(engine):
+    rng = np.random.default_rng(5)
+    trend = TrendClassifier(200, 2.0, window=20)
+    for _ in range(60):
+        values = np.array(NORMAL) + rng.uniform(-10, 10, (200, len(VITAL_SIGNS))) * [1, 1, 0, 0.2, 0.1, 0.02]
+        batch = engine.classify_batch(values)
+        result = trend.update(values, batch.status_codes)
+        assert not result.trend_status.any()
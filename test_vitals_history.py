@@ -0,0 +1,69 @@
+"""Keyset-paginated vitals history."""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from services.vitals_history import build_history_query, decode_cursor, stream_vitals_history
+
+START = datetime(2026, 1, 5, 8, 0, 0)
+
+@pytest.fixture
+def history(patients):
+    """Ten readings for the first patient, with pairs sharing a timestamp, and noise for the others"""
+    from database import SessionLocal
+    from models.vitals import Vitals
+
+    with SessionLocal() as db:
+        rows = [
+            Vitals(patient_id=patient_id, timestamp=START + timedelta(seconds=i // 2), heart_rate=60.0 + i,
+                   systolic_bp=120.0, diastolic_bp=80.0, respiratory_rate=16.0, oxygen_saturation=98.0,
+                   temperature=37.0, status="normal")
+            for patient_id in patients for i in range(10)
+        ]
+        db.add_all(rows)
+        db.commit()
+        return patients[0], [(row.timestamp, row.id) for row in rows if row.patient_id == patients[0]]
+
+async def read_pages(patient_id, limit, **options):
+    pages = []
+    cursor = None
+    while True:
+        query = build_history_query(patient_id, ["heart_rate"], cursor=cursor, limit=limit, **options)
+        body = "".join([chunk async for chunk in stream_vitals_history(patient_id, query, limit)])
+        page = json.loads(body)
+        pages.append(page)
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return pages
+
+def keys(pages):
+    return [(datetime.fromisoformat(item["timestamp"]), item["id"]) for page in pages for item in page["items"]]
+
+@pytest.mark.parametrize("order", ["desc", "asc"])
+def test_pages_cover_every_row_once_across_tied_timestamps(run, history, order):
+    patient_id, expected = history
+    pages = run(read_pages(patient_id, limit=3, order=order))
+
+    assert [len(page["items"]) for page in pages] == [3, 3, 3, 1]
+    assert keys(pages) == sorted(expected, reverse=order == "desc")
+    assert all(page["patient_id"] == patient_id for page in pages)
+    assert set(pages[0]["items"][0]) == {"id", "timestamp", "heart_rate"}
+
+def test_exact_final_page_has_no_cursor(run, history):
+    patient_id, _ = history
+    pages = run(read_pages(patient_id, limit=5))
+    assert [len(page["items"]) for page in pages] == [5, 5]
+
+def test_time_range_applies_to_every_page(run, history):
+    patient_id, expected = history
+    since, until = START + timedelta(seconds=1), START + timedelta(seconds=4)
+    pages = run(read_pages(patient_id, limit=2, order="asc", since=since, until=until))
+
+    assert keys(pages) == sorted(key for key in expected if since <= key[0] < until)
+
+def test_malformed_cursor_is_rejected():
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+    with pytest.raises(ValueError):
+        build_history_query(1, ["heart_rate"], cursor="bm9waXBl")
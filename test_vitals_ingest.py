@@ -0,0 +1,170 @@
+"""Gateway ingest: decoding, per-row validation and request limits."""
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from services.classification_engine import VITAL_SIGNS
+from services.vitals_ingest import (
+    FRAME_HEADER, FRAME_MAGIC, FRAME_VERSION, IngestTooLarge, VitalsIngest, frame_record_dtype
+)
+from services.websocket_manager import WebSocketManager
+
+NDJSON = "application/x-ndjson"
+FRAME = "application/vnd.kpum.vitals-frame"
+
+VITALS = {"heart_rate": 72.0, "systolic_bp": 120.0, "diastolic_bp": 80.0,
+          "respiratory_rate": 16.0, "oxygen_saturation": 98.0, "temperature": 37.0}
+
+def ndjson(*readings):
+    return "\n".join(json.dumps({**VITALS, **reading}) for reading in readings).encode()
+
+def frame(patient_ids, timestamps):
+    records = np.zeros(len(patient_ids), dtype=frame_record_dtype(0))
+    records["patient_id"] = patient_ids
+    records["timestamp"] = timestamps
+    records["vitals"] = [VITALS[name] for name in VITAL_SIGNS]
+    return FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, 0, len(records)) + records.tobytes()
+
+def make_ingest():
+    from services.classification_engine import ClassificationEngine
+
+    return VitalsIngest(ClassificationEngine(), WebSocketManager(queue_size=16))
+
+async def post(ingest, body, content_type):
+    await ingest.start()
+    try:
+        return await ingest.ingest(body, content_type)
+    finally:
+        await ingest.stop()
+
+def errors_by_index(result):
+    return {error["index"]: error["error"] for error in result["errors"]}
+
+def test_mixed_aware_and_naive_timestamps(run, patients):
+    ingest = make_ingest()
+    now = datetime.now()
+    body = ndjson(
+        {"patient_id": patients[0], "timestamp": now.isoformat()},
+        {"patient_id": patients[0], "timestamp": datetime.now(timezone.utc).isoformat()},
+        {"patient_id": patients[1], "timestamp": (now - timedelta(minutes=1)).astimezone(timezone.utc)
+                                                  .isoformat().replace("+00:00", "Z")},
+        {"patient_id": patients[1], "timestamp": (now - timedelta(minutes=2)).isoformat()},
+    )
+    flushed = []
+    ingest.vitals_writer.on_flush = flushed.extend
+    result = run(post(ingest, body, NDJSON))
+
+    assert result == {"accepted": 4, "rejected": 0, "errors": []}
+    assert all(row["timestamp"].tzinfo is None for row in flushed)
+    assert abs(flushed[1]["timestamp"] - now) < timedelta(seconds=5)
+
+def test_bad_ids_are_rejected_per_row(run, patients):
+    body = ndjson(
+        {"patient_id": patients[0]},
+        {"patient_id": 2 ** 70},
+        {"patient_id": "not a number"},
+        {"patient_id": 999999},
+        {"patient_id": patients[1]},
+    )
+    result = run(post(make_ingest(), body, NDJSON))
+
+    assert (result["accepted"], result["rejected"]) == (2, 3)
+    errors = errors_by_index(result)
+    assert errors[1] == errors[2] == "malformed reading"
+    assert errors[3] == "unknown patient_id 999999"
+
+def test_bad_timestamps_are_rejected_per_row(run, patients):
+    now = datetime.now()
+    body = ndjson(
+        {"patient_id": patients[0], "timestamp": now.isoformat()},
+        {"patient_id": patients[0], "timestamp": 1e20},
+        {"patient_id": patients[0], "timestamp": "yesterday"},
+        {"patient_id": patients[0], "timestamp": (now - timedelta(days=30)).isoformat()},
+        {"patient_id": patients[0], "timestamp": (now + timedelta(hours=1)).isoformat()},
+    )
+    result = run(post(make_ingest(), body, NDJSON))
+
+    assert (result["accepted"], result["rejected"]) == (1, 4)
+    errors = errors_by_index(result)
+    assert errors[1] == errors[2] == "malformed reading"
+    assert "outside the retained range" in errors[3]
+    assert "outside the retained range" in errors[4]
+
+def test_frame_with_huge_timestamp(run, patients):
+    body = frame([patients[0], patients[1], patients[2]], [0, 1e300, time.time() - 60])
+    result = run(post(make_ingest(), body, FRAME))
+
+    assert (result["accepted"], result["rejected"]) == (2, 1)
+    assert errors_by_index(result) == {1: "malformed reading"}
+
+def test_limits_are_checked_before_decoding(run):
+    ingest = make_ingest()
+    ingest.max_rows = 2
+    ingest.max_bytes = 64
+
+    async def chunks(*parts):
+        for part in parts:
+            yield part
+
+    with pytest.raises(IngestTooLarge):
+        run(ingest.read_body("65", chunks()))
+    with pytest.raises(IngestTooLarge):
+        run(ingest.read_body(None, chunks(b"x" * 40, b"x" * 40)))
+    assert run(ingest.read_body("10", chunks(b"x" * 10))) == b"x" * 10
+
+    with pytest.raises(IngestTooLarge):
+        ingest._decode(ndjson({"patient_id": 1}, {"patient_id": 2}, {"patient_id": 3}), NDJSON)
+    # The header alone is enough to refuse a frame
+    with pytest.raises(IngestTooLarge):
+        ingest._decode(FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, 0, 1000), FRAME)
+
+def test_bad_waveforms_are_rejected_per_row(run, patients):
+    body = ndjson(
+        {"patient_id": patients[0], "ekg_data": [0.1, -0.2, 0.3]},
+        {"patient_id": patients[0], "ekg_data": 5},
+        {"patient_id": patients[0], "ekg_data": [[0.1, 0.2], [0.3, 0.4]]},
+        {"patient_id": patients[0], "ekg_data": [0.1, 1e300]},
+        {"patient_id": patients[0], "ekg_data": [0.1, 40.0]},
+        {"patient_id": patients[0], "ekg_data": "flat"},
+    )
+    flushed = []
+    ingest = make_ingest()
+    ingest.vitals_writer.on_flush = flushed.extend
+    result = run(post(ingest, body, NDJSON))
+
+    assert (result["accepted"], result["rejected"]) == (1, 5)
+    assert set(errors_by_index(result).values()) == {"malformed reading"}
+    assert len(flushed) == 1 and len(flushed[0]["ekg_data"]) == 3 * 2
+
+def test_ids_outside_the_id_column_are_malformed(run, patients):
+    body = frame([patients[0], 2 ** 31, 2 ** 32 - 1], [0, 0, 0])
+    result = run(post(make_ingest(), body, FRAME))
+    assert (result["accepted"], result["rejected"]) == (1, 2)
+    assert errors_by_index(result) == {1: "malformed reading", 2: "malformed reading"}
+
+    result = run(post(make_ingest(), ndjson({"patient_id": 2 ** 31}, {"patient_id": -4}), NDJSON))
+    assert errors_by_index(result) == {0: "malformed reading", 1: "malformed reading"}
+
+def test_patient_lookup_is_chunked(run, patients, monkeypatch):
+    import services.vitals_ingest as vitals_ingest
+
+    monkeypatch.setattr(vitals_ingest, "PATIENT_LOOKUP_CHUNK", 2)
+    unknown = list(range(100000, 100005))
+    found = run(make_ingest()._load_patients(unknown[:2] + list(patients) + unknown[2:]))
+    assert sorted(found) == sorted(patients)
+
+def test_latest_vitals_keeps_the_newest_reading():
+    from services.classification_engine import ClassificationEngine
+    from services.simulation_engine import SimulationEngine
+
+    engine = SimulationEngine(ClassificationEngine(), WebSocketManager(queue_size=16))
+    now = datetime.now()
+    engine.update_latest_vitals([
+        {"patient_id": 1, "timestamp": now, "heart_rate": 70.0},
+        {"patient_id": 1, "timestamp": now - timedelta(minutes=5), "heart_rate": 90.0},
+    ])
+    engine.update_latest_vitals([{"patient_id": 1, "timestamp": now - timedelta(hours=1), "heart_rate": 110.0}])
+    assert engine.latest_vitals[1]["heart_rate"] == 70.0
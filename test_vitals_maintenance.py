@@ -0,0 +1,138 @@
+"""Partition maintenance and rollup windows, against a connection that records its SQL."""
+from contextlib import contextmanager
+from datetime import date, datetime
+from types import SimpleNamespace
+
+import pytest
+
+import services.vitals_maintenance as vitals_maintenance
+from services.vitals_maintenance import VitalsMaintenance
+
+NOW = datetime(2026, 3, 10, 14, 25, 30)
+
+class FrozenDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return NOW
+
+class FrozenDate(date):
+    @classmethod
+    def today(cls):
+        return NOW.date()
+
+class RecordingEngine:
+    """Stands in for the PostgreSQL engine: records statements, answers max(bucket) and partition lookups"""
+
+    def __init__(self):
+        self.dialect = SimpleNamespace(name="postgresql")
+        self.statements = []
+        self.last_buckets = {"vitals_rollup_1m": None, "vitals_rollup_1h": None}
+        self.partitions = []
+        self.fail_inserts = False
+
+    @contextmanager
+    def begin(self):
+        yield self
+
+    def execute(self, clause, params=None):
+        sql = str(clause)
+        self.statements.append((sql, params))
+        if sql.startswith("INSERT") and self.fail_inserts:
+            raise RuntimeError("connection lost")
+        if sql.startswith("SELECT max(bucket) FROM "):
+            return SimpleNamespace(scalar=lambda: self.last_buckets[sql.rsplit(" ", 1)[1]])
+        return SimpleNamespace(scalars=lambda: iter(self.partitions))
+
+    def windows(self, target):
+        return [(params["start"], params["end"]) for sql, params in self.statements
+                if sql.startswith(f"INSERT INTO {target} ")]
+
+@pytest.fixture
+def engine(monkeypatch):
+    engine = RecordingEngine()
+    monkeypatch.setattr(vitals_maintenance, "engine", engine)
+    monkeypatch.setattr(vitals_maintenance, "datetime", FrozenDatetime)
+    monkeypatch.setattr(vitals_maintenance, "date", FrozenDate)
+    return engine
+
+@pytest.fixture
+def maintenance(engine, monkeypatch):
+    for name, value in {"VITALS_RETENTION_DAYS": "7", "VITALS_PARTITION_DAYS_AHEAD": "3",
+                        "VITALS_ROLLUP_LOOKBACK_MINUTES": "10"}.items():
+        monkeypatch.setenv(name, value)
+    return VitalsMaintenance()
+
+def test_partitions_cover_retention_through_days_ahead(engine, maintenance):
+    maintenance.ensure_partitions()
+
+    names = [sql.split()[5] for sql, _ in engine.statements]
+    assert names[0] == "vitals_p20260303" and names[-1] == "vitals_p20260313"
+    assert len(names) == 7 + 1 + 3
+    assert "FOR VALUES FROM ('2026-03-10') TO ('2026-03-11')" in engine.statements[7][0]
+
+def test_retention_drops_expired_partitions_and_rollups(engine, maintenance):
+    engine.partitions = ["vitals_p20260301", "vitals_p20260303", "vitals_p20260310", "vitals_default"]
+    maintenance.apply_retention()
+
+    dropped = [sql for sql, _ in engine.statements if sql.startswith("DROP")]
+    assert dropped == ["DROP TABLE IF EXISTS vitals_p20260301"]
+    deletes = {sql.split()[2]: params["cutoff"] for sql, params in engine.statements if sql.startswith("DELETE")}
+    assert deletes == {"vitals_rollup_1m": datetime(2025, 12, 10), "vitals_rollup_1h": datetime(2024, 3, 10)}
+
+def test_first_rollup_backfills_the_retention_window(engine, maintenance):
+    maintenance.rollup_minutes()
+    assert engine.windows("vitals_rollup_1m") == [(datetime(2026, 3, 3, 14, 25), datetime(2026, 3, 10, 14, 25))]
+
+def test_rollup_recomputes_the_trailing_lookback(engine, maintenance):
+    engine.last_buckets["vitals_rollup_1m"] = datetime(2026, 3, 10, 14, 24)
+    engine.last_buckets["vitals_rollup_1h"] = datetime(2026, 3, 10, 13, 0)
+    maintenance.run_once()
+
+    # Buckets that completed or got late rows in the last ten minutes are redone
+    assert engine.windows("vitals_rollup_1m") == [(datetime(2026, 3, 10, 14, 15), datetime(2026, 3, 10, 14, 25))]
+    assert engine.windows("vitals_rollup_1h") == [(datetime(2026, 3, 10, 13, 0), datetime(2026, 3, 10, 14, 0))]
+
+def test_rollup_resumes_from_the_last_bucket_after_downtime(engine, maintenance):
+    engine.last_buckets["vitals_rollup_1m"] = datetime(2026, 3, 10, 9, 41)
+    maintenance.rollup_minutes()
+    assert engine.windows("vitals_rollup_1m") == [(datetime(2026, 3, 10, 9, 41), datetime(2026, 3, 10, 14, 25))]
+
+def test_backfilled_rows_are_rolled_up_with_their_hours(engine, maintenance):
+    engine.last_buckets["vitals_rollup_1m"] = datetime(2026, 3, 10, 14, 24)
+    engine.last_buckets["vitals_rollup_1h"] = datetime(2026, 3, 10, 13, 0)
+    maintenance.mark_dirty([
+        {"patient_id": 1, "timestamp": datetime(2026, 3, 8, 6, 30, 12)},
+        {"patient_id": 2, "timestamp": datetime(2026, 3, 8, 7, 2, 45)},
+    ])
+    # Its minute ends where the trailing window starts, so the two merge
+    maintenance.mark_dirty([{"patient_id": 1, "timestamp": datetime(2026, 3, 10, 14, 14, 5)}])
+    maintenance.run_once()
+
+    assert engine.windows("vitals_rollup_1m") == [
+        (datetime(2026, 3, 8, 6, 30), datetime(2026, 3, 8, 7, 3)),
+        (datetime(2026, 3, 10, 14, 14), datetime(2026, 3, 10, 14, 25)),
+    ]
+    assert engine.windows("vitals_rollup_1h") == [
+        (datetime(2026, 3, 8, 6, 0), datetime(2026, 3, 8, 8, 0)),
+        (datetime(2026, 3, 10, 13, 0), datetime(2026, 3, 10, 14, 0)),
+    ]
+    assert maintenance.dirty == {"vitals_rollup_1m": [], "vitals_rollup_1h": []}
+
+def test_dirty_ranges_survive_a_failed_rollup(engine, maintenance):
+    engine.last_buckets["vitals_rollup_1m"] = datetime(2026, 3, 10, 14, 24)
+    backfill = [{"patient_id": 1, "timestamp": datetime(2026, 3, 8, 6, 30)}]
+    maintenance.mark_dirty(backfill)
+    engine.fail_inserts = True
+    with pytest.raises(RuntimeError):
+        maintenance.rollup_minutes()
+    assert maintenance.dirty["vitals_rollup_1m"] == [(datetime(2026, 3, 8, 6, 30), datetime(2026, 3, 8, 6, 30))]
+
+    engine.fail_inserts = False
+    engine.statements.clear()
+    maintenance.rollup_minutes()
+    assert engine.windows("vitals_rollup_1m")[0] == (datetime(2026, 3, 8, 6, 30), datetime(2026, 3, 8, 6, 31))
+
+def test_mark_dirty_is_a_no_op_without_postgresql(engine, maintenance):
+    maintenance.enabled = False
+    maintenance.mark_dirty([{"patient_id": 1, "timestamp": NOW}])
+    assert maintenance.dirty["vitals_rollup_1m"] == []
@@ -0,0 +1,83 @@
+"""VitalsWriter batching, flushing and failure isolation."""
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+def vitals_row(patient_id, offset=0, status="normal"):
+    return {
+        "patient_id": patient_id,
+        "timestamp": datetime.now() - timedelta(seconds=offset),
+        "heart_rate": 72.0,
+        "systolic_bp": 120.0,
+        "diastolic_bp": 80.0,
+        "respiratory_rate": 16.0,
+        "oxygen_saturation": 98.0,
+        "temperature": 37.0,
+        "ekg_data": None,
+        "status": status,
+        "classification_reason": None,
+        "recommended_action": None
+    }
+
+def stored_count(engine):
+    from models.vitals import Vitals
+
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(Vitals)).scalar()
+
+async def write(writer, *ticks):
+    await writer.start()
+    for rows in ticks:
+        await writer.submit(rows)
+    await writer.stop()
+
+def test_flush_writes_rows_and_reports_ids(run, database, patients):
+    from services.vitals_writer import VitalsWriter
+
+    flushed = []
+    writer = VitalsWriter(max_batch_ticks=5, on_flush=flushed.extend)
+    ticks = [[vitals_row(p, offset=tick) for p in patients] for tick in range(3)]
+    run(write(writer, *ticks))
+
+    assert stored_count(database) == 9
+    assert len(flushed) == 9
+    assert all(isinstance(row["id"], int) for row in flushed)
+    stats = writer.get_stats()
+    assert stats["rows_written"] == 9
+    assert stats["failed_rows"] == 0
+    assert stats["queue_depth"] == 0
+
+def test_bad_row_does_not_drop_the_batch(run, database, patients):
+    from services.vitals_writer import VitalsWriter
+
+    flushed = []
+    writer = VitalsWriter(max_batch_ticks=1, on_flush=flushed.extend)
+    rows = [vitals_row(p, offset=i) for i, p in enumerate(patients * 3)]
+    rows[4]["status"] = None  # violates NOT NULL
+    run(write(writer, rows))
+
+    assert stored_count(database) == len(rows) - 1
+    assert len(flushed) == len(rows) - 1
+    assert rows[4] not in flushed
+    stats = writer.get_stats()
+    assert stats["failed_rows"] == 1
+    assert stats["split_flushes"] > 0
+    assert stats["rows_written"] == len(rows) - 1
+
+def test_connection_errors_are_not_split(run, database, patients, monkeypatch):
+    from sqlalchemy.exc import OperationalError
+    from services.vitals_writer import VitalsWriter
+
+    calls = []
+
+    async def failing_flush(rows):
+        calls.append(len(rows))
+        raise OperationalError("INSERT", {}, ConnectionError("server closed the connection"))
+
+    writer = VitalsWriter(max_batch_ticks=1)
+    monkeypatch.setattr(writer, "_flush", failing_flush)
+    run(write(writer, [vitals_row(p) for p in patients]))
+
+    assert calls == [3]
+    assert writer.get_stats()["failed_rows"] == 3
+    assert writer.get_stats()["split_flushes"] == 0
@@ -0,0 +1,186 @@
+"""WebSocket vitals protocols: full updates, snapshot + delta, and binary frames."""
+import asyncio
+import base64
+import json
+
+import numpy as np
+import pytest
+
+from services import websocket_manager as ws_module
+from services.classification_engine import VITAL_SIGNS
+from services.ekg_codec import decode_waveform
+from services.vitals_frames import EKG_MISSING, EWS_MISSING, STATUS_CODES, WardFrame, unpack_frame
+from services.websocket_manager import WebSocketManager
+
+class FakeWebSocket:
+    """Records what the manager sends"""
+
+    def __init__(self):
+        self.messages = []
+
+    async def send_text(self, text):
+        self.messages.append(json.loads(text))
+
+    async def send_bytes(self, data):
+        self.messages.append(data)
+
+    def of_type(self, message_type):
+        return [m for m in self.messages if isinstance(m, dict) and m.get("type") == message_type]
+
+def ward(tick, patient_ids=(1, 2, 3), ekg_samples=8):
+    rng = np.random.default_rng(tick)
+    return {
+        patient_id: {
+            "patient_id": patient_id,
+            "patient_name": f"Patient {patient_id}",
+            "room_id": f"Room-0{patient_id}",
+            "vitals": {
+                **{name: float(value) for name, value in zip(VITAL_SIGNS, rng.uniform([60, 110, 70, 12, 90, 36.5],
+                                                                                       [110, 150, 95, 24, 100, 38.5]))},
+                "ekg_data": rng.uniform(-1, 1, ekg_samples).astype(np.float32) if ekg_samples else None
+            },
+            "status": ("normal", "watch", "critical")[(patient_id + tick) % 3],
+            "reason": f"reason {tick}",
+            "recommended_action": None,
+            "ews_score": (patient_id + tick) % 5
+        }
+        for patient_id in patient_ids
+    }
+
+async def connect(manager, protocol):
+    websocket = FakeWebSocket()
+    await manager.add_connection(websocket, protocol=protocol)
+    return websocket
+
+async def drain():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+def apply_delta(state, delta):
+    for patient_id, change in delta["changes"].items():
+        if patient_id not in state:
+            state[patient_id] = change
+            continue
+        entry = state[patient_id]
+        entry.update({key: value for key, value in change.items() if key != "vitals"})
+        entry["vitals"].update(change.get("vitals", {}))
+    for patient_id in delta["removed"]:
+        state.pop(str(patient_id), None)
+
+def rounded(data):
+    return {
+        patient_id: {
+            **entry,
+            "vitals": {name: round(value, 1) if isinstance(value, float) else value
+                       for name, value in entry["vitals"].items()}
+        }
+        for patient_id, entry in data.items()
+    }
+
+def test_delta_stream_reproduces_full_updates():
+    async def scenario():
+        manager = WebSocketManager(queue_size=64)
+        await manager.broadcast_vitals(ward(0))
+        full = await connect(manager, "full")
+        delta = await connect(manager, "delta")
+        await manager.broadcast_vitals(ward(1))
+        # An ingest batch for one patient, then a tick in which patient 3 is discharged
+        await manager.broadcast_vitals({2: ward(2)[2]}, partial=True)
+        await manager.broadcast_vitals(ward(3, patient_ids=(1, 2)))
+        await drain()
+        return full, delta
+
+    full, delta = asyncio.run(scenario())
+    snapshots = delta.of_type("vitals_snapshot")
+    deltas = delta.of_type("vitals_delta")
+    assert len(snapshots) == 1 and len(deltas) == 3
+
+    state = snapshots[0]["data"]
+    seq = snapshots[0]["seq"]
+    for message in deltas:
+        assert message["base_seq"] == seq
+        apply_delta(state, message)
+        seq = message["seq"]
+
+    assert state == rounded(full.of_type("vitals_update")[-1]["data"])
+    assert set(state) == {"1", "2"}
+    assert decode_waveform(base64.b64decode(state["1"]["vitals"]["ekg_data"])).shape == (8,)
+
+def test_no_clients_skips_work_and_snapshot_catches_up(monkeypatch):
+    encoded = []
+    encode = ws_module.waveform_to_base64
+    monkeypatch.setattr(ws_module, "waveform_to_base64", lambda waveform: encoded.append(1) or encode(waveform))
+
+    async def scenario():
+        manager = WebSocketManager(queue_size=64)
+        await manager.broadcast_vitals(ward(0))
+        await manager.broadcast_vitals(ward(1))
+        assert encoded == [] and manager.vitals_state == {} and manager.patient_rooms == {}
+
+        binary = await connect(manager, "binary")
+        transitions = await connect(manager, "transitions")
+        await manager.broadcast_vitals(ward(2))
+        assert encoded == []
+
+        delta = await connect(manager, "delta")
+        await drain()
+        return manager, binary, transitions, delta
+
+    manager, binary, transitions, delta = asyncio.run(scenario())
+    assert manager.room_patients["Room-01"] == {1}
+    assert [p["patient_id"] for p in binary.of_type("vitals_index")[0]["patients"]] == [1, 2, 3]
+    # Sent on connect, before the third tick
+    assert transitions.of_type("status_snapshot")[0]["data"]["3"]["status"] == ward(1)[3]["status"]
+    snapshot = delta.of_type("vitals_snapshot")[0]
+    assert snapshot["seq"] == 3
+    assert snapshot["data"] == rounded(json.loads(json.dumps({
+        str(p): {**e, "vitals": {**e["vitals"], "ekg_data": encode(e["vitals"]["ekg_data"])}}
+        for p, e in ward(2).items()
+    })))
+
+def test_binary_frame_round_trip():
+    data = ward(5, patient_ids=(4, 7, 9, 12))
+    data[7]["vitals"]["ekg_data"] = data[7]["vitals"]["ekg_data"][:5]
+    data[9]["vitals"]["ekg_data"] = None
+    data[12]["ews_score"] = None
+    data[12]["vitals"]["temperature"] = None
+    index_rows = {9: 0, 4: 1, 12: 2, 7: 3, 99: 4}
+
+    frame = WardFrame(data, index_rows)
+    body = frame.pack(seq=11, index_version=2, index_size=5, generated_at=1234.5)
+    decoded = unpack_frame(body)
+
+    assert len(body) % 4 == 0
+    assert (decoded["seq"], decoded["index_version"], decoded["generated_at"]) == (11, 2, 1234.5)
+    assert decoded["rows"].tolist() == [0, 1, 2, 3]
+    order = [9, 4, 12, 7]
+    for i, patient_id in enumerate(order):
+        entry = data[patient_id]
+        expected = [np.nan if entry["vitals"][name] is None else entry["vitals"][name] for name in VITAL_SIGNS]
+        np.testing.assert_allclose(decoded["vitals"][i], np.float32(expected), rtol=1e-6)
+        assert decoded["status"][i] == STATUS_CODES[entry["status"]]
+        expected_ews = EWS_MISSING if entry["ews_score"] is None else entry["ews_score"]
+        assert decoded["ews"][i] == expected_ews
+
+    ekg = decoded["ekg"]
+    assert ekg.shape == (4, 8)
+    assert (ekg[0] == EKG_MISSING).all()
+    assert (ekg[3, 5:] == EKG_MISSING).all()
+    np.testing.assert_allclose(ekg[1] / 1000.0, data[4]["vitals"]["ekg_data"], atol=1e-3)
+    np.testing.assert_allclose(ekg[3, :5] / 1000.0, data[7]["vitals"]["ekg_data"], atol=1e-3)
+
+def test_binary_subset_frame_round_trip():
+    data = ward(6, ekg_samples=0)
+    frame = WardFrame(data, {1: 0, 2: 1, 3: 2})
+
+    whole = unpack_frame(frame.pack(1, 1, 3, 10.0))
+    assert whole["ekg"] is None
+    assert whole["rows"].tolist() == [0, 1, 2]
+
+    subset = unpack_frame(frame.pack(1, 1, 3, 10.0, frame.positions({3, 1})))
+    assert subset["rows"].tolist() == [0, 2]
+    np.testing.assert_array_equal(subset["vitals"], whole["vitals"][[0, 2]])
+
+def test_bad_frame_is_rejected():
+    with pytest.raises(ValueError):
+        unpack_frame(b"NOPE" + bytes(24))